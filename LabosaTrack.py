@@ -1,38 +1,79 @@
 import orbit_prediction as op
-import pandas as pd
+import serial_transfer as st
+import metrics as mt
+import pass_cache as pc
+import pass_data as pdt
 import numpy as np
-pd.options.mode.chained_assignment = None  # default='warn'
-from tqdm import tqdm
-import time, math
 
-def SatTrack(my_lat,my_lon,sat_name,time_delta,elevation_start):
-    '''Brief: calculates satellite pass and returns two elements: a dataframe containing
-    time points and steps and a list of start values
+#points merged by ScheduleSteps span at most this time: the steps of a merged point run up to
+#1 s late, the same timing as sampling the orbit every second (the UI time_delta). Merging costs
+#about 0.3 ms per 1000 points
+MERGE_WINDOW_MS = 1000
+
+def SatTrack(my_lat,my_lon,sat_name,time_delta,elevation_start,sat=None):
+    '''Brief: calculates the next satellite pass
+    Parameters:
+        -my_lat: observer's latitude
+        -my_lon: observer's longitude
+        -sat_name: satellite name
+        -time_delta: time between points
+        -elevation_start: elevation angle to start calculating orbit
+        -sat: satellite object, if the caller already has it (looked up from sat_name otherwise)
+    Returns:
+        -orbit: pass_data.PassData containing orbit information (returned by op.CalculateNextOrbit)
+    '''
+    if sat is None:
+        sat=op.SelectSatFromName(sat_name)  #get satellite object
+    #get orbit, computed again only if the TLE or a parameter changed or the pass already started
+    orbit=pc.Cached(pc.PassKey(sat, my_lat, my_lon, time_delta, elevation_start),
+                    lambda: op.CalculateNextOrbit(sat, my_lat, my_lon, time_delta,24,elevation_start),
+                    nbytes=lambda orbit: orbit.nbytes,
+                    expires=lambda orbit: orbit.start)
+    
+    return orbit
+
+def TrackPass(my_lat,my_lon,sat_name,time_delta,elevation_start,az_resolution,elev_resolution,sat=None):
+    '''Brief: calculates the next satellite pass ready to be sent, results are cached
+    (see pass_cache.py) so sending the same pass again doesn't compute it again
     Parameters:
         -my_lat: observer's latitude
         -my_lon: observer's longitude
         -sat_name: satellite name
         -time_delta: time between points
         -elevation_start: elevation angle to start calculating orbit
+        -az_resolution: azimutal angle [°] per step
+        -elev_resolution: elevation angle [°] per step
+        -sat: satellite object, if the caller already has it (looked up from sat_name otherwise)
     Returns:
-        -orbit_df: dataframe containing orbit information (returned by op.CalculateNextOrbit)
+        -orbit: pass returned by SatTrack
+        -steps, start_data: values returned by Orbit2steps, after ScheduleSteps
+        -points: packed points returned by CompressOrbitData
     '''
-    sat=op.SelectSatFromName(sat_name)  #get satellite object
-    orbit_df=op.CalculateNextOrbit(sat, my_lat, my_lon, time_delta,24,elevation_start)   #get orbit dataframe
+    def Compute():
+        orbit = SatTrack(my_lat,my_lon,sat_name,time_delta,elevation_start,sat)
+        steps, start_data = Orbit2steps(orbit,az_resolution,elev_resolution)
+        steps, start_data, _ = ScheduleSteps(steps,start_data)    #every point fits in its 4 bit fields
+        return orbit, steps, start_data, CompressOrbitData(steps)
     
-    return orbit_df
+    if sat is None:
+        sat = op.SelectSatFromName(sat_name)
+    return pc.Cached(pc.PassKey(sat, my_lat, my_lon, time_delta, elevation_start, az_resolution, elev_resolution),
+                     Compute,
+                     nbytes=lambda result: result[0].nbytes+result[1].nbytes+result[3].nbytes,   #the orbit stays cached with the result
+                     expires=lambda result: result[2][0])
 
-def Orbit2steps(orbit_df, az_resolution, elev_resolution):
+def Orbit2steps(orbit, az_resolution, elev_resolution):
     '''Brief: Calculate steps to make in each point by differenciating both angles.
     Parameters:
-        -orbit_df: orbit containing time points, azimuth and elevation columns
+        -orbit: pass_data.PassData returned by PredictOrbit (time points, azimuth and elevation columns)
         -az_resolution: azimutal angle [°] per step
         -elev_resolution: elevation angle [°] per step
     Returns:
-        -steps_df: dataframe containing three columns:
-            -Time: time point in milliseconds
+        -steps: pass_data.PassData of kind "steps" containing four columns:
+            -Time: time point in milliseconds since orbit_start
             -Elev Steps: amount of elevation steps to make in that point
             -Az Steps: amount of azimuth steps to make in that point
+            -Index: orbit point of each step point
         -start_data: list containing the following values:
             -orbit_start: time point where orbit starts in seconds
             -points_amount: amount of points
@@ -41,186 +82,243 @@ def Orbit2steps(orbit_df, az_resolution, elev_resolution):
             -start_az_steps: steps needed to orient system to starting elevation angle
             -elev_dir_change: time point where elevation changes direction in milliseconds
     '''
-    #create orbit_df copy
-    steps_df = orbit_df.copy()
+    with mt.Stage("Orbit2steps",points=len(orbit)) as record:
+        #get start point time in seconds (not taking milliseconds into account),
+        #orbit times are already milliseconds since the start second of the pass
+        times_ms = orbit['Time']
+        orbit_start = orbit.start+int(times_ms[0])//1000
+        if orbit_start != orbit.start:    #orbit is a view that doesn't begin in its start second
+            times_ms = times_ms-(orbit_start-orbit.start)*1000
     
-    #get start point time in seconds (not taking milliseconds into account)
-    orbit_start = math.trunc(steps_df['Time'].iloc[0])
-    steps_df['Time'] -= orbit_start
+        elevation = orbit['Elevation']
+        azimuth = orbit['Azimuth']
     
-    #Convert times to milliseconds (integer)
-    steps_df["Time"] = (steps_df["Time"]*1000).astype(int)
+        #get azimuth and elevation start angle
+        azimuth_start = azimuth[0]
+        elevation_start = elevation[0]
     
-    #get azimuth and elevation start angle
-    azimuth_start = steps_df['Azimuth'].iloc[0]
-    elevation_start = steps_df['Elevation'].iloc[0]
+        #convert azimuth start angle from (0,360) to (-180,180)
+        if azimuth_start > 180:
+            azimuth_start -= 360
+        if azimuth_start <- 180:
+            azimuth_start += 360
     
-    #convert azimuth start angle from (0,360) to (-180,180)
-    if azimuth_start > 180:
-        azimuth_start -= 360
-    if azimuth_start <- 180:
-        azimuth_start += 360
+        #convert azimuth and elevation start angle to steps
+        start_az_steps = int(azimuth_start / az_resolution)
+        start_elev_steps = int(elevation_start / elev_resolution)
     
-    #convert azimuth and elevation start angle to steps
-    start_az_steps = int(azimuth_start / az_resolution)
-    start_elev_steps = int(elevation_start / elev_resolution)
-
-        
-    #Calculate azimuth and elevation derivative
-    steps_df['dElev'] = (steps_df['Elevation'] - steps_df['Elevation'].shift(1)).fillna(0)
-    steps_df['dAz'] = (steps_df['Azimuth'] - steps_df['Azimuth'].shift(1)).fillna(0)
+        #Calculate azimuth and elevation derivative, first point has no derivative
+        dElev = np.diff(elevation, prepend=elevation[0])
+        dAz = np.diff(azimuth, prepend=azimuth[0])
     
-    #get azimuth direction
-    az_dir = int(np.sign(steps_df['dAz'].iloc[1]))
+        #If azimuth angle changes from 0 to 359 or vice versa, a correction is made to the azimuth delta
+        dAz[dAz > 300] -= 360
+        dAz[dAz < -300] += 360
     
-    #Initialize steps columns
-    steps_df['Elev Steps'] = 0
-    steps_df['Az Steps'] = 0
-    steps_df.index.name = "Index"  #set index name (irrelevant)
+        #get azimuth direction
+        az_dir = int(np.sign(dAz[1]))
     
-    dir_setted = False    #a boolean is used to know if the direction change in elevation has happened
+        #quantize the acumulated angle: the steps made up to each point are the
+        #amount of whole resolutions contained in the acumulated angle
+        az_steps = np.diff(np.floor(np.cumsum(np.abs(dAz)) / az_resolution), prepend=0).astype(int)
+        elev_steps = np.diff(np.floor(np.cumsum(np.abs(dElev)) / elev_resolution), prepend=0).astype(int)
     
-    az_angle, elev_angle = 0, 0 #initialize counters
+        #the first point where elevation derivative becomes negative indicates a
+        #direction change, save its time. If elevation never decreases the direction
+        #change is placed at the last point
+        descending = dElev < 0
+        if descending.any():
+            elev_dir_change = int(times_ms[np.argmax(descending)])
+        else:
+            elev_dir_change = int(times_ms[-1])
     
-    print("Calculating steps:")
-    #iterate over each orbit point
-    for ind in tqdm(steps_df.index):
-        
-        #If azimuth angle changes from 0 to 359 or vice versa, a correction is made to the azimuth delta
-        if abs(steps_df['dAz'][ind]) > 300:
-            if(steps_df['dAz'][ind]) > 0:
-                steps_df['dAz'][ind] -= 360
-            if(steps_df['dAz'][ind]) < 0:
-                steps_df['dAz'][ind] += 360
-           
-        #evaluate if azimuth acumulated angle is greater than the angle per step
-        # if it is, add a step to the step column and substract the angle per step
-        #repeat until az_angle is smaller than the angle per step
-        az_angle += abs(steps_df['dAz'][ind]) 
-        while az_angle >= az_resolution:
-            az_angle=az_angle-az_resolution
-            steps_df['Az Steps'][ind] += 1
-    
-        elev_angle += abs(steps_df['dElev'][ind])
-        while elev_angle >= elev_resolution:
-            elev_angle = elev_angle-elev_resolution
-            steps_df['Elev Steps'][ind] += 1
-       
-        #evaluate if elevation derivative became negative, indicating a
-        #direction change. If the point is the direction change, save its time
-        if steps_df['dElev'][ind] < 0 and dir_setted == False:
-            elev_dir_change = int(steps_df['Time'][ind])
-            dir_setted = True
-        
         #remove rows without steps
-        if steps_df['Az Steps'][ind] == 0 and steps_df['Elev Steps'][ind] == 0:
-            steps_df.drop([ind],axis=0,inplace=True)
+        has_steps = (az_steps != 0) | (elev_steps != 0)
+        steps = pdt.PassData("steps", {'Time': times_ms[has_steps],
+                                       'Elev Steps': elev_steps[has_steps],
+                                       'Az Steps': az_steps[has_steps],
+                                       'Index': np.flatnonzero(has_steps)},
+                             orbit_start, orbit.sat_name, orbit.latitude, orbit.longitude)
     
-    #Create list of start values
-    points_amount = len(steps_df["Time"])
-    start_data = (orbit_start, points_amount, az_dir, start_az_steps, start_elev_steps, elev_dir_change)
-         
-    #remove irrelevant columns
-    steps_df.drop(steps_df.columns.difference(['Time','Elev Steps','Az Steps']), axis=1, inplace=True)
+        #Create list of start values
+        points_amount = len(steps)
+        start_data = (orbit_start, points_amount, az_dir, start_az_steps, start_elev_steps, elev_dir_change)
+        record["step_points"] = points_amount
     
-    return steps_df, start_data
+    return steps, start_data
     
 
-def CompressOrbitData(steps_df):
-    '''Brief: compresses all information of a point in 32 bits
+def SplitSteps(times, az_steps, elev_steps, elev_dir_change, max_steps=15, previous_time=0):
+    '''Brief: split step of ScheduleSteps: points with more than max_steps steps in an axis
+    are split in evenly spaced points between the previous point and their own time. It can
+    be run on consecutive chunks of points (see streaming.ScheduleChunks) giving the last
+    time of the previous chunk as previous_time
     Parameters:
-        -steps_df: dataframe containing orbit times and steps
+        -times: array of point times in milliseconds
+        -az_steps, elev_steps: int64 arrays of steps of each point
+        -elev_dir_change: time where elevation changes direction in milliseconds (None if unknown yet)
+        -max_steps: maximum steps per point and axis
+        -previous_time: time of the point before times[0] in milliseconds
     Returns:
-        -points_df: dataframe containing a single column with times and steps
+        -times, az_steps, elev_steps: points within max_steps (the same arrays if nothing is split)
+        -row: input point of each output point
+        -elev_dir_change: moved to the first part of the first descending point if it was split
+        -split: boolean array, True for the input points that were split
     '''
-    points_df = []    #create empty list
-    
-    print("Compressing steps:")
-    for ind in tqdm(steps_df.index):    #iterate dataframe
-        value = int(steps_df["Time"][ind] << 8 | steps_df["Az Steps"][ind] << 4 | steps_df["Elev Steps"][ind]) #create a single int with bit displacement, bits 3-0: Elev steps, bits 7-4: Az steps, bits 31-8: time
-        points_df.append(value)   #add value to list
-    return points_df
+    parts = np.maximum(-(-np.maximum(az_steps,elev_steps)//max_steps),1)
+    split = parts > 1
+    if not split.any():
+        return times, az_steps, elev_steps, np.arange(len(times)), elev_dir_change, split
+    previous = np.concatenate(([previous_time],times[:-1]))
+    if (times-previous < parts)[split].any():
+        raise ValueError("steps can't be split: interval shorter than one millisecond per point")
+    row = np.repeat(np.arange(len(times)),parts)
+    part = np.arange(len(row))-np.repeat(np.cumsum(parts)-parts,parts)
+    k = parts[row]
+    sub_times = previous[row]+((part+1)*(times[row]-previous[row])+k-1)//k  #last part keeps the point time
+    #steps spread evenly over the parts, so the commanded angle follows the interval
+    sub_az = (part+1)*az_steps[row]//k-part*az_steps[row]//k
+    sub_elev = (part+1)*elev_steps[row]//k-part*elev_steps[row]//k
+    #the first descending point can be split before the elevation direction change,
+    #which then moves to its first part
+    if elev_dir_change is not None:
+        first_descending = np.searchsorted(times,elev_dir_change)
+        if (first_descending < len(times) and split[first_descending]
+                and (first_descending > 0 or previous_time < elev_dir_change)):
+            elev_dir_change = min(elev_dir_change,int(sub_times[np.searchsorted(row,first_descending)]))
+    return sub_times, sub_az, sub_elev, row, elev_dir_change, split
 
+def MergeSteps(times, az_steps, elev_steps, elev_dir_change, max_steps=15, merge_window_ms=MERGE_WINDOW_MS):
+    '''Brief: merge step of ScheduleSteps: consecutive points spanning at most merge_window_ms
+    whose steps fit together are merged in the last one, never across the elevation direction
+    change. Groups are built greedily from the first point, so running it again from the start
+    of the last group with more points gives the same groups (see streaming.ScheduleChunks)
+    Parameters:
+        -times: array of point times in milliseconds
+        -az_steps, elev_steps: int64 arrays of steps of each point, within max_steps
+        -elev_dir_change: time where elevation changes direction in milliseconds (None if unknown yet)
+        -max_steps: maximum steps per point and axis
+        -merge_window_ms: maximum time span of merged points in milliseconds, 0 doesn't merge
+    Returns:
+        -keep: boolean array, True for the last point of every group
+        -az_steps, elev_steps: steps of every group at its last point
+        -last_group: index of the first point of the last group
+    '''
+    keep = np.ones(len(times),bool)
+    if merge_window_ms <= 0 or len(times) == 0:
+        return keep, az_steps, elev_steps, max(len(times)-1,0)
+    if elev_dir_change is None:
+        elev_dir_change = np.inf
+    #plain lists, indexing numpy scalars one by one is several times slower
+    time_list, az_list, elev_list = times.tolist(), az_steps.tolist(), elev_steps.tolist()
+    ends = []
+    group, group_az, group_elev = 0, 0, 0
+    for i in range(1,len(time_list)):
+        group_az += az_list[i-1]
+        group_elev += elev_list[i-1]
+        if (time_list[i]-time_list[group] > merge_window_ms
+                or group_az+az_list[i] > max_steps or group_elev+elev_list[i] > max_steps
+                or (time_list[i-1] < elev_dir_change) != (time_list[i] < elev_dir_change)):
+            ends.append(i-1)
+            group, group_az, group_elev = i, 0, 0
+    ends.append(len(time_list)-1)
+    keep[:] = False
+    keep[ends] = True
+    #steps of every group, summed at its last point
+    starts = np.concatenate(([0],np.array(ends[:-1],dtype=np.int64)+1))
+    az_steps, elev_steps = az_steps.copy(), elev_steps.copy()
+    az_steps[ends] = np.add.reduceat(az_steps,starts)
+    elev_steps[ends] = np.add.reduceat(elev_steps,starts)
+    return keep, az_steps, elev_steps, group
 
-def SerialSend(serial_device,points,start_data):
-    '''Brief: Rutine that sends all data through serial port
+def ScheduleSteps(steps, start_data, max_steps=15, merge_window_ms=MERGE_WINDOW_MS):
+    '''Brief: plans the steps against the step capacity of each point, so that every point
+    can be packed by CompressOrbitData. Points with more than max_steps steps in an axis are
+    split in evenly spaced points between the previous point and their own time, then
+    consecutive points spanning at most merge_window_ms whose steps fit together are merged
+    in the last one (MergeSteps)
     Parameters:
-        -serial_device: serial object
-        -points: list containing data to be sent
-        -start_data: list contaning values returned by Orbit2Steps
+        -steps: pass returned by Orbit2steps
+        -start_data: list returned by Orbit2steps
+        -max_steps: maximum steps per point and axis (4 bit fields: 15)
+        -merge_window_ms: maximum time span of merged points in milliseconds, 0 doesn't merge
+    Returns:
+        -steps: pass with the same columns, every point within max_steps
+        -start_data: start_data with the new amount of points (the elevation direction
+        change moves earlier if the first descending point was split)
+        -report: dictionary with points_before, points_after, split (points split),
+        merged (points removed by merging) and change (points_after-points_before)
     '''
-    def TxSerial(Txdata):
-        serial_device.write(Txdata.to_bytes(4,"big"))
+    with mt.Stage("ScheduleSteps",points=len(steps)) as record:
+        times = steps["Time"]
+        az_steps = steps["Az Steps"].astype(np.int64)
+        elev_steps = steps["Elev Steps"].astype(np.int64)
+        elev_dir_change = start_data[5]
+        index = steps["Index"] if "Index" in steps else np.arange(len(steps))
+        
+        #split overflowing points, the steps are spread over the interval since the previous point
+        times, az_steps, elev_steps, row, elev_dir_change, split = SplitSteps(times,az_steps,elev_steps,elev_dir_change,max_steps)
+        index = index[row]
+        points_split = len(times)
         
-    def TxSerial_atoi(Txdata,dataSize):
-        Tx=str(Txdata).encode()
-        Tx+=bytes(dataSize-len(Tx))
-        serial_device.write(Tx)
+        #merge quiet points into the next one, never across the elevation direction change
+        keep, az_steps, elev_steps, _ = MergeSteps(times,az_steps,elev_steps,elev_dir_change,max_steps,merge_window_ms)
+        times, az_steps, elev_steps, index = times[keep], az_steps[keep], elev_steps[keep], index[keep]
         
-    print("Starting serial transfer:")
-    
-    n, cont = 0, 0
-    serial_device.write(b'\x01')
-    while True:
-        while serial_device.read(1) != b'\x01':
-            True
-        if n==0:
-            # current time
-            print("Sending data:")
-            now=time.time()
-            while(time.time() < math.trunc(now)+1):
-                True
-            t=math.trunc(time.time())
-            TxSerial(t)
-            print("current time:",t, op.GetDatetimeFromUNIX(t))
-            
-        elif n==1:
-            #Send alarm time
-            t=start_data[0]
-            TxSerial(t)
-            print("alarm time:",t, op.GetDatetimeFromUNIX(t))
-            
-        elif n==2:
-            #Send amount of points, elevation start angle, elevation direction change and mechanical resolution
-            print("amount of points: ",start_data[1])
-            print("elevation start angle: ",start_data[4])
-            print("elevation direction change: ",start_data[5])
+        columns = {'Time': times, 'Elev Steps': elev_steps, 'Az Steps': az_steps}
+        if "Index" in steps:
+            columns['Index'] = index
+        scheduled = steps.WithColumns(columns)
+        start_data = (start_data[0], len(scheduled), start_data[2], start_data[3], start_data[4], elev_dir_change)
+        report = {"points_before": len(steps), "points_after": len(scheduled),
+                  "split": int(split.sum()), "merged": points_split-len(scheduled),
+                  "change": len(scheduled)-len(steps)}
+        record.update(report)
+    return scheduled, start_data, report
 
-            TxSerial(start_data[1]) #amount of points
-            TxSerial(start_data[4]) #elevation start angle
-            TxSerial(start_data[5]) #elevation direction change
-            
-        elif n==3:
-            #Send azimuth direction and start angle
-            print("azimut direction ",start_data[2])
-            print("azimuth start angle: ",start_data[3])
+def PackPoints(times,az_steps,elev_steps):
+    '''Brief: packs point times and steps in 32 bits each
+    Parameters:
+        -times: array of point times in milliseconds
+        -az_steps: array of azimuth steps of each point
+        -elev_steps: array of elevation steps of each point
+    Returns:
+        -points: contiguous big-endian uint32 array with one packed point per
+        element (bits 31-8: time, bits 7-4: Az steps, bits 3-0: Elev steps),
+        its bytes are the exact stream sent to the microcontroller
+    '''
+    times = np.asarray(times,dtype=np.int64)
+    az_steps = np.asarray(az_steps,dtype=np.int64)
+    elev_steps = np.asarray(elev_steps,dtype=np.int64)
+    
+    #validate every field at once, values out of range would corrupt neighbouring fields
+    if ((times < 0) | (times >= 1 << 24)).any():
+        raise ValueError("point time doesn't fit in 24 bits (0 to 16777215 ms)")
+    if ((az_steps < 0) | (az_steps > 15)).any() or ((elev_steps < 0) | (elev_steps > 15)).any():
+        raise ValueError("point steps don't fit in 4 bits (0 to 15 steps)")
+    
+    #create a single int with bit displacement, bits 3-0: Elev steps, bits 7-4: Az steps, bits 31-8: time
+    return (times << 8 | az_steps << 4 | elev_steps).astype(">u4")
 
-            
-            TxSerial_atoi(start_data[2],4)  #azimuth direction
-            TxSerial_atoi(start_data[3],7)  #azimuth start angle
-            #this values are sent separately because of their possible negative sign, as they are send as chars
-           
-        elif n==4:
-            #send points
-            for i in points:
-                cont+=1
-                if(cont!=0 and cont % 1000 == 0):
-                    print("points send:", cont, "/",start_data[1])
-                    while serial_device.read(1) != b'\x01':
-                        True
-                        
-                TxSerial(i)
-                i+=1
-            print("points send:", start_data[1], "/",start_data[1])
-            break
+def CompressOrbitData(steps):
+    '''Brief: compresses all information of a point in 32 bits
+    Parameters:
+        -steps: pass containing orbit times and steps (returned by ScheduleSteps)
+    Returns:
+        -points: packed points, see PackPoints
+    '''
+    with mt.Stage("CompressOrbitData",points=len(steps)):
+        points = PackPoints(steps["Time"],steps["Az Steps"],steps["Elev Steps"])
+    return points
 
-        #increment state variable
-        n+=1
-    Rx = serial_device.read(1)
-    if(Rx == b'\x01'):
-        print("Data stored in EEPROM succesfully")
-    elif(Rx ==b'\x02'):
-        print("Data could not be stored in EEPROM, maybe EEPROM is disconnected or corrupted?")
-    else:
-        print("unknown sequence reached, debug needed")
-            
\ No newline at end of file
+
+def SerialSend(serial_device,points,start_data):
+    '''Brief: Rutine that sends all data through serial port
+    Parameters:
+        -serial_device: serial object
+        -points: packed points returned by CompressOrbitData
+        -start_data: list contaning values returned by Orbit2Steps
+    Returns:
+        -stats: transfer statistics returned by serial_transfer.SendPass
+    '''
+    return st.SendPass(serial_device,points,start_data)
@@ -23,6 +23,7 @@ if(mode==0 or mode== 2):
     #### 0 Calculate ISS pass 
     orbit = lst.SatTrack(my_lat, my_lon, sat_name, time_delta, elevation_start)
     steps,start_data = lst.Orbit2steps(orbit, az_resolution, elev_resolution)
+    steps,start_data,_ = lst.ScheduleSteps(steps, start_data)
     compressed_steps = lst.CompressOrbitData(steps)
     
 
@@ -33,8 +34,9 @@ if(mode==1):
     TLEs = op.DownloadTLEs()
     sat = op.NextSatPass(TLEs,my_lat,my_lon,10, 70)
     print(sat.name)
-    orbit = lst.SatTrack(my_lat, my_lon, sat.name, time_delta, elevation_start)
+    orbit = lst.SatTrack(my_lat, my_lon, sat.name, time_delta, elevation_start, sat)
     steps,start_data = lst.Orbit2steps(orbit, az_resolution, elev_resolution)
+    steps,start_data,_ = lst.ScheduleSteps(steps, start_data)
     compressed_steps = lst.CompressOrbitData(steps)
     
     lst.SerialSend(serial_device,compressed_steps,start_data)
\ No newline at end of file
@@ -0,0 +1,124 @@
+'''Benchmark of the predict -> steps -> compress -> send pipeline.
+
+Uses the frozen TLE catalog in fixtures/ and a fixed reference time, so it needs
+no network and no serial hardware. Every stage is timed for several pass lengths
+and time resolutions, and compared against baseline.json.
+
+Usage:
+    python benchmarks/bench_pipeline.py            compare against the baseline
+    python benchmarks/bench_pipeline.py --record   save the results as the new baseline
+    python benchmarks/bench_pipeline.py --threshold 0.5
+
+The baseline is machine dependent, record it again on the machine that runs the benchmark.
+'''
+import os, sys, json, time, argparse
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),".."))
+from skyfield.api import load
+import orbit_prediction as op
+import LabosaTrack as lst
+import serial_transfer as st
+
+FIXTURE_CATALOG = os.path.join(os.path.dirname(os.path.abspath(__file__)),"fixtures","catalog.txt")
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),"baseline.json")
+REFERENCE_TIME = (2014,1,22,0,0,0)  #UTC, the fixture TLE epochs are 2014-01-20
+SAT_NAME = "ISS (ZARYA)"
+MY_LAT, MY_LON = -34.54, -58.5
+PASS_LENGTHS = [120, 400]           #seconds
+TIME_DELTAS = [1, 0.1, 0.01]        #seconds
+RESOLUTION = 0.05                   #degrees per step
+REPEAT = 5                          #each stage keeps the best of REPEAT runs
+THRESHOLD = 0.25                    #allowed slowdown against the baseline (0.25 = 25%)
+MIN_SLACK = 0.005                   #seconds, slowdowns below this are timer noise
+
+
+class LoopbackController:
+    '''Serial stand-in that acknowledges everything and stores what is written'''
+    def __init__(self):
+        self.received = bytearray()
+    def write(self,data):
+        self.received += bytes(data)
+        return len(data)
+    def read(self,size=1):
+        return st.ACK*size
+
+def Best(function,repeat=REPEAT):
+    '''Brief: runs function repeat times and returns its last result and the best wall time'''
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best,time.perf_counter()-start)
+    return result, best
+
+def RunBenchmarks():
+    '''Brief: times every stage of the pipeline
+    Returns:
+        -dictionary with benchmark names and times in seconds
+    '''
+    ts = load.timescale()
+    TLEs = {sat.name: sat for sat in load.tle_file(FIXTURE_CATALOG)}
+    sat = TLEs[SAT_NAME]
+    t_ref = ts.utc(*REFERENCE_TIME)
+    results = {}
+
+    _, results["NextSatPass catalog=%d" % len(TLEs)] = Best(
+        lambda: op.NextSatPass(TLEs,MY_LAT,MY_LON,0,30,search_minutes=30,t_now=t_ref),1)
+    _, results["CalculateNextOrbit time_delta=1"] = Best(
+        lambda: op.CalculateNextOrbit(sat,MY_LAT,MY_LON,1,24,10,t0=t_ref))
+
+    t_rise, _ = op.NextPassBounds(sat,MY_LAT,MY_LON,24,10,t_ref)
+    for length in PASS_LENGTHS:
+        for time_delta in TIME_DELTAS:
+            case = "pass=%ds time_delta=%gs" % (length,time_delta)
+            for backend in ("vectorized","ephemeris"):
+                orbit, results["PredictOrbit[%s] %s" % (backend,case)] = Best(
+                    lambda: op.PredictOrbit(sat,MY_LAT,MY_LON,t_rise,length,time_delta,backend=backend))
+            (steps, start_data), results["Orbit2steps "+case] = Best(
+                lambda: lst.Orbit2steps(orbit,RESOLUTION,RESOLUTION))
+            (steps, start_data, _), results["ScheduleSteps "+case] = Best(
+                lambda: lst.ScheduleSteps(steps,start_data))
+            points, results["CompressOrbitData "+case] = Best(lambda: lst.CompressOrbitData(steps))
+            stats = st.SendPass(LoopbackController(),points,start_data,verbose=False)
+            results["SerialSend points "+case] = stats["points_seconds"]
+    return results
+
+def Compare(results,baseline,threshold):
+    '''Brief: prints the results next to the baseline
+    Returns:
+        -list of benchmark names slower than baseline*(1+threshold)+MIN_SLACK
+    '''
+    regressions = []
+    for name, seconds in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            print("%-60s %10.4f s   (no baseline)" % (name,seconds))
+            continue
+        ratio = seconds/reference if reference > 0 else float("inf")
+        flag = ""
+        if seconds > reference*(1+threshold)+MIN_SLACK:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print("%-60s %10.4f s   x%.2f%s" % (name,seconds,ratio,flag))
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Labosat-Track pipeline benchmark")
+    parser.add_argument("--record",action="store_true",help="save results as the new baseline")
+    parser.add_argument("--threshold",type=float,default=THRESHOLD,help="allowed slowdown, 0.25 = 25%%")
+    args = parser.parse_args()
+
+    results = RunBenchmarks()
+    if args.record:
+        with open(BASELINE_FILE,"w") as f:
+            json.dump(results,f,indent=2)
+        print("baseline saved to",BASELINE_FILE)
+        sys.exit(0)
+
+    baseline = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as f:
+            baseline = json.load(f)
+    regressions = Compare(results,baseline,args.threshold)
+    if regressions:
+        print(len(regressions),"stage(s) regressed more than",str(int(args.threshold*100))+"%")
+        sys.exit(1)
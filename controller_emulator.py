@@ -0,0 +1,233 @@
+'''Emulator of the microcontroller side of the upload protocol.
+
+It answers like the firmware: an acknowledge after the start byte and after every
+header field, one before the 1000th point and every 1000 points after that, and the
+EEPROM status byte once every point is received. Received points are decoded and the
+commanded azimuth/elevation trajectory is rebuilt, so uploads can be checked end to
+end without hardware.
+
+Usage:
+    device = EmulatedSerial()                   in-process serial stand-in
+    stats = st.SendPass(device,points,start_data)
+    trajectory = Trajectory(device.emulator.received,az_resolution,elev_resolution)
+    errors = PointingError(trajectory,orbit)
+
+    port, emulator = AttachPty()                emulator thread behind a pseudo terminal
+    stats = st.SendPass(serial.Serial(port,115200,timeout=1),points,start_data)
+'''
+import os, time, threading
+import numpy as np
+import pandas as pd
+import serial
+import serial_transfer as st
+
+HEADER_SIZES = [4, 4, 12, 11]   #current time, alarm time, (points, elev start, elev dir change), (az dir, az start)
+
+
+class ControllerEmulator:
+    '''Firmware state machine, fed with the bytes received from the host'''
+    def __init__(self,eeprom_points=None,ack_delay=0):
+        '''Parameters:
+            -eeprom_points: amount of points the EEPROM can store, bigger passes are
+            answered with EEPROM_ERROR. None for no limit
+            -ack_delay: seconds waited before every acknowledge (EEPROM write time),
+            only used when the emulator runs in its own thread
+        '''
+        self.eeprom_points = eeprom_points
+        self.ack_delay = ack_delay
+        self.output = bytearray()   #bytes to send to the host
+        self.buffer = bytearray()   #bytes received and not processed yet
+        self.state = "start"
+        self.header = []
+        self.points = bytearray()
+        self.received = None
+        self.time_error = None
+
+    def Reply(self,data):
+        self.output += data
+
+    def Feed(self,data):
+        '''Brief: processes bytes sent by the host'''
+        self.buffer += data
+        while True:
+            if self.state == "start":
+                if not self.buffer:
+                    return
+                if self.buffer.pop(0) == st.ACK[0]:
+                    self.state = "header"
+                    self.Reply(st.ACK)
+            elif self.state == "header":
+                size = HEADER_SIZES[len(self.header)]
+                if len(self.buffer) < size:
+                    return
+                field = bytes(self.buffer[:size])
+                del self.buffer[:size]
+                if not self.header:
+                    self.time_error = time.time()-int.from_bytes(field,"big")  #arrival delay after the second boundary
+                self.header.append(field)
+                if len(self.header) == len(HEADER_SIZES):
+                    self.state = "points"
+                    if self.PointsAmount() == 0:
+                        self.Finish()
+                self.Reply(st.ACK)
+            elif self.state == "points":
+                amount = self.PointsAmount()
+                take = min(len(self.buffer)//4*4,4*amount-len(self.points))
+                if take == 0:
+                    return
+                before = len(self.points)//4
+                self.points += self.buffer[:take]
+                del self.buffer[:take]
+                after = len(self.points)//4
+                if after == amount:
+                    self.Finish()
+                    return
+                #acknowledge before the 1000th point and every 1000 points after that
+                if (after+1)//st.BLOCK_POINTS > (before+1)//st.BLOCK_POINTS:
+                    self.Reply(st.ACK)
+            else:
+                return
+
+    def PointsAmount(self):
+        return int.from_bytes(self.header[2][0:4],"big")
+
+    def Finish(self):
+        '''Brief: decodes the transfer and answers the EEPROM status'''
+        self.state = "done"
+        self.received = DecodeTransfer(self.header,bytes(self.points))
+        full = self.eeprom_points is not None and self.PointsAmount() > self.eeprom_points
+        self.Reply(st.EEPROM_ERROR if full else st.EEPROM_OK)
+
+    def TakeOutput(self,size=None):
+        '''Brief: removes and returns up to size bytes of the answers'''
+        size = len(self.output) if size is None else size
+        data = bytes(self.output[:size])
+        del self.output[:size]
+        return data
+
+
+class EmulatedSerial:
+    '''In-process serial stand-in, the emulator answers as soon as bytes are written'''
+    def __init__(self,emulator=None):
+        self.emulator = ControllerEmulator() if emulator is None else emulator
+    def write(self,data):
+        self.emulator.Feed(bytes(data))
+        return len(data)
+    def read(self,size=1):
+        return self.emulator.TakeOutput(size)
+
+
+def _PtyLoop(fd,emulator):
+    '''Brief: emulator thread, reads the pty until the transfer is done'''
+    while emulator.state != "done":
+        try:
+            data = os.read(fd,4096)
+        except OSError:
+            return
+        emulator.Feed(data)
+        if emulator.output:
+            if emulator.ack_delay:
+                time.sleep(emulator.ack_delay)
+            os.write(fd,emulator.TakeOutput())
+
+def AttachPty(emulator=None):
+    '''Brief: runs an emulator behind a pseudo terminal (POSIX only)
+    Parameters:
+        -emulator: ControllerEmulator, a new one by default
+    Returns:
+        -port: device name to open with serial.Serial
+        -emulator: the emulator, its received attribute is filled when the transfer ends
+    '''
+    import pty, tty
+    emulator = ControllerEmulator() if emulator is None else emulator
+    controller_fd, host_fd = pty.openpty()
+    tty.setraw(controller_fd)
+    tty.setraw(host_fd)
+    threading.Thread(target=_PtyLoop,args=(controller_fd,emulator),daemon=True).start()
+    return os.ttyname(host_fd), emulator
+
+def DecodeTransfer(header,points):
+    '''Brief: decodes the header fields and packed points received by the controller
+    Parameters:
+        -header: list with the 4 header fields (bytes)
+        -points: bytes of the packed points
+    Returns:
+        -dictionary with start_data (tuple like Orbit2steps returns), the current time
+        sent, and Time, Az Steps and Elev Steps arrays of the points
+    '''
+    packed = np.frombuffer(points,dtype=">u4").astype(np.int64)
+    ascii_field = lambda field: int(field.rstrip(b"\x00"))
+    start_data = (int.from_bytes(header[1],"big"),
+                  int.from_bytes(header[2][0:4],"big"),
+                  ascii_field(header[3][0:4]),
+                  ascii_field(header[3][4:11]),
+                  int.from_bytes(header[2][4:8],"big"),
+                  int.from_bytes(header[2][8:12],"big"))
+    return {"current_time": int.from_bytes(header[0],"big"), "start_data": start_data,
+            "Time": packed >> 8, "Az Steps": packed >> 4 & 0xF, "Elev Steps": packed & 0xF}
+
+def Trajectory(received,az_resolution,elev_resolution):
+    '''Brief: rebuilds the commanded trajectory from the received points, moving the
+    steppers like the firmware: azimuth always in az_dir, elevation up until the
+    elevation direction change and down after it
+    Parameters:
+        -received: dictionary returned by DecodeTransfer
+        -az_resolution: azimutal angle [°] per step
+        -elev_resolution: elevation angle [°] per step
+    Returns:
+        -dataframe with Time (UNIX seconds), Azimuth and Elevation commanded at every point
+    '''
+    orbit_start, _, az_dir, start_az_steps, start_elev_steps, elev_dir_change = received["start_data"]
+    elev_dir = np.where(received["Time"] >= elev_dir_change,-1,1)
+    az_position = start_az_steps+az_dir*np.cumsum(received["Az Steps"])
+    elev_position = start_elev_steps+np.cumsum(elev_dir*received["Elev Steps"])
+    return pd.DataFrame({"Time": orbit_start+received["Time"]/1000,
+                         "Azimuth": (az_position*az_resolution)%360,
+                         "Elevation": elev_position*elev_resolution})
+
+def PointingError(trajectory,orbit):
+    '''Brief: compares the commanded trajectory against the predicted orbit
+    Parameters:
+        -trajectory: dataframe returned by Trajectory
+        -orbit: pass returned by PredictOrbit (the truth)
+    Returns:
+        -dictionary with the maximum and RMS azimuth and elevation errors in degrees
+    '''
+    times = orbit.Times()
+    truth_az = np.degrees(np.unwrap(np.radians(orbit["Azimuth"])))
+    az = np.interp(trajectory["Time"],times,truth_az)
+    elev = np.interp(trajectory["Time"],times,orbit["Elevation"])
+    az_error = (trajectory["Azimuth"].to_numpy()-az+180)%360-180
+    elev_error = trajectory["Elevation"].to_numpy()-elev
+    rms = lambda error: float(np.sqrt(np.mean(error**2))) if len(error) else 0.0
+    return {"az_max": float(abs(az_error).max()) if len(az_error) else 0.0, "az_rms": rms(az_error),
+            "elev_max": float(abs(elev_error).max()) if len(elev_error) else 0.0, "elev_rms": rms(elev_error)}
+
+def EmulatedUpload(points,start_data,orbit,az_resolution,elev_resolution,use_pty=False,ack_delay=0,eeprom_points=None):
+    '''Brief: uploads a pass to an emulated controller and measures it end to end
+    Parameters:
+        -points: packed points returned by CompressOrbitData
+        -start_data: start values returned by Orbit2steps
+        -orbit: pass returned by PredictOrbit, used as truth
+        -az_resolution: azimutal angle [°] per step
+        -elev_resolution: elevation angle [°] per step
+        -use_pty: go through a pseudo terminal and pyserial instead of the in-process stand-in
+        -ack_delay: seconds the emulator waits before every acknowledge (pty only)
+        -eeprom_points: points the emulated EEPROM can store, None for no limit
+    Returns:
+        -dictionary with the SendPass stats, the time_error of the current time field,
+        whether the controller got the same start_data, and the PointingError values
+    '''
+    emulator = ControllerEmulator(eeprom_points,ack_delay)
+    if use_pty:
+        port, _ = AttachPty(emulator)
+        device = serial.Serial(port,115200,timeout=st.ACK_TIMEOUT)
+    else:
+        device = EmulatedSerial(emulator)
+    stats = st.SendPass(device,points,start_data,verbose=False)
+    if use_pty:
+        device.close()
+    report = dict(stats,time_error=emulator.time_error,
+                  start_data_ok=emulator.received["start_data"] == tuple(int(value) for value in start_data))
+    report.update(PointingError(Trajectory(emulator.received,az_resolution,elev_resolution),orbit))
+    return report
@@ -0,0 +1,211 @@
+from skyfield.api import wgs84
+from skyfield.framelib import itrs
+from skyfield.sgp4lib import theta_GMST1982
+import numpy as np
+import math
+
+NODE_STEP = 60              #spacing between SGP4 nodes in seconds
+WGS84_A = 6378.137          #WGS84 equatorial radius in km
+WGS84_F = 1/298.257223563   #WGS84 flattening
+
+#Error bound: the satellite Earth fixed position is interpolated with cubic Hermite
+#segments using SGP4 positions and velocities at the nodes. The interpolation error
+#is largest at the middle of each segment, so it is measured there against direct
+#propagation when the ephemeris is built (error_km). For a LEO satellite with 60 s
+#nodes it is below 1 meter, which is an angular error below 0.0001 degrees at the
+#shortest observer distances of a pass (~400 km).
+
+
+def HermiteEval(x,y,dy,xq):
+    '''Brief: evaluates the cubic Hermite interpolant of y(x) with derivatives dy at xq
+    Parameters:
+        -x: node abscissas (sorted)
+        -y: node values
+        -dy: node derivatives
+        -xq: points to evaluate
+    Returns:
+        -interpolated values at xq
+    '''
+    i = np.clip(np.searchsorted(x,xq,side="right")-1,0,len(x)-2)
+    h = x[i+1]-x[i]
+    u = (xq-x[i])/h
+    u2, u3 = u*u, u*u*u
+    return ((2*u3-3*u2+1)*y[i]+(u3-2*u2+u)*h*dy[i]
+            +(-2*u3+3*u2)*y[i+1]+(u3-u2)*h*dy[i+1])
+
+def BuildEphemeris(sat,t0,period_seconds,node_step=NODE_STEP):
+    '''Brief: runs SGP4 at coarse nodes across a pass and measures the interpolation
+    error at the middle of every segment
+    Parameters:
+        -sat: satellite object
+        -t0: skyfield.timelib.Time object of the pass start
+        -period_seconds: pass duration in seconds
+        -node_step: spacing between nodes in seconds
+    Returns:
+        -ephemeris: dictionary with the following keys:
+            -t0: pass start
+            -offsets: node offsets from t0 in seconds
+            -position: Earth fixed (ITRS) positions in km, shape (3, nodes)
+            -velocity: Earth fixed (ITRS) velocities in km/s, shape (3, nodes)
+            -error_km: maximum position error against direct propagation
+            -sgp4_evaluations: amount of SGP4 evaluations used
+    '''
+    offsets = np.append(np.arange(0,period_seconds,node_step),period_seconds)
+    if len(offsets) > 2 and offsets[-1]-offsets[-2] < 1e-6:
+        offsets = offsets[:-1]  #period is a multiple of node_step
+    mids = (offsets[:-1]+offsets[1:])/2
+    t = t0.ts.tt_jd(t0.whole,t0.tt_fraction+np.concatenate((offsets,mids))/86400.0)
+    position, velocity = sat.at(t).frame_xyz_and_velocity(itrs)
+    position, velocity = position.km, velocity.km_per_s
+
+    ephemeris = {"t0": t0, "offsets": offsets,
+                 "position": position[:,:len(offsets)], "velocity": velocity[:,:len(offsets)],
+                 "sgp4_evaluations": len(offsets)+len(mids)}
+    error = EphemerisPosition(ephemeris,mids)-position[:,len(offsets):]
+    ephemeris["error_km"] = float(np.sqrt((error**2).sum(axis=0)).max()) if len(mids) else 0.0
+    return ephemeris
+
+def EphemerisPosition(ephemeris,offsets):
+    '''Brief: interpolates the Earth fixed position at any offsets
+    Parameters:
+        -ephemeris: dictionary returned by BuildEphemeris
+        -offsets: array of offsets from the ephemeris t0 in seconds
+    Returns:
+        -position in km, shape (3, offsets)
+    '''
+    nodes, position, velocity = ephemeris["offsets"], ephemeris["position"], ephemeris["velocity"]
+    return np.array([HermiteEval(nodes,position[k],velocity[k],offsets) for k in range(3)])
+
+def GeodeticFromITRS(position):
+    '''Brief: converts Earth fixed positions to WGS84 latitude, longitude and height
+    Parameters:
+        -position: positions in km, shape (3, points)
+    Returns:
+        -lat, lon: degrees
+        -hei: height in km
+    '''
+    x, y, z = position
+    e2 = WGS84_F*(2-WGS84_F)
+    p = np.hypot(x,y)
+    lat = np.arctan2(z,p*(1-e2))
+    for _ in range(4):  #fixed point iteration, converges to sub-millimeter in a few iterations
+        N = WGS84_A/np.sqrt(1-e2*np.sin(lat)**2)
+        hei = p/np.cos(lat)-N
+        lat = np.arctan2(z,p*(1-e2*N/(N+hei)))
+    N = WGS84_A/np.sqrt(1-e2*np.sin(lat)**2)
+    hei = p/np.cos(lat)-N
+    return np.degrees(lat), np.degrees(np.arctan2(y,x)), hei
+
+def SGP4Time(t):
+    '''Brief: converts a skyfield time to the inputs of a direct satrec.sgp4 call and of the
+    TEME to Earth fixed rotation, for code that propagates satrecs without skyfield. Uses
+    skyfield's private leap second table, so it is kept in this function only
+    Parameters:
+        -t: skyfield.timelib.Time object (scalar or array)
+    Returns:
+        -jd, fraction: UTC julian date (whole and fraction of day), as skyfield feeds SGP4
+        -theta: Greenwich sidereal angle in radians
+        -theta_dot: rate of theta in radians per day
+    '''
+    theta, theta_dot = theta_GMST1982(t.whole,t.ut1_fraction)
+    return t.whole, t.tai_fraction-t._leap_seconds()/86400.0, theta, theta_dot
+
+def EarthFixedFromTEME(r,theta):
+    '''Brief: rotates SGP4 TEME positions to Earth fixed coordinates (polar motion neglected)
+    Parameters:
+        -r: TEME positions in km, last axis x, y, z (as returned by satrec.sgp4)
+        -theta: Greenwich sidereal angle in radians (scalar, or one per time of r)
+    Returns:
+        -Earth fixed positions in km, shape (3, ...) like the positions of Topocentric
+    '''
+    if isinstance(theta,float) and isinstance(r,tuple):    #single position (satrec.sgp4 result), the per evaluation path of pass_search
+        cos_t, sin_t = math.cos(theta), math.sin(theta)
+        return np.array([cos_t*r[0]+sin_t*r[1],-sin_t*r[0]+cos_t*r[1],r[2]])
+    r = np.asarray(r)
+    cos_t, sin_t = np.cos(theta), np.sin(theta)
+    return np.array([cos_t*r[...,0]+sin_t*r[...,1],-sin_t*r[...,0]+cos_t*r[...,1],r[...,2]])
+
+def ObserverFrame(my_lat,my_lon):
+    '''Brief: computes the observer's Earth fixed position and local east, north and up
+    unit vectors once, to convert many positions to topocentric coordinates
+    Parameters:
+        -my_lat: observer's latitude (scalar or array of observers)
+        -my_lon: observer's longitude (scalar or array of observers)
+    Returns:
+        -dictionary with keys position (km), east, north and up, shape (3,) for one
+        observer or (3, observers)
+    '''
+    lat, lon = np.radians(my_lat), np.radians(my_lon)
+    return {"position": wgs84.latlon(my_lat,my_lon).itrs_xyz.km,
+            "east": np.array([-np.sin(lon),np.cos(lon),np.zeros_like(lon)]),
+            "north": np.array([-np.sin(lat)*np.cos(lon),-np.sin(lat)*np.sin(lon),np.cos(lat)]),
+            "up": np.array([np.cos(lat)*np.cos(lon),np.cos(lat)*np.sin(lon),np.sin(lat)])}
+
+def Elevation(position,frame):
+    '''Brief: elevation of Earth fixed positions seen by one observer
+    Parameters:
+        -position: positions in km, shape (3, ...)
+        -frame: dictionary returned by ObserverFrame for a single observer
+    Returns:
+        -elevation in degrees, shape (...) (a float for a single position)
+    '''
+    if position.ndim == 1:
+        d = position-frame["position"]
+        return math.degrees(math.asin(frame["up"]@d/math.sqrt(d@d)))
+    shape = (3,)+(1,)*(position.ndim-1)
+    d = position-np.reshape(frame["position"],shape)
+    return np.degrees(np.arcsin((np.reshape(frame["up"],shape)*d).sum(axis=0)/np.sqrt((d*d).sum(axis=0))))
+
+def Topocentric(position,my_lat,my_lon):
+    '''Brief: converts Earth fixed positions to the observer's elevation, azimuth and distance.
+    my_lat and my_lon can be arrays of several observers, the transform is then
+    broadcast over every observer and position
+    Parameters:
+        -position: positions in km, shape (3, points)
+        -my_lat: observer's latitude (scalar or array of observers)
+        -my_lon: observer's longitude (scalar or array of observers)
+    Returns:
+        -elev, az: degrees, azimuth in (0,360)
+        -distance: km
+        (shape (points) for one observer, (observers, points) for arrays)
+    '''
+    frame = ObserverFrame(my_lat,my_lon)
+    observer = np.reshape(frame["position"],(3,-1,1))
+    east, north, up = (np.reshape(frame[axis],(3,-1)) for axis in ("east","north","up"))
+    d = np.reshape(position,(3,1,-1))-observer  #shape (3, observers, points)
+    distance = np.sqrt((d**2).sum(axis=0))
+    elev = np.degrees(np.arcsin(np.einsum("ik,ikn->kn",up,d)/distance))
+    az = np.degrees(np.arctan2(np.einsum("ik,ikn->kn",east,d),np.einsum("ik,ikn->kn",north,d)))%360
+    if np.ndim(my_lat) == 0 and np.ndim(my_lon) == 0:
+        return elev[0], az[0], distance[0]
+    return elev, az, distance
+
+def EphemerisPass(ephemeris,my_lat,my_lon,offsets):
+    '''Brief: serves a pass at any time resolution from the ephemeris
+    Parameters:
+        -ephemeris: dictionary returned by BuildEphemeris
+        -my_lat: observer's latitude
+        -my_lon: observer's longitude
+        -offsets: array of offsets from the ephemeris t0 in seconds
+    Returns:
+        -dictionary of float64 arrays with keys Latitude, Longitude, Height,
+        Elevation, Azimuth and Distance, like orbit_prediction.PropagatePass
+    '''
+    position = EphemerisPosition(ephemeris,offsets)
+    lat, lon, hei = GeodeticFromITRS(position)
+    elev, az, distance = Topocentric(position,my_lat,my_lon)
+    return {"Latitude": lat, "Longitude": lon, "Height": hei,
+            "Elevation": elev, "Azimuth": az, "Distance": distance}
+
+def AngularErrorBound(ephemeris,my_lat,my_lon):
+    '''Brief: converts the measured position error into a pointing direction error bound.
+    The elevation error is within this bound, the azimuth error grows with 1/cos(elevation)
+    Parameters:
+        -ephemeris: dictionary returned by BuildEphemeris
+        -my_lat: observer's latitude
+        -my_lon: observer's longitude
+    Returns:
+        -error bound in degrees, taken at the closest observer distance of the pass
+    '''
+    _, _, distance = Topocentric(ephemeris["position"],my_lat,my_lon)
+    return np.degrees(ephemeris["error_km"]/distance.min())
@@ -1,7 +1,5 @@
-import orbit_prediction as op
-import LabosaTrack as lst
-import pandas as pd
-import serial
+import prefetch as pf   #skyfield, pandas and serial are imported in the background (see prefetch.py)
+import time
 
 myLatLon=(-34.587353,-58.520116)
 az_resolution = 0.9/16
@@ -9,8 +7,11 @@ elev_resolution = 0.9/16
 elevation_start = 0
 timeStep=1
 a=0
-orbit=pd.DataFrame()
+orbit=None
 satName=""
+transfer=None  #transfer running in the background
+passIndex=None #pass index being built in the background
+prefetched=None #background warm up started when the menu is shown
 
 print("Labosat-Track")
 print("Current configuration:")
@@ -63,20 +64,35 @@ def configure_system():
     return myLatLon,timeStep,az_resolution,elev_resolution
 
 while True:
+    
+    if prefetched is None:
+        prefetched=pf.StartPrefetch(myLatLon[0], myLatLon[1], timeStep, elevation_start, az_resolution, elev_resolution)
+        passIndex=prefetched["index"]
+    
+    if transfer is not None:
+        if not transfer.done():
+            print("----Serial transfer in progress----")
+        else:
+            try:
+                print("----Serial transfer finished, EEPROM status:",transfer.result()["eeprom_status"],"----")
+            except Exception as e:
+                print("----Serial transfer failed:",e,"----")
+            transfer=None
         
-    if orbit.empty:
+    if orbit is None:
         print("----No orbit selected----")
     else:
         print("----Orbit:",satName,"----")
-        print("----Orbit start:",op.GetDatetimeFromUNIX(round(orbit["Time"].iloc[0],0)))
-        print("----Max altitude:",max(orbit["Altitude"]))
+        print("----Orbit start:",op.GetDatetimeFromUNIX(orbit.start))
+        print("----Max elevation:",orbit["Elevation"].max())
         
     print("Select option:")
     print("1) Configure system")
     print("2) Select satellite by string")
     print("3) Select closest satellite [For testing]")
-    if not orbit.empty:
+    if orbit is not None:
         print("4) Send orbit data to microcontroller")
+    print("5) Send archived orbit to microcontroller")
     print("0) Exit")
     
     a=input()
@@ -85,35 +101,67 @@ while True:
         break
     elif a=='1':
         myLatLon,timeStep,az_resolution,elev_resolution=configure_system()
+        prefetched=None    #warm up again for the new configuration
         
     elif a=='2':   
+        import orbit_prediction as op, LabosaTrack as lst, pass_archive as pa
         print("Paste satellite name from https://celestrak.com/NORAD/elements/active.txt")
         satName=int(input())        
-        orbit = lst.SatTrack(myLatLon[0], myLatLon[1], satName, timeStep, elevation_start)
-        steps,start_data = lst.Orbit2steps(orbit, az_resolution, elev_resolution)
-        compressed_steps = lst.CompressOrbitData(steps)
+        prefetched["TLEs"].exception()       #wait for the background catalog download
+        sat = op.SelectSatFromName(satName)
+        orbit,steps,start_data,compressed_steps = lst.TrackPass(myLatLon[0], myLatLon[1], satName, timeStep, elevation_start, az_resolution, elev_resolution, sat)
+        pa.StorePass(sat, myLatLon[0], myLatLon[1], orbit, steps, compressed_steps, start_data)
         
     elif a=='3':
+        import orbit_prediction as op, LabosaTrack as lst, pass_archive as pa, pass_index as pidx
         print("Selecting closest satellite...")
-        sat = op.NextSatPass(op.DownloadTLEs(),myLatLon[0],myLatLon[1],10, 70)
+        next_pass = pf.Ready(prefetched,"next_pass")
+        if next_pass is not None and next_pass[1][2][0] > time.time():
+            sat, (orbit,steps,start_data,compressed_steps) = next_pass   #found in the background, searched again once it started
+        else:
+            TLEs = pf.Ready(prefetched,"TLEs") or op.DownloadTLEs()
+            index = passIndex.result() if passIndex is not None and passIndex.done() else None
+            sat = op.NextSatPass(TLEs,myLatLon[0],myLatLon[1],10, 70, pass_index=index)
+            if passIndex is None or passIndex.done():
+                passIndex = pidx.StartPassIndex(TLEs,myLatLon[0],myLatLon[1],70,index)   #next searches are answered by the index
+            orbit,steps,start_data,compressed_steps = lst.TrackPass(myLatLon[0], myLatLon[1], sat.name, timeStep, elevation_start, az_resolution, elev_resolution, sat)
         print("Satellite selected:",sat)
-        orbit = lst.SatTrack(myLatLon[0], myLatLon[1], sat.name, timeStep, elevation_start)
-        steps,start_data = lst.Orbit2steps(orbit, az_resolution, elev_resolution)
-        compressed_steps = lst.CompressOrbitData(steps)
+        pa.StorePass(sat, myLatLon[0], myLatLon[1], orbit, steps, compressed_steps, start_data)
         satName=sat.name
      
         
     elif a=='4':
-        if orbit.empty:
+        if orbit is None:
             print("Incorrect input",end="\n\n")
             continue
+        import serial, serial_async as sa
         print("Sending orbit through serial port...")
         try:
             serial_device=serial.Serial(port='COM8', baudrate=115200,stopbits=1,timeout=16,write_timeout=1)
         except:
-            print("ERROR: Couldn't connect to serial port")
-        lst.SerialSend(serial_device,compressed_steps,start_data)
+            print("ERROR: Couldn't connect to serial port",end="\n\n")
+            continue
+        transfer=sa.StartTransfer(serial_device,compressed_steps,start_data,verbose=False)
         
+    elif a=='5':
+        import pass_archive as pa, serial, serial_async as sa
+        passes = pa.ListPasses()
+        if passes.empty:
+            print("No archived orbits",end="\n\n")
+            continue
+        print(passes[["Name","Start","Step Points"]].reset_index(drop=True))
+        print("Select orbit number:")
+        archived = pa.LoadPass(passes.index[int(input())])
+        if "points" not in archived:
+            print("Orbit was archived without points",end="\n\n")
+            continue
+        print("Sending archived orbit through serial port...")
+        try:
+            serial_device=serial.Serial(port='COM8', baudrate=115200,stopbits=1,timeout=16,write_timeout=1)
+        except:
+            print("ERROR: Couldn't connect to serial port",end="\n\n")
+            continue
+        transfer=sa.StartTransfer(serial_device,archived["points"],archived["start_data"],verbose=False)
             
     else:
         print("Incorrect input")
@@ -0,0 +1,76 @@
+from contextlib import contextmanager
+from tqdm import tqdm
+import time
+
+_hooks = []     #functions called with the record of every finished stage
+_quiet = False  #when True no progress output is printed
+
+
+def AddHook(hook):
+    '''Brief: registers a function to be called with the record of every finished stage.
+    Records are dictionaries with at least the keys "stage" (stage name) and "seconds"
+    (wall time), plus the counters of that stage (points, sgp4_evaluations, bytes,
+    bytes_per_second...)
+    Parameters:
+        -hook: function receiving one record
+    '''
+    _hooks.append(hook)
+
+def RemoveHook(hook):
+    '''Brief: unregisters a function added with AddHook'''
+    _hooks.remove(hook)
+
+def SetQuiet(quiet=True):
+    '''Brief: turns off (or on again) every progress print and progress bar of the pipeline'''
+    global _quiet
+    _quiet = quiet
+
+def IsQuiet():
+    '''Brief: returns True if progress output is turned off'''
+    return _quiet
+
+def Log(*args,**kwargs):
+    '''Brief: prints progress information unless quiet mode is on, same arguments as print'''
+    if not _quiet:
+        print(*args,**kwargs)
+
+def Progress(iterable,**kwargs):
+    '''Brief: wraps an iterable in a tqdm progress bar unless quiet mode is on'''
+    if _quiet:
+        return iterable
+    return tqdm(iterable,**kwargs)
+
+@contextmanager
+def Stage(name,**fields):
+    '''Brief: measures the wall time of a pipeline stage and sends its record to the hooks.
+    The stage fills its counters in the yielded record
+    Example:
+        with mt.Stage("CompressOrbitData") as record:
+            ...
+            record["points"] = len(points)
+    Parameters:
+        -name: stage name
+        -fields: initial values of the record
+    '''
+    record = dict(fields,stage=name)
+    start = time.perf_counter()
+    yield record
+    record["seconds"] = time.perf_counter()-start
+    for hook in _hooks:
+        hook(record)
+
+def StageTotals():
+    '''Brief: creates a hook that accumulates the records of each stage
+    Returns:
+        -hook: function to register with AddHook
+        -totals: dictionary with stage names and dictionaries with the amount of calls
+        and the sum of every numeric field, updated by the hook
+    '''
+    totals = {}
+    def hook(record):
+        stage = totals.setdefault(record["stage"],{"calls": 0})
+        stage["calls"] += 1
+        for key, value in record.items():
+            if isinstance(value,(int,float)) and not isinstance(value,bool):
+                stage[key] = stage.get(key,0)+value
+    return hook, totals
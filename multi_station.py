@@ -0,0 +1,151 @@
+from skyfield.api import load
+from skyfield.framelib import itrs
+import numpy as np
+import math
+import pandas as pd
+import orbit_prediction as op
+import ephemeris as eph
+import pass_data as pdt
+import pass_screening as ps
+import metrics as mt
+
+SEARCH_STEP = 10    #time grid resolution of the pass search in seconds
+
+
+def StationArrays(stations):
+    '''Brief: splits a list of (latitude, longitude) pairs in latitude and longitude arrays'''
+    stations = np.asarray(stations,dtype=float).reshape(-1,2)
+    return stations[:,0], stations[:,1]
+
+def EarthFixedPositions(sat,t0,offsets,backend="vectorized"):
+    '''Brief: propagates the satellite once for every offset, in Earth fixed coordinates
+    Parameters:
+        -sat: satellite object
+        -t0: skyfield.timelib.Time object of the first point
+        -offsets: array of offsets from t0 in seconds
+        -backend: "vectorized" runs SGP4 at every offset, "ephemeris" interpolates
+        between SGP4 nodes (see ephemeris.py)
+    Returns:
+        -position: positions in km, shape (3, offsets)
+        -evaluations: amount of SGP4 evaluations used
+    '''
+    if backend == "vectorized":
+        return sat.at(op.GetTimeArray(t0,offsets)).frame_xyz(itrs).km, len(offsets)
+    elif backend == "ephemeris":
+        ephemeris = eph.BuildEphemeris(sat,t0,offsets[-1] if len(offsets) else 0)
+        return eph.EphemerisPosition(ephemeris,offsets), ephemeris["sgp4_evaluations"]
+    raise ValueError("unknown backend: "+str(backend))
+
+def StationPasses(sat,stations,t0,in_hours=24,min_elevation=30,step_seconds=SEARCH_STEP):
+    '''Brief: finds the passes of a satellite above min_elevation for several stations.
+    The satellite is propagated once over a shared time grid and the elevation of every
+    station is obtained broadcasting the topocentric transform
+    Parameters:
+        -sat: satellite object
+        -stations: list of (latitude, longitude) pairs
+        -t0: skyfield.timelib.Time object, start of the search
+        -in_hours: amount of hours to look for passes
+        -min_elevation: minimun orbit elevation in degrees
+        -step_seconds: time grid resolution in seconds, rise and set times are
+        interpolated between samples
+    Returns:
+        -passes: dataframe with one row per pass, sorted by rise, with the following columns:
+            -Station: index of the station in stations
+            -Rise, Set: times when satellite surpasses and goes below min_elevation in UNIX seconds
+            -Max Elevation: maximum elevation in degrees
+            -Duration: time above min_elevation in seconds
+    '''
+    lats, lons = StationArrays(stations)
+    with mt.Stage("StationPasses",stations=len(lats)) as record:
+        offsets = np.arange(0,in_hours*3600+step_seconds,step_seconds,dtype=float)
+        position, record["sgp4_evaluations"] = EarthFixedPositions(sat,t0,offsets)
+        elev, _, _ = eph.Topocentric(position,lats,lons)   #shape (stations, times)
+        t0_unix = t0.utc_datetime().timestamp()
+
+        rows = []
+        above = elev >= min_elevation
+        for station in range(len(lats)):
+            #rises and sets of the station, a pass in progress at t0 or at the end of the search is skipped
+            changes = np.flatnonzero(np.diff(above[station].astype(np.int8)))+1
+            if len(changes) and not above[station,changes[0]]:
+                changes = changes[1:]
+            for rise_sample, set_sample in zip(changes[0::2],changes[1::2]):
+                station_elev = elev[station]
+                rise = ps.CrossingOffset(offsets,station_elev,rise_sample,min_elevation)
+                set_time = ps.CrossingOffset(offsets,station_elev,set_sample,min_elevation)
+                rows.append((station,t0_unix+rise,t0_unix+set_time,
+                             station_elev[rise_sample:set_sample].max(),set_time-rise))
+        record["passes"] = len(rows)
+
+    passes = pd.DataFrame(rows,columns=["Station","Rise","Set","Max Elevation","Duration"])
+    return passes.sort_values("Rise",ignore_index=True)
+
+def PredictStations(sat,stations,start_time,period_seconds,time_delta,backend="vectorized"):
+    '''Brief: generates the pointing tables of several stations over the same time span,
+    propagating the satellite once per timestamp
+    Parameters:
+        -sat: satellite object
+        -stations: list of (latitude, longitude) pairs
+        -start_time: time to start calculating orbit (skyfield.timelib.Time object)
+        -period_seconds: time interval to calculate orbit in seconds
+        -time_delta: time interval bteween each calculated point in seconds
+        -backend: "vectorized" or "ephemeris", see PredictOrbit
+    Returns:
+        -list with one pass per station, like PredictOrbit returns
+    '''
+    lats, lons = StationArrays(stations)
+    points_amount = int(period_seconds/time_delta)
+    with mt.Stage("PredictStations",backend=backend,stations=len(lats),points=points_amount) as record:
+        offsets = np.arange(points_amount)*time_delta
+        position, record["sgp4_evaluations"] = EarthFixedPositions(sat,start_time,offsets,backend)
+        lat, lon, hei = eph.GeodeticFromITRS(position)  #shared by every station
+        elev, az, distance = eph.Topocentric(position,lats,lons)
+        start_unix = start_time.utc_datetime().timestamp()
+        start = math.trunc(start_unix)
+        times = np.round((start_unix-start+offsets)*1000).astype(np.int64)
+        #geodetic columns are converted once and shared (not copied) by every station
+        shared = pdt.PassData("orbit",{"Time": times, "Latitude": lat, "Longitude": lon, "Height": hei},start).columns
+        tables = [pdt.PassData("orbit",dict(shared,Elevation=elev[station],Azimuth=az[station],Distance=distance[station]),
+                               start,sat.name,lats[station],lons[station],record["sgp4_evaluations"])
+                  for station in range(len(lats))]
+    return tables
+
+def NextStationPasses(sat,stations,time_delta,in_hours=48,min_elevation=30,t0=None,backend="vectorized"):
+    '''Brief: finds the next pass of a satellite for every station and generates their
+    pointing tables in one call. Passes of different stations that overlap in time are
+    propagated together, once per timestamp
+    Parameters:
+        -sat: satellite object
+        -stations: list of (latitude, longitude) pairs
+        -time_delta: time interval between each calculated point in seconds
+        -in_hours: amount of hours to look for a valid orbit
+        -min_elevation: minimun orbit elevation in degrees
+        -t0: skyfield.timelib.Time object, start of the search, defaults to current time
+        -backend: "vectorized" or "ephemeris", see PredictOrbit
+    Returns:
+        -windows: dataframe returned by StationPasses, one row per station with a pass
+        -tables: dictionary with station indexes and passes like CalculateNextOrbit returns,
+        stations without a pass in_hours are not included
+    '''
+    if t0 is None:
+        t0 = load.timescale().now()
+    passes = StationPasses(sat,stations,t0,in_hours,min_elevation)
+    windows = passes.drop_duplicates("Station",ignore_index=True)   #first pass of every station
+
+    #group windows that overlap in time, each group shares a single propagation
+    tables = {}
+    group_start, group_end, group = None, None, []
+    for row in list(windows.itertuples(index=False))+[None]:
+        if row is not None and group and row.Rise <= group_end:
+            group.append(row)
+            group_end = max(group_end,row.Set)
+            continue
+        if group:
+            start = t0.ts.from_datetime(op.GetDatetimeFromUNIX(group_start))
+            group_tables = PredictStations(sat,[stations[r.Station] for r in group],start,
+                                           group_end-group_start,time_delta,backend)
+            for r, table in zip(group,group_tables):
+                tables[r.Station] = table.Window(r.Rise,r.Set)  #view, not a copy
+        if row is not None:
+            group_start, group_end, group = row.Rise, row.Set, [row]
+    return windows, tables
@@ -1,18 +1,25 @@
 from skyfield.api import load, wgs84, EarthSatellite
-import datetime
-import pandas as pd
-from tqdm import tqdm
+import datetime, math
+import numpy as np
+import metrics as mt
+import tle_catalog as tc
+import pass_screening as ps
+import pass_index as pidx
+import pass_search as psearch
+import ephemeris as eph
+import pass_archive as pa
+import pass_data as pdt
 
 
-def DownloadTLEs(): #under
-    '''Brief: Download all active satellites TLEs from celestrack.com
+def DownloadTLEs(ttl_hours=tc.TTL_HOURS): #under
+    '''Brief: Get all active satellites TLEs from celestrack.com. TLEs are kept in
+    a local catalog and only downloaded again when it is older than ttl_hours
+    Parameters:
+        -ttl_hours: maximum catalog age in hours
     Returns: 
         -dictionary with names and TLEs
     '''
-    print("Downloading all active TLEs:")
-    tle_url = 'https://celestrak.com/NORAD/elements/active.txt'
-    satellites = load.tle_file(tle_url,reload=True)
-    return {sat.name: sat for sat in satellites}
+    return tc.LoadCatalog(ttl_hours=ttl_hours)
 
 def GetSatFromString(line1,line2,name): #programmer
     '''Brief: Get satellite with raw TLE lines
@@ -37,13 +44,14 @@ def SelectSat(TLE_list,sat_name): #under
     return TLE_list[sat_name]
 
 def SelectSatFromName(sat_name): #programmer
-    '''Brief: Downloads TLEs and selects a specific satellite
+    '''Brief: Selects a specific satellite from the local TLE catalog, downloading
+    TLEs only if the catalog is outdated
     Parameters:
-        -sat_name: satellite name (string)
+        -sat_name: satellite name (string) or NORAD ID (int)
     Returns: 
         -satellite object
     '''
-    return SelectSat(DownloadTLEs(),sat_name)
+    return tc.SelectFromCatalog(sat_name)
 
 def GetDatetimeFromUNIX(seconds):
     '''Brief: converts UNIX seconds to datetime.datetime object
@@ -109,7 +117,7 @@ def GetSatElevAzDist(sat,my_lat,my_lon,t):
     elev, az, distance = topocentric.altaz() #convert coordinates to azimuth and elevation
     return elev,az,distance
 
-def NextSatPass(TLEs,my_lat,my_lon,t_start_offset,min_elevation):
+def NextSatPass(TLEs,my_lat,my_lon,t_start_offset,min_elevation,search_minutes=5,t_now=None,pass_index=None):
     '''Brief: Gets a pass from the closest satellite (time wise). Starting from the
     moment this method is called, it will look for an event of surpassing
     'min elevation' elevation after t_start_offset minutes.
@@ -122,32 +130,76 @@ def NextSatPass(TLEs,my_lat,my_lon,t_start_offset,min_elevation):
         -my_lon: observer's longitude
         -t_start_offset: time in minutes
         -min_elevation: minimun orbit elevation in degrees
+        -search_minutes: time in minutes after t_start_offset where the pass has to start
+        -t_now: skyfield.timelib.Time object used as current time, defaults to now
+        -pass_index: index returned by pass_index.BuildPassIndex, used instead of
+        screening the catalog when it covers the search
     Returns:
-        -satellite: satellite object
+        -satellite: satellite object, None if no satellite surpasses min_elevation
     '''
     ts = load.timescale() #initialize skyfield time scale
-    t0 = ts.from_datetime(ts.now().utc_datetime()+datetime.timedelta(minutes=t_start_offset)) #generate timescale object with value current time + t_start_offset
-    t1 = AddTimeDelta(t0,5*60) #generate timescale object with value t0 + 5 minutes. This is enough time to get at least 1 satellite with elevation > min_elevation
-    bluffton = wgs84.latlon(my_lat,my_lon)  #generates object with observer's position
-    for key in TLEs.keys():     #Iterate TLE list
-        satellite=SelectSat(TLEs,key)
-        t, events = satellite.find_events(bluffton, t0, t1, altitude_degrees=min_elevation) #look for an elevation > min_elevation in the time interval (t0,t1)
-        if len(events)==3:      #3 events are needed: rise above min_elevation, zenith and rise below mi:elevation, if 2 or less events are found, rise above happened before t_start_offset, so the satellite is discarded
-            return satellite
+    if t_now is None:
+        t_now = ts.now()
+    t0 = ts.from_datetime(t_now.utc_datetime()+datetime.timedelta(minutes=t_start_offset)) #generate timescale object with value current time + t_start_offset
+    t0_unix = t0.utc_datetime().timestamp()
+    if pass_index is not None and pidx.Covers(pass_index,t0_unix,t0_unix+search_minutes*60,my_lat,my_lon,min_elevation):
+        passes = pidx.QueryPasses(pass_index,t0_unix,t0_unix+search_minutes*60,min_elevation) #binary search in the precomputed passes
+        passes = passes[passes["Name"].isin(TLEs)]
+    else:
+        passes = ps.ScreenPasses(TLEs,my_lat,my_lon,t0,search_minutes,min_elevation) #passes of the whole catalog, soonest first
+    if passes.empty:
+        return None
+    return SelectSat(TLEs,passes["Name"].iloc[0])
         
-def PredictOrbit(sat,my_lat,my_lon,start_time_unix,period_seconds,time_delta,save_csv=False):
-    '''Brief: generate a dataframe containing the orbit pass
+def GetTimeArray(t0,offsets):
+    '''Brief: builds a single skyfield time array from a start time and offsets
+    Parameters:
+        -t0: skyfield.timelib.Time object
+        -offsets: array of offsets from t0 in seconds
+    Returns:
+        -skyfield.timelib.Time object holding one time per offset
+    '''
+    return t0.ts.tt_jd(t0.whole, t0.tt_fraction+np.asarray(offsets,dtype=float)/86400.0)
+
+def PropagatePass(sat,my_lat,my_lon,t0,offsets):
+    '''Brief: runs SGP4 and the topocentric transform for a whole time array at once
+    Parameters:
+        -sat: satellite object
+        -my_lat: observer's latitude
+        -my_lon: observer's longitude
+        -t0: skyfield.timelib.Time object of the first point
+        -offsets: array of offsets from t0 in seconds
+    Returns:
+        -dictionary of float64 arrays with keys Latitude, Longitude, Height,
+        Elevation, Azimuth and Distance
+    '''
+    t = GetTimeArray(t0,offsets)    #one Time array for every point of the pass
+    sat_pos_geocentric = sat.at(t)  #SGP4 evaluated once for the whole array
+    lat, lon = wgs84.latlon_of(sat_pos_geocentric)
+    hei = wgs84.height_of(sat_pos_geocentric).km
+    bluffton = wgs84.latlon(my_lat, my_lon) #observer is built only once
+    elev, az, distance = (sat - bluffton).at(t).altaz()
+    return {"Latitude": lat.degrees, "Longitude": lon.degrees, "Height": hei,
+            "Elevation": elev.degrees, "Azimuth": az.degrees, "Distance": distance.km}
+
+def PredictOrbit(sat,my_lat,my_lon,start_time_unix,period_seconds,time_delta,archive=False,backend="vectorized"):
+    '''Brief: generate the orbit pass
     Parameters:
         -sat: satellite object
         -my_lat: observer's latitude
         -my_lon: oberver's longitude
-        -start_time_unix: time to start calculating orbit (in UNIX seconds)
+        -start_time_unix: time to start calculating orbit (skyfield.timelib.Time object)
         -period_seconds: time interval to calculate orbit in seconds
         -time_delta: time interval bteween each calculated point in seconds
-        -save_csv: boolean specifying whether to save dataframe in a csv file or not
+        -archive: boolean specifying whether to store the pass in the pass archive or not (see pass_archive.py)
+        -backend: "vectorized" propagates the whole pass in a single call,
+        "ephemeris" interpolates between SGP4 nodes every ephemeris.NODE_STEP seconds
+        (for fine time_delta values, see ephemeris.py for its error bound),
+        "iterative" propagates one point at a time (slow, kept for reference)
     Returns:
-        -df: dataframe containing all calculated points in the following columns:
-            -Time: time in UNIX seconds
+        -orbit: pass_data.PassData of kind "orbit" with all calculated points in the following columns
+        (orbit.to_dataframe() gives the same columns in a dataframe, with Time in UNIX seconds):
+            -Time: time in milliseconds since orbit.start (UNIX seconds)
             -Latitude: satellite's latitude
             -Longitude: satellite's longitude
             -Height: satellite's height
@@ -155,23 +207,74 @@ def PredictOrbit(sat,my_lat,my_lon,start_time_unix,period_seconds,time_delta,sav
             -Azimuth: satellite's azimuth
             -Distance: distance between satellite and observer
     '''
-    print("calculating orbit:",flush=True)
-    df = pd.DataFrame(columns=["Time","Latitude","Longitude","Height","Elevation","Azimuth","Distance"]) #initialize dataframe
-
-    for i in tqdm(range(0,int(period_seconds/time_delta))): #iterate for amount of points desired: amount_seconds* time_delta
-        IterationTime = start_time_unix+datetime.timedelta(seconds=i*time_delta)    #Get iteration time
-        lat,lon,hei = SGP4(sat, IterationTime) #get satellite's latitude, longitude and height
-        alt,az,distance = GetSatElevAzDist(sat, my_lat, my_lon, IterationTime) #get satellite's elevation, azimuth and distance
-        df2=pd.DataFrame( \
-            [[round(IterationTime.utc_datetime().timestamp(),3),lat.degrees,lon.degrees,hei,alt.degrees,az.degrees,distance.km]], \
-            index=[i], \
-            columns=["Time","Latitude","Longitude","Height","Elevation","Azimuth","Distance"]) #save values in an auxiliary one row dataframe
-        df=pd.concat([df,df2]) #merge (concatenate) both dataframes
-    if save_csv == True:
-        df.to_csv("csv/trackedOrbit.csv")   #save dataframe as .csv
-    return df
+    points_amount = int(period_seconds/time_delta)
+    offsets = np.arange(points_amount)*time_delta    #offset of every point from the start time in seconds
+    start_unix = start_time_unix.utc_datetime().timestamp()
+    start = math.trunc(start_unix)
+    times = np.round((start_unix-start+offsets)*1000).astype(np.int64)  #milliseconds since the start second
+    
+    with mt.Stage("PredictOrbit",backend=backend,points=points_amount) as record:
+        if backend == "vectorized":
+            data = PropagatePass(sat, my_lat, my_lon, start_time_unix, offsets)
+            record["sgp4_evaluations"] = 2*points_amount    #geocentric and topocentric positions
+        elif backend == "ephemeris":
+            ephemeris = eph.BuildEphemeris(sat, start_time_unix, period_seconds)
+            data = eph.EphemerisPass(ephemeris, my_lat, my_lon, offsets)
+            record["sgp4_evaluations"] = ephemeris["sgp4_evaluations"]
+        elif backend == "iterative":
+            mt.Log("calculating orbit:",flush=True)
+            rows = []
+            for i in mt.Progress(range(0,points_amount)): #iterate for amount of points desired: amount_seconds* time_delta
+                IterationTime = start_time_unix+datetime.timedelta(seconds=i*time_delta)    #Get iteration time
+                lat,lon,hei = SGP4(sat, IterationTime) #get satellite's latitude, longitude and height
+                alt,az,distance = GetSatElevAzDist(sat, my_lat, my_lon, IterationTime) #get satellite's elevation, azimuth and distance
+                rows.append((lat.degrees,lon.degrees,hei,alt.degrees,az.degrees,distance.km))
+            columns = np.array(rows,dtype=np.float64).reshape(-1,6).T
+            data = dict(zip(["Latitude","Longitude","Height","Elevation","Azimuth","Distance"],columns))
+            record["sgp4_evaluations"] = 2*points_amount
+        else:
+            raise ValueError("unknown PredictOrbit backend: "+str(backend))
+        orbit = pdt.PassData("orbit", dict(Time=times, **data), start, sat.name, my_lat, my_lon, record["sgp4_evaluations"])
+        
+    if archive == True:
+        pa.StorePass(sat, my_lat, my_lon, orbit=orbit)  #save pass in binary format
+    return orbit
         
-def CalculateNextOrbit(sat,my_lat,my_lon,time_delta,in_hours=48,min_elevation=30):
+def NextPassBounds(sat,my_lat,my_lon,in_hours=48,min_elevation=30,t0=None):
+    '''Brief: finds the next pass of a specific satellite that surpasses min_elevation.
+    Candidate windows are found jumping along the orbit with the TLE mean motion and the
+    pass bounds are refined to the millisecond only inside them (see pass_search.py)
+    Parameters:
+        -sat: satellite object
+        -my_lat: observer's latitude
+        -my_lon: observer's longitude
+        -in_hours: amount of hours to look for a valid orbit
+        -min_elevation: minimun orbit elevation in degrees
+        -t0: skyfield.timelib.Time object where the search starts, defaults to now
+    Returns:
+        -t_rise: time when satellite surpasses min_elevation (skyfield.timelib.Time object)
+        -period_seconds: time above min_elevation in seconds, with millisecond precision
+    '''
+    if t0 is None:
+        t0 = load.timescale().now() #get current time
+    with mt.Stage("NextPassBounds",hours=in_hours) as record:
+        found, record["sgp4_evaluations"] = psearch.NextPass(sat,my_lat,my_lon,t0,in_hours,min_elevation)
+        if record["sgp4_evaluations"] is None:
+            #the satellite never leaves the visibility region (high orbits), search every event
+            t1 = AddTimeDelta(t0,in_hours*60*60) #get time with an in_hours offset from t0
+            bluffton = wgs84.latlon(my_lat, my_lon) #generates object with observer's position
+            tx, events = sat.find_events(bluffton, t0, t1, altitude_degrees=min_elevation)  #look for an elevation > min_elevation in the time interval (t0,t1)
+            # Make sure the first event is a 'rise over min_elevation' event
+            n=0
+            while events[n]!=0: # 'rise over min_elevation' event equals 0
+                n+=1
+            return tx[n], round((tx[n+2]-tx[n])*86400,3)  #'fall below min_elevation' time [n+2] minus 'rise over min_elevation' time
+    if found is None:
+        raise ValueError("no pass above "+str(min_elevation)+" degrees in the next "+str(in_hours)+" hours")
+    rise, _, set_time, _ = found
+    return GetTimeArray(t0,float(rise)), round(float(set_time-rise),3)
+
+def CalculateNextOrbit(sat,my_lat,my_lon,time_delta,in_hours=48,min_elevation=30,backend="vectorized",t0=None):
     '''Brief: calculate next orbit of a specific satellite that surpasses min_elevation
     Parameters:
         -sat: satellite object
@@ -180,21 +283,11 @@ def CalculateNextOrbit(sat,my_lat,my_lon,time_delta,in_hours=48,min_elevation=30
         -time_delta: time interval between each calculated point in seconds
         -in_hours: amount of hours to look for a valid orbit
         -min_elevation: minimun orbit elevation in degrees
+        -backend: PredictOrbit backend
+        -t0: skyfield.timelib.Time object where the search starts, defaults to now
     Returns:
-        -dataframe returned by PredictOrbit
+        -orbit returned by PredictOrbit
         
     '''
-    ts = load.timescale() #initialize skyfield time scale
-    t0 = ts.now() #get current time
-    t1 = AddTimeDelta(t0,in_hours*60*60) #get time with an in_hours offset from t0
-    bluffton = wgs84.latlon(my_lat, my_lon) #generates object with observer's position
-    tx, events = sat.find_events(bluffton, t0, t1, altitude_degrees=min_elevation)  #look for an elevation > min_elevation in the time interval (t0,t1)
-    
-    # Make sure the first event is a 'rise over min_elevation' event
-    n=0
-    while events[n]!=0: # 'rise over min_elevation' event equals 0
-        n+=1
-    tx_dt=tx.utc_datetime()  #Convert tx list to datetime object (UTC)
-    taux=tx_dt[n+2]-tx_dt[n]  #take 'fall below min_elevation' time [n+2] and substract 'rise over min_elevation', obtaining total relevant orbit time in seconds
-    
-    return PredictOrbit(sat,my_lat,my_lon,tx[n],taux.seconds,time_delta)
+    t_rise, period_seconds = NextPassBounds(sat,my_lat,my_lon,in_hours,min_elevation,t0)
+    return PredictOrbit(sat,my_lat,my_lon,t_rise,period_seconds,time_delta,backend=backend)
@@ -0,0 +1,191 @@
+import numpy as np
+import pandas as pd
+import json, os, math, time
+import pass_data as pdt
+
+ARCHIVE_DIR = "pass_archive"    #directory where computed passes are stored
+INDEX_FILE = "index.json"
+
+#tables stored for each pass: the orbit and steps passes (pass_data.PassData) are stored
+#column by column ("orbit.Elevation.1.npy"...) with their own dtypes, so they are loaded
+#back as passes whose columns are memory-mapped without copying. A changed table is written
+#to files of a new version (the number in the name) and the index switched to them, files
+#that may be memory-mapped are never overwritten (Windows doesn't allow it)
+PASS_TABLES = ["orbit","steps"]
+POINTS_DTYPE = ">u4"
+
+
+def TLEEpoch(sat):
+    '''Brief: returns the TLE epoch of a satellite in TLE format (YYDDD.DDDDDDDD)'''
+    return "%02d%012.8f" % (sat.model.epochyr,sat.model.epochdays)
+
+def PassKey(sat,my_lat,my_lon,orbit_start):
+    '''Brief: builds the archive key of a pass: satellite, TLE epoch, station and start second
+    Parameters:
+        -sat: satellite object
+        -my_lat: observer's latitude
+        -my_lon: observer's longitude
+        -orbit_start: pass start time in UNIX seconds
+    Returns:
+        -key (string), also used as the pass directory name
+    '''
+    return "%d_%s_%+.4f_%+.4f_%d" % (sat.model.satnum,TLEEpoch(sat),my_lat,my_lon,math.trunc(orbit_start))
+
+def _ReadIndex(archive_dir):
+    '''Brief: loads the archive index, empty if there is no archive yet'''
+    index_path = os.path.join(archive_dir,INDEX_FILE)
+    if not os.path.exists(index_path):
+        return {}
+    with open(index_path) as f:
+        return json.load(f)
+
+def _WriteIndex(index,archive_dir):
+    '''Brief: saves the archive index, replacing the file at once so readers never see it half written'''
+    index_path = os.path.join(archive_dir,INDEX_FILE)
+    with open(index_path+".tmp","w") as f:
+        json.dump(index,f,indent=1)
+    os.replace(index_path+".tmp",index_path)
+
+def _ColumnPath(pass_dir,table,name=None,generation=0):
+    '''Brief: file of one column of an archived table version (of the points table if name is None)'''
+    parts = [table]+([name] if name is not None else [])+([str(generation)] if generation else [])
+    return os.path.join(pass_dir,".".join(parts)+".npy")
+
+def _TableFiles(entry,pass_dir,table):
+    '''Brief: column names and files of a stored table, {} if it isn't stored'''
+    if table not in entry["tables"]:
+        return {}
+    generation = entry.get("generations",{}).get(table,0)
+    names = entry[table+"_columns"] if table in PASS_TABLES else [None]
+    return {name: _ColumnPath(pass_dir,table,name,generation) for name in names}
+
+def _IsStored(entry,pass_dir,table,columns):
+    '''Brief: True if the table is already stored with the same columns and values'''
+    files = _TableFiles(entry,pass_dir,table)
+    if list(files) != list(columns):
+        return False
+    for name, values in columns.items():
+        stored = np.load(files[name],mmap_mode="r")
+        if stored.shape != values.shape or not np.array_equal(stored,values):
+            return False
+    return True
+
+def _RemoveOld(pass_dir,table,keep):
+    '''Brief: removes the files of older versions of a table, files still mapped by a
+    reader can't be removed on Windows and are left for the next StorePass'''
+    for file in os.listdir(pass_dir):
+        path = os.path.join(pass_dir,file)
+        if file.startswith(table+".") and file.endswith(".npy") and path not in keep:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def StorePass(sat,my_lat,my_lon,orbit=None,steps=None,points=None,start_data=None,archive_dir=ARCHIVE_DIR):
+    '''Brief: stores the tables of a pass in binary format. Tables not given are kept
+    if they were already stored, so a pass can be archived stage by stage. Tables already
+    stored with the same values are not written again (the UI stores cached passes again),
+    changed tables are written to new files and the old ones removed once they aren't mapped
+    Parameters:
+        -sat: satellite object
+        -my_lat: observer's latitude
+        -my_lon: observer's longitude
+        -orbit: pass returned by PredictOrbit
+        -steps: pass returned by Orbit2steps or ScheduleSteps
+        -points: packed points returned by CompressOrbitData
+        -start_data: start values returned by Orbit2steps
+    Returns:
+        -key of the stored pass
+    '''
+    if start_data is not None:
+        orbit_start = start_data[0]
+    elif orbit is not None:
+        orbit_start = orbit.start
+    else:
+        raise ValueError("orbit or start_data is needed to identify the pass")
+    key = PassKey(sat,my_lat,my_lon,orbit_start)
+    pass_dir = os.path.join(archive_dir,key)
+    os.makedirs(pass_dir,exist_ok=True)
+
+    index = _ReadIndex(archive_dir)
+    entry = index.get(key,{"name": sat.name, "norad": int(sat.model.satnum), "epoch": TLEEpoch(sat),
+                           "latitude": my_lat, "longitude": my_lon, "orbit_start": math.trunc(orbit_start),
+                           "tables": {}})
+    tables = {table: data.columns for table,data in (("orbit",orbit),("steps",steps)) if data is not None}
+    if points is not None:
+        tables["points"] = {None: np.asarray(points,dtype=POINTS_DTYPE)}
+    changed = start_data is not None and entry.get("start_data") != [int(value) for value in start_data]
+    for table, columns in tables.items():
+        columns = {name: np.ascontiguousarray(values) for name,values in columns.items()}
+        if _IsStored(entry,pass_dir,table,columns):
+            continue
+        changed = True
+        generation = entry.setdefault("generations",{}).get(table,0)+1
+        entry["generations"][table] = generation
+        for name, values in columns.items():
+            np.save(_ColumnPath(pass_dir,table,name,generation),values)
+        entry["tables"][table] = len(next(iter(columns.values())))
+        if table in PASS_TABLES:
+            data = orbit if table == "orbit" else steps
+            entry[table+"_start"] = data.start
+            entry[table+"_columns"] = list(columns)
+    if not changed:
+        return key
+    if start_data is not None:
+        entry["start_data"] = [int(value) for value in start_data]
+    entry["stored"] = time.time()
+
+    index[key] = entry
+    _WriteIndex(index,archive_dir)
+    for table in tables:
+        _RemoveOld(pass_dir,table,set(_TableFiles(entry,pass_dir,table).values()))
+    return key
+
+def ListPasses(archive_dir=ARCHIVE_DIR,sat_name=None):
+    '''Brief: lists the archived passes without opening their tables
+    Parameters:
+        -archive_dir: archive directory
+        -sat_name: only list passes of this satellite (name or NORAD ID)
+    Returns:
+        -dataframe with one row per pass, indexed by key, sorted by start time
+    '''
+    columns = ["Name","NORAD","Epoch","Latitude","Longitude","Start","Orbit Points","Step Points"]
+    rows = {}
+    for key, entry in _ReadIndex(archive_dir).items():
+        if sat_name is not None and sat_name not in (entry["name"],entry["norad"],str(entry["norad"])):
+            continue
+        rows[key] = [entry["name"],entry["norad"],entry["epoch"],entry["latitude"],entry["longitude"],
+                     entry["orbit_start"],entry["tables"].get("orbit",0),entry["tables"].get("points",0)]
+    passes = pd.DataFrame.from_dict(rows,orient="index",columns=columns)
+    passes.index.name = "Key"
+    return passes.sort_values("Start")
+
+def LoadPass(key,archive_dir=ARCHIVE_DIR,mmap_mode="r"):
+    '''Brief: opens an archived pass, tables are memory-mapped instead of read
+    Parameters:
+        -key: pass key, as returned by StorePass or ListPasses
+        -archive_dir: archive directory
+        -mmap_mode: numpy memory-map mode, None reads the tables in memory
+    Returns:
+        -dictionary with the index entry of the pass plus the following keys, for the stored tables:
+            -orbit: pass like PredictOrbit returns, its columns memory-mapped
+            -steps: pass like ScheduleSteps returns, its columns memory-mapped
+            -points: packed points, ready to be sent with SerialSend
+            -start_data: tuple of start values, ready to be sent with SerialSend
+    '''
+    index = _ReadIndex(archive_dir)
+    if key not in index:
+        raise KeyError("pass not found in archive: "+str(key))
+    archived = dict(index[key])
+    pass_dir = os.path.join(archive_dir,key)
+    for table in archived["tables"]:
+        files = _TableFiles(archived,pass_dir,table)
+        if table in PASS_TABLES:
+            columns = {name: np.load(path,mmap_mode=mmap_mode) for name,path in files.items()}
+            archived[table] = pdt.PassData(table,columns,archived[table+"_start"],archived["name"],
+                                           archived["latitude"],archived["longitude"])
+        else:
+            archived[table] = np.load(files[None],mmap_mode=mmap_mode)
+    if "start_data" in archived:
+        archived["start_data"] = tuple(archived["start_data"])
+    return archived
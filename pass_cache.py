@@ -0,0 +1,139 @@
+from collections import OrderedDict
+import time, threading
+import metrics as mt
+
+MAX_ENTRIES = 32                #cached results kept at most
+MAX_BYTES = 256*1024*1024       #memory used by cached results at most
+
+_entries = OrderedDict()    #key: (value, nbytes, expires), least recently used first
+_epochs = {}                #NORAD ID: newest TLE epoch seen
+_info = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0, "bytes": 0}
+_computing = {}             #key: [lock held while the result is computed, threads using it]
+_lock = threading.RLock()   #guards the dictionaries above, the cache is used by the UI and its prefetch thread
+
+
+def TLEEpochDays(sat):
+    '''Brief: returns the TLE epoch of a satellite as a julian date, to compare epochs'''
+    return sat.model.jdsatepoch+sat.model.jdsatepochF
+
+def PassKey(sat,my_lat,my_lon,*parameters):
+    '''Brief: builds the cache key of a computed pass
+    Parameters:
+        -sat: satellite object
+        -my_lat: observer's latitude
+        -my_lon: observer's longitude
+        -parameters: every other value the result depends on (time_delta, min_elevation, resolutions...)
+    Returns:
+        -key (tuple), the first two elements are the NORAD ID and the TLE epoch
+    '''
+    return (int(sat.model.satnum),TLEEpochDays(sat),round(my_lat,6),round(my_lon,6))+tuple(parameters)
+
+def _Drop(key):
+    '''Brief: removes one entry and updates the cached bytes'''
+    _, nbytes, _ = _entries.pop(key)
+    _info["bytes"] -= nbytes
+
+def _CheckEpoch(key):
+    '''Brief: registers the TLE epoch of a key, entries computed with an older TLE
+    of the same satellite are removed'''
+    satnum, epoch = key[0], key[1]
+    if epoch > _epochs.get(satnum,epoch-1):
+        _epochs[satnum] = epoch
+        for old_key in [k for k in _entries if k[0] == satnum and k[1] < epoch]:
+            _Drop(old_key)
+            _info["invalidations"] += 1
+
+def _Lookup(key,count_miss=True):
+    '''Brief: Get, the miss is only counted if count_miss is True'''
+    with _lock:
+        _CheckEpoch(key)
+        entry = _entries.get(key)
+        if entry is not None and entry[2] is not None and time.time() > entry[2]:
+            _Drop(key)
+            _info["invalidations"] += 1
+            entry = None
+        if entry is None:
+            _info["misses"] += count_miss
+            return None
+        _entries.move_to_end(key)
+        _info["hits"] += 1
+        return entry[0]
+
+def Get(key):
+    '''Brief: gets a cached result
+    Parameters:
+        -key: key built with PassKey
+    Returns:
+        -cached value, or None if it isn't cached, it expired or a newer TLE arrived
+    '''
+    return _Lookup(key)
+
+def Put(key,value,nbytes=0,expires=None):
+    '''Brief: caches a result, evicting the least recently used ones if the cache is full.
+    Cached values are shared with every caller, they must not be modified
+    Parameters:
+        -key: key built with PassKey
+        -value: result to cache
+        -nbytes: memory used by value
+        -expires: UNIX time after which the value is no longer valid (for example the
+        start of the pass, a next pass result is useless after it begins)
+    '''
+    with _lock:
+        _CheckEpoch(key)
+        if key in _entries:
+            _Drop(key)
+        if nbytes > MAX_BYTES or key[1] < _epochs[key[0]]:    #too big, or computed with an outdated TLE
+            return
+        _entries[key] = (value,nbytes,expires)
+        _info["bytes"] += nbytes
+        while len(_entries) > MAX_ENTRIES or _info["bytes"] > MAX_BYTES:
+            _Drop(next(iter(_entries)))
+            _info["evictions"] += 1
+
+def Cached(key,compute,nbytes=None,expires=None):
+    '''Brief: gets a cached result or computes and caches it. If other threads ask for the
+    same key while it is computed they wait for the result instead of computing it again,
+    different keys are computed at the same time
+    Parameters:
+        -key: key built with PassKey
+        -compute: function without parameters returning the result
+        -nbytes: function returning the memory used by a result
+        -expires: function returning the UNIX expiry time of a result
+    Returns:
+        -cached or computed result
+    '''
+    with _lock:
+        value = Get(key)
+        if value is None:
+            computing = _computing.setdefault(key,[threading.Lock(),0])
+            computing[1] += 1
+    if value is not None:
+        mt.Log("using cached result for satellite",key[0])
+        return value
+    try:
+        with computing[0]:
+            value = _Lookup(key,count_miss=False)   #computed by another thread while waiting
+            if value is None:
+                value = compute()
+                Put(key,value,nbytes(value) if nbytes else 0,expires(value) if expires else None)
+            else:
+                mt.Log("using result computed by another thread for satellite",key[0])
+    finally:
+        with _lock:
+            computing[1] -= 1
+            if computing[1] == 0:
+                del _computing[key]
+    return value
+
+def Invalidate(sat=None):
+    '''Brief: removes every cached result, or the ones of a satellite'''
+    with _lock:
+        for key in [k for k in _entries if sat is None or k[0] == sat.model.satnum]:
+            _Drop(key)
+            _info["invalidations"] += 1
+
+def CacheInfo():
+    '''Brief: returns a dictionary with the cache counters: hits, misses, evictions,
+    invalidations, bytes and entries'''
+    with _lock:
+        return dict(_info,entries=len(_entries))
@@ -0,0 +1,136 @@
+import numpy as np
+import math
+import pandas as pd
+
+#Columns of each kind of pass and their dtypes. Times are integer milliseconds since
+#the start second of the pass (PassData.start, UNIX seconds), for the orbit points as
+#well as for the step points, so Orbit2steps uses the orbit times as they are. Azimuth
+#and elevation keep float64 (steps are quantized from them), the rest of the orbit
+#columns are only informative and use float32. Step counts are uint8, widened to uint16
+#only if a point of Orbit2steps has more steps than that (ScheduleSteps splits it later).
+ORBIT_DTYPES = {"Time": np.int64, "Latitude": np.float32, "Longitude": np.float32, "Height": np.float32,
+                "Elevation": np.float64, "Azimuth": np.float64, "Distance": np.float32}
+STEPS_DTYPES = {"Time": np.int64, "Elev Steps": np.uint8, "Az Steps": np.uint8, "Index": np.int64}
+DTYPES = {"orbit": ORBIT_DTYPES, "steps": STEPS_DTYPES}
+STEP_COLUMNS = ["Elev Steps","Az Steps"]
+
+
+def _Typed(kind,name,values):
+    '''Brief: converts a column to its dtype, without copying if it already has it'''
+    dtype = DTYPES[kind].get(name,np.float64)
+    values = np.asarray(values)
+    if name in STEP_COLUMNS and len(values) and values.max() > np.iinfo(dtype).max:
+        dtype = np.uint16
+    if name in STEP_COLUMNS and len(values) and (values.min() < 0 or values.max() > np.iinfo(np.uint16).max):
+        raise ValueError("step counts of column "+name+" don't fit in 16 bits")
+    return np.asarray(values,dtype=dtype)
+
+
+class PassData:
+    '''Array-backed pass, shared by orbit_prediction and LabosaTrack instead of dataframes.
+    Columns are typed NumPy arrays, pass["Elevation"] returns the array itself, and
+    slices (pass[100:200], pass.Window(...)) return views of the same arrays'''
+    __slots__ = ("kind","columns","start","sat_name","latitude","longitude","sgp4_evaluations")
+
+    def __init__(self,kind,columns,start,sat_name=None,latitude=None,longitude=None,sgp4_evaluations=None):
+        '''Parameters:
+            -kind: "orbit" (PredictOrbit points) or "steps" (Orbit2steps points)
+            -columns: dictionary with column names and arrays, converted to the dtypes
+            of the kind (arrays that already have them are not copied)
+            -start: start second of the pass in UNIX seconds (integer), origin of the Time column
+            -sat_name: satellite name
+            -latitude, longitude: observer's position
+            -sgp4_evaluations: amount of SGP4 evaluations used to compute the pass
+        '''
+        if kind not in DTYPES:
+            raise ValueError("unknown pass kind: "+str(kind))
+        self.kind = kind
+        self.columns = {name: _Typed(kind,name,values) for name,values in columns.items()}
+        lengths = {len(values) for values in self.columns.values()}
+        if len(lengths) > 1:
+            raise ValueError("pass columns have different lengths")
+        self.start = int(start)
+        self.sat_name = sat_name
+        self.latitude = latitude
+        self.longitude = longitude
+        self.sgp4_evaluations = sgp4_evaluations
+
+    def WithColumns(self,columns):
+        '''Brief: new pass with the same metadata and other columns'''
+        return PassData(self.kind,columns,self.start,self.sat_name,self.latitude,self.longitude,self.sgp4_evaluations)
+
+    def __len__(self):
+        return len(self.columns["Time"])
+
+    def __contains__(self,name):
+        return name in self.columns
+
+    def __getitem__(self,key):
+        '''Brief: pass["Column"] returns the column array, a slice returns a view of the
+        pass, a boolean mask or an index array returns a pass with those points (copied)'''
+        if isinstance(key,str):
+            return self.columns[key]
+        return self.WithColumns({name: values[key] for name,values in self.columns.items()})
+
+    def __repr__(self):
+        return "PassData(%s, %d points, start=%d, columns=%s)" % (self.kind,len(self),self.start,list(self.columns))
+
+    def keys(self):
+        return list(self.columns)
+
+    @property
+    def empty(self):
+        return len(self) == 0
+
+    @property
+    def nbytes(self):
+        '''Brief: memory used by the columns in bytes'''
+        return sum(values.nbytes for values in self.columns.values())
+
+    def Times(self):
+        '''Brief: returns the point times in UNIX seconds (float64)'''
+        return self.start+self.columns["Time"]/1000
+
+    def Window(self,t_start,t_end):
+        '''Brief: view of the points with UNIX times between t_start and t_end, both included
+        with millisecond resolution (without copying)'''
+        times = self.columns["Time"]
+        first = np.searchsorted(times,round((t_start-self.start)*1000),side="left")
+        last = np.searchsorted(times,math.floor((t_end-self.start)*1000),side="right")
+        return self[first:last]
+
+    def to_dataframe(self):
+        '''Brief: builds the dataframe the pipeline used before PassData: orbit passes with
+        Time in UNIX seconds, step passes with Time in milliseconds since start and the
+        orbit point of every step point as index (named "Index")
+        '''
+        columns = {name: values for name,values in self.columns.items() if name != "Index"}
+        if self.kind == "orbit":
+            columns["Time"] = np.round(self.Times(),3)
+            return pd.DataFrame(columns)
+        df = pd.DataFrame(columns,index=self.columns.get("Index"))
+        df.index.name = "Index"
+        return df
+
+
+def FromDataFrame(kind,df,sat_name=None,latitude=None,longitude=None):
+    '''Brief: builds a PassData from a dataframe with the columns of PassData.to_dataframe
+    (for example one built by an older version of the pipeline)
+    Parameters:
+        -kind: "orbit" or "steps"
+        -df: dataframe or dictionary of arrays
+        -sat_name: satellite name
+        -latitude, longitude: observer's position
+    Returns:
+        -PassData, for steps passes start is unknown (0) and Time is kept as it is
+    '''
+    columns = {name: np.asarray(df[name]) for name in DTYPES[kind] if name in df}
+    if kind == "orbit":
+        times = columns["Time"].astype(np.float64)
+        start = int(np.trunc(times[0])) if len(times) else 0
+        columns["Time"] = np.round((times-start)*1000).astype(np.int64)
+    else:
+        start = 0
+        if "Index" not in columns and isinstance(df,pd.DataFrame):
+            columns["Index"] = df.index.to_numpy()
+    return PassData(kind,columns,start,sat_name,latitude,longitude)
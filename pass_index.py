@@ -0,0 +1,149 @@
+from skyfield.api import load
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import datetime
+import pass_screening as ps
+import metrics as mt
+
+INDEX_HOURS = 48        #time span covered by the index
+SLICE_HOURS = 6         #hours screened at once, bounds memory usage of ScreenPasses
+COLUMNS = ["Name","Rise","Max Elevation","Duration"]
+
+
+def SatEpochs(TLEs):
+    '''Brief: returns a dictionary with satellite names and TLE epochs (julian dates)'''
+    return {name: sat.model.jdsatepoch+sat.model.jdsatepochF for name,sat in TLEs.items()}
+
+def _Screen(TLEs,my_lat,my_lon,start_unix,end_unix,min_elevation):
+    '''Brief: passes of TLEs rising between start_unix and end_unix, screened in SLICE_HOURS slices'''
+    ts = load.timescale()
+    found = [pd.DataFrame(columns=COLUMNS)]
+    for slice_start in np.arange(start_unix,end_unix,SLICE_HOURS*3600):
+        minutes = (min(slice_start+SLICE_HOURS*3600,end_unix)-slice_start)/60
+        t0 = ts.from_datetime(datetime.datetime.fromtimestamp(slice_start,datetime.timezone.utc))
+        passes = ps.ScreenPasses(TLEs,my_lat,my_lon,t0,minutes,min_elevation)
+        found.append(passes[passes["Rise"] < slice_start+minutes*60])
+    return pd.concat(found,ignore_index=True)
+
+def _Sorted(index,passes):
+    '''Brief: stores the passes in the index sorted by rise time, with the rise array used by the queries'''
+    passes = passes.sort_values(["Rise","Max Elevation"],ascending=[True,False],ignore_index=True)
+    index["passes"] = passes.astype({"Rise": float,"Max Elevation": float,"Duration": float})
+    index["rises"] = index["passes"]["Rise"].to_numpy()
+    index["max_elevations"] = index["passes"]["Max Elevation"].to_numpy()
+    return index
+
+def BuildPassIndex(TLEs,my_lat,my_lon,min_elevation,t0_unix=None,hours=INDEX_HOURS):
+    '''Brief: screens the whole catalog and stores every pass of the next hours for one station
+    Parameters:
+        -TLEs: dictionary with TLEs
+        -my_lat: observer's latitude
+        -my_lon: observer's longitude
+        -min_elevation: minimun elevation in degrees stored in the index, queries can ask
+        for higher elevations only
+        -t0_unix: start of the index in UNIX seconds, defaults to current time
+        -hours: time span covered by the index
+    Returns:
+        -index: dictionary with the station, its time span (start, end), the TLE epochs
+        used and the passes dataframe (Name, Rise, Max Elevation, Duration) sorted by rise
+    '''
+    if t0_unix is None:
+        t0_unix = load.timescale().now().utc_datetime().timestamp()
+    with mt.Stage("BuildPassIndex",satellites=len(TLEs)) as record:
+        index = {"latitude": my_lat, "longitude": my_lon, "min_elevation": min_elevation,
+                 "start": t0_unix, "end": t0_unix+hours*3600, "epochs": SatEpochs(TLEs)}
+        _Sorted(index,_Screen(TLEs,my_lat,my_lon,index["start"],index["end"],min_elevation))
+        record["passes"] = len(index["passes"])
+    return index
+
+def RefreshPassIndex(index,TLEs,t0_unix=None,hours=INDEX_HOURS):
+    '''Brief: updates an index with new TLEs and moves its time span forward. Only the
+    satellites whose TLE epoch changed (or that are new) are screened again over the whole
+    span, the rest are only screened over the part of the span that was not covered yet
+    Parameters:
+        -index: dictionary returned by BuildPassIndex, it is not modified so it can
+        still be queried while the refresh runs in the background
+        -TLEs: dictionary with TLEs
+        -t0_unix: new start of the index in UNIX seconds, defaults to current time
+        -hours: time span covered by the index
+    Returns:
+        -refreshed index
+    '''
+    if t0_unix is None:
+        t0_unix = load.timescale().now().utc_datetime().timestamp()
+    with mt.Stage("RefreshPassIndex",satellites=len(TLEs)) as record:
+        index = dict(index)
+        epochs = SatEpochs(TLEs)
+        changed = [name for name in TLEs if index["epochs"].get(name) != epochs[name]]
+        record["changed"] = len(changed)
+        passes = index["passes"]
+        #drop passes of satellites removed or changed, and passes that already started
+        passes = passes[passes["Name"].isin(TLEs) & ~passes["Name"].isin(changed) & (passes["Rise"] >= t0_unix)]
+
+        end = t0_unix+hours*3600
+        lat, lon, min_elevation = index["latitude"], index["longitude"], index["min_elevation"]
+        found = [passes]
+        if changed:
+            found.append(_Screen({name: TLEs[name] for name in changed},lat,lon,t0_unix,end,min_elevation))
+        if end > index["end"]:
+            changed_set = set(changed)
+            unchanged = {name: sat for name,sat in TLEs.items() if name not in changed_set}
+            found.append(_Screen(unchanged,lat,lon,max(index["end"],t0_unix),end,min_elevation))
+        index.update(start=t0_unix,end=end,epochs=epochs)
+        _Sorted(index,pd.concat(found,ignore_index=True))
+        record["passes"] = len(index["passes"])
+    return index
+
+def QueryPasses(index,t_start,t_end,min_elevation=None):
+    '''Brief: gets the passes rising between t_start and t_end with a binary search
+    Parameters:
+        -index: dictionary returned by BuildPassIndex
+        -t_start, t_end: UNIX seconds
+        -min_elevation: minimun maximum elevation of the passes in degrees
+    Returns:
+        -passes: dataframe sorted by rise time
+    '''
+    first, last = np.searchsorted(index["rises"],[t_start,t_end])
+    passes = index["passes"].iloc[first:last]
+    if min_elevation is not None:
+        passes = passes[passes["Max Elevation"] >= min_elevation]
+    return passes
+
+def QueryNextPass(index,t_after,min_elevation=None):
+    '''Brief: gets the first pass rising after t_after that surpasses min_elevation.
+    Rise times are the ones over the index min_elevation
+    Parameters:
+        -index: dictionary returned by BuildPassIndex
+        -t_after: UNIX seconds
+        -min_elevation: minimun maximum elevation of the pass in degrees, defaults to the index one
+    Returns:
+        -row of the passes dataframe (Name, Rise, Max Elevation, Duration), None if there is none in the index
+    '''
+    first = np.searchsorted(index["rises"],t_after)
+    if min_elevation is None or min_elevation <= index["min_elevation"]:
+        candidates = np.arange(first,len(index["rises"]))
+    else:
+        candidates = first+np.flatnonzero(index["max_elevations"][first:] >= min_elevation)
+    if len(candidates) == 0:
+        return None
+    return index["passes"].iloc[candidates[0]]
+
+def Covers(index,t_start,t_end,my_lat,my_lon,min_elevation):
+    '''Brief: returns True if a query between t_start and t_end can be answered by the index'''
+    return (index["latitude"] == my_lat and index["longitude"] == my_lon and min_elevation >= index["min_elevation"]
+            and index["start"] <= t_start and t_end <= index["end"])
+
+def StartPassIndex(TLEs,my_lat,my_lon,min_elevation,index=None,t0_unix=None,hours=INDEX_HOURS):
+    '''Brief: builds a pass index in the background, or refreshes index if it was built
+    for the same station and min_elevation
+    Returns:
+        -concurrent.futures.Future with the index returned by BuildPassIndex or RefreshPassIndex
+    '''
+    executor = ThreadPoolExecutor(max_workers=1)
+    if index is not None and (index["latitude"],index["longitude"],index["min_elevation"]) == (my_lat,my_lon,min_elevation):
+        future = executor.submit(RefreshPassIndex,index,TLEs,t0_unix,hours)
+    else:
+        future = executor.submit(BuildPassIndex,TLEs,my_lat,my_lon,min_elevation,t0_unix,hours)
+    executor.shutdown(wait=False)
+    return future
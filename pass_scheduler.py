@@ -0,0 +1,131 @@
+from skyfield.api import load, wgs84
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import orbit_prediction as op
+import tle_catalog as tc
+
+
+def _SatPasses(record,name,my_lat,my_lon,t0_unix,in_hours,min_elevation):
+    '''Brief: process pool worker, finds every complete pass of one satellite
+    Parameters:
+        -record: tc.SATREC_DTYPE element of the satellite (satellite objects can't be pickled)
+        -name: satellite name
+        -my_lat: observer's latitude
+        -my_lon: observer's longitude
+        -t0_unix: start of the search in UNIX seconds
+        -in_hours: amount of hours to look for passes
+        -min_elevation: minimun orbit elevation in degrees
+    Returns:
+        -list of (name, rise, culmination, set, max elevation) tuples, times in UNIX seconds
+    '''
+    ts = load.timescale()
+    sat = tc.SatFromRecord(record,name,ts)
+    t0 = ts.from_datetime(op.GetDatetimeFromUNIX(t0_unix))
+    t1 = op.AddTimeDelta(t0,in_hours*60*60)
+    bluffton = wgs84.latlon(my_lat,my_lon)
+    tx, events = sat.find_events(bluffton,t0,t1,altitude_degrees=min_elevation)
+    unix = [t.timestamp() for t in tx.utc_datetime()]
+
+    passes = []
+    for n in range(len(events)-2):
+        if events[n]==0 and events[n+1]==1 and events[n+2]==2:    #only complete passes: rise, culmination and set
+            max_elev = (sat-bluffton).at(tx[n+1]).altaz()[0].degrees
+            passes.append((name,unix[n],unix[n+1],unix[n+2],max_elev))
+    return passes
+
+def FindPasses(sats,my_lat,my_lon,in_hours=24,min_elevation=30,t0_unix=None,max_workers=None):
+    '''Brief: finds every pass above min_elevation of a list of satellites, spreading
+    the work of each satellite over a process pool.
+    On Windows the caller has to be protected by if __name__ == "__main__"
+    Parameters:
+        -sats: list of satellite objects
+        -my_lat: observer's latitude
+        -my_lon: observer's longitude
+        -in_hours: amount of hours to look for passes
+        -min_elevation: minimun orbit elevation in degrees
+        -t0_unix: start of the search in UNIX seconds, defaults to current time
+        -max_workers: amount of processes, defaults to amount of CPUs
+    Returns:
+        -passes: dataframe sorted by rise time with the following columns:
+            -Name: satellite name
+            -Rise: time when satellite surpasses min_elevation in UNIX seconds
+            -Culmination: time of maximum elevation in UNIX seconds
+            -Set: time when satellite falls below min_elevation in UNIX seconds
+            -Max Elevation: maximum elevation in degrees
+            -Duration: time above min_elevation in seconds
+    '''
+    if t0_unix is None:
+        t0_unix = load.timescale().now().utc_datetime().timestamp()
+    records = np.array([tc.SatrecRecord(sat.model) for sat in sats],dtype=tc.SATREC_DTYPE)
+    names = [sat.name for sat in sats]
+    n = len(sats)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(_SatPasses,records,names,[my_lat]*n,[my_lon]*n,
+                               [t0_unix]*n,[in_hours]*n,[min_elevation]*n)
+        rows = [row for sat_passes in results for row in sat_passes]
+
+    passes = pd.DataFrame(rows,columns=["Name","Rise","Culmination","Set","Max Elevation"])
+    passes["Duration"] = passes["Set"]-passes["Rise"]
+    return passes.sort_values("Rise",ignore_index=True)
+
+def ResolveConflicts(passes,priorities=None,min_gap_seconds=0):
+    '''Brief: selects a set of non overlapping passes. Passes are accepted by priority,
+    and passes with equal priority are accepted by maximum elevation
+    Parameters:
+        -passes: dataframe returned by FindPasses
+        -priorities: dictionary with satellite names and priorities (higher first),
+        satellites not in it have priority 0
+        -min_gap_seconds: minimun time between two passes (i.e. time needed to reposition the antenna)
+    Returns:
+        -timeline: passes dataframe containing only the accepted passes sorted by rise time,
+        with an extra Priority column
+    '''
+    if priorities is None:
+        priorities = {}
+    candidates = passes.assign(Priority=[priorities.get(name,0) for name in passes["Name"]])
+    candidates = candidates.sort_values(["Priority","Max Elevation"],ascending=False)
+
+    accepted_rise, accepted_set, accepted_index = [], [], []
+    for ind, rise, set_time in zip(candidates.index,candidates["Rise"],candidates["Set"]):
+        start, end = rise-min_gap_seconds, set_time+min_gap_seconds
+        if any(start < other_set and other_rise < end for other_rise,other_set in zip(accepted_rise,accepted_set)):
+            continue    #overlaps with a pass that was already accepted
+        accepted_rise.append(rise)
+        accepted_set.append(set_time)
+        accepted_index.append(ind)
+    return candidates.loc[accepted_index].sort_values("Rise",ignore_index=True)
+
+def SchedulePasses(sats,my_lat,my_lon,in_hours=24,min_elevation=30,priorities=None,min_gap_seconds=0,t0_unix=None,max_workers=None):
+    '''Brief: plans the contacts of a ground station for a watchlist of satellites
+    Parameters:
+        -sats: list of satellite objects
+        -my_lat: observer's latitude
+        -my_lon: observer's longitude
+        -in_hours: planning horizon in hours
+        -min_elevation: minimun orbit elevation in degrees
+        -priorities: dictionary with satellite names and priorities (higher first)
+        -min_gap_seconds: minimun time between two passes
+        -t0_unix: start of the planning in UNIX seconds, defaults to current time
+        -max_workers: amount of processes, defaults to amount of CPUs
+    Returns:
+        -timeline: dataframe of non conflicting passes (see ResolveConflicts)
+    '''
+    passes = FindPasses(sats,my_lat,my_lon,in_hours,min_elevation,t0_unix,max_workers)
+    return ResolveConflicts(passes,priorities,min_gap_seconds)
+
+def PredictScheduledPass(timeline_row,sat,my_lat,my_lon,time_delta):
+    '''Brief: calculates the orbit of a scheduled pass, ready to be fed to Orbit2steps
+    Parameters:
+        -timeline_row: row of the dataframe returned by SchedulePasses
+        -sat: satellite object of that pass
+        -my_lat: observer's latitude
+        -my_lon: observer's longitude
+        -time_delta: time interval between each calculated point in seconds
+    Returns:
+        -pass returned by PredictOrbit
+    '''
+    ts = load.timescale()
+    t_rise = ts.from_datetime(op.GetDatetimeFromUNIX(timeline_row["Rise"]))
+    return op.PredictOrbit(sat,my_lat,my_lon,t_rise,timeline_row["Duration"],time_delta)
@@ -0,0 +1,121 @@
+from sgp4.api import SatrecArray
+import numpy as np
+import pandas as pd
+import metrics as mt
+import ephemeris as eph
+
+EARTH_RADIUS_KM = 6378.135  #WGS72 equatorial radius, the one used by SGP4
+PASS_MARGIN_MINUTES = 25    #extra propagation time so passes rising at the end of the search window can finish
+CHUNK_SIZE = 500            #satellites propagated together, bounds memory usage
+
+
+def MaxGroundAngle(height_km,min_elevation):
+    '''Brief: Calculates the maximum central angle between observer and sub-satellite
+    point that still allows seeing the satellite above min_elevation
+    Parameters:
+        -height_km: satellite height in km (scalar or array)
+        -min_elevation: minimun elevation in degrees
+    Returns:
+        -central angle in degrees
+    '''
+    elev = np.radians(min_elevation)
+    ratio = np.clip(EARTH_RADIUS_KM*np.cos(elev)/(EARTH_RADIUS_KM+np.maximum(height_km,0)),-1,1)
+    return np.degrees(np.arccos(ratio)-elev)
+
+def CanBeSeen(satrecs,my_lat,min_elevation):
+    '''Brief: Discards satellites that can never surpass min_elevation from the observer's
+    latitude. A satellite never goes further from the equator than its inclination,
+    and at its apogee it can be seen from the farthest ground distance
+    Parameters:
+        -satrecs: list of sgp4 satrec objects
+        -my_lat: observer's latitude
+        -min_elevation: minimun elevation in degrees
+    Returns:
+        -boolean array, True for satellites that may be seen
+    '''
+    inclination = np.degrees([satrec.inclo for satrec in satrecs])
+    inclination = np.minimum(inclination,180-inclination)    #retrograde orbits reach the same latitudes
+    apogee_km = np.array([satrec.alta for satrec in satrecs])*EARTH_RADIUS_KM
+    max_angle = MaxGroundAngle(apogee_km,min_elevation)
+    return abs(my_lat) <= inclination+max_angle+1   #1 degree margin for geodetic vs geocentric latitude
+
+def ElevationGrid(satrecs,my_lat,my_lon,t):
+    '''Brief: Calculates the elevation of many satellites over a common time grid
+    with a single SGP4 call
+    Parameters:
+        -satrecs: list of sgp4 satrec objects
+        -my_lat: observer's latitude
+        -my_lon: observer's longitude
+        -t: skyfield.timelib.Time array
+    Returns:
+        -elev: array (satellites, times) with elevations in degrees, NaN where SGP4 failed
+    '''
+    jd, fraction, theta, _ = eph.SGP4Time(t)
+    jd, fraction = np.broadcast_arrays(jd,fraction)
+    error, r, _ = SatrecArray(satrecs).sgp4(np.ascontiguousarray(jd,dtype=float),np.ascontiguousarray(fraction,dtype=float))   #TEME positions in km, shape (satellites, times, 3)
+    elev = eph.Elevation(eph.EarthFixedFromTEME(r,theta),eph.ObserverFrame(my_lat,my_lon))
+    elev[error!=0] = np.nan
+    return elev
+
+def CrossingOffset(offsets,elev,i,min_elevation):
+    '''Brief: interpolates the time where elevation crosses min_elevation between samples i-1 and i'''
+    e0, e1 = elev[i-1], elev[i]
+    return offsets[i-1]+(offsets[i]-offsets[i-1])*(min_elevation-e0)/(e1-e0)
+
+def ScreenPasses(TLEs,my_lat,my_lon,t0,search_minutes,min_elevation,step_seconds=10,rank_by="Rise"):
+    '''Brief: Looks for passes of every satellite of a TLE dictionary that rise above
+    min_elevation between t0 and t0+search_minutes. The whole catalog is propagated
+    at once over a shared time grid
+    Parameters:
+        -TLEs: dictionary with TLEs
+        -my_lat: observer's latitude
+        -my_lon: observer's longitude
+        -t0: skyfield.timelib.Time object, start of the search
+        -search_minutes: time in minutes where a pass has to rise
+        -min_elevation: minimun orbit elevation in degrees
+        -step_seconds: time grid resolution in seconds
+        -rank_by: "Rise" ranks soonest passes first, "Max Elevation" ranks highest passes first
+    Returns:
+        -passes: dataframe with one row per pass and the following columns:
+            -Name: satellite name (key of TLEs)
+            -Rise: time when satellite surpasses min_elevation in UNIX seconds
+            -Max Elevation: maximum elevation in degrees
+            -Duration: time above min_elevation in seconds
+    '''
+    with mt.Stage("ScreenPasses",satellites=len(TLEs)) as record:
+        names = list(TLEs.keys())
+        satrecs = [TLEs[name].model for name in names]
+        visible = np.flatnonzero(CanBeSeen(satrecs,my_lat,min_elevation))
+        record["candidates"] = len(visible)
+
+        offsets = np.arange(0,(search_minutes+PASS_MARGIN_MINUTES)*60+step_seconds,step_seconds,dtype=float)
+        t = t0.ts.tt_jd(t0.whole,t0.tt_fraction+offsets/86400.0)    #shared time grid
+        t0_unix = t0.utc_datetime().timestamp()
+        search_end = search_minutes*60
+        record["sgp4_evaluations"] = len(visible)*len(offsets)
+
+        rows = []
+        for chunk_start in range(0,len(visible),CHUNK_SIZE):
+            chunk = visible[chunk_start:chunk_start+CHUNK_SIZE]
+            elev = ElevationGrid([satrecs[i] for i in chunk],my_lat,my_lon,t)
+            above = elev >= min_elevation   #NaN compares False
+            rises = above[:,1:] & ~above[:,:-1]    #sample where the satellite surpasses min_elevation
+            for sat_row, sample in zip(*np.nonzero(rises)):
+                sample += 1
+                if offsets[sample-1] >= search_end:
+                    continue
+                sat_elev = elev[sat_row]
+                rise = CrossingOffset(offsets,sat_elev,sample,min_elevation)
+                below = np.flatnonzero(~above[sat_row,sample:])
+                if len(below):
+                    set_sample = sample+below[0]
+                    set_time = CrossingOffset(offsets,sat_elev,set_sample,min_elevation)
+                else:
+                    set_sample = len(offsets)   #pass doesn't finish inside the grid
+                    set_time = offsets[-1]
+                rows.append((names[chunk[sat_row]],t0_unix+rise,np.nanmax(sat_elev[sample:set_sample]),set_time-rise))
+        record["passes"] = len(rows)
+
+    passes = pd.DataFrame(rows,columns=["Name","Rise","Max Elevation","Duration"])
+    ascending = rank_by != "Max Elevation"
+    return passes.sort_values(rank_by,ascending=ascending,ignore_index=True)
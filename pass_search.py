@@ -0,0 +1,168 @@
+import numpy as np
+import pass_screening as ps
+import ephemeris as eph
+
+MIN_STEP = 20               #seconds, step used next to the visibility region
+PRECISION = 0.001           #seconds, precision of rise, culmination and set times
+EARTH_ROTATION = 360/86164.0905     #degrees per second
+GOLDEN = (np.sqrt(5)-1)/2
+
+#Search: the satellite can only be above min_elevation while the central angle between
+#the observer and the satellite is below MaxGroundAngle at apogee height. That angle
+#changes at most at the orbital angular rate (from the TLE mean motion, at perigee) plus
+#the Earth rotation, so from any sample the search can jump ahead the time the satellite
+#needs to reach the visibility region, without missing a pass (and inside it, the time
+#it needs to leave it). Rise, culmination and set
+#are then refined with golden section and bisection only inside the candidate windows.
+#Every evaluation is a single SGP4 call on the satrec, rotated to Earth fixed coordinates
+#with the ephemeris helpers like pass_screening.ElevationGrid, skyfield Time objects are
+#built only once per search.
+
+
+def _Propagator(sat,t0):
+    '''Brief: returns a function giving the Earth fixed (ITRS) position in km of sat at an
+    offset in seconds from t0, and a counter of the SGP4 evaluations done
+    '''
+    jd, fraction, theta0, theta_dot = eph.SGP4Time(t0)    #sidereal angle, linear over the search
+    jd, fraction = float(jd), float(fraction)
+    evaluations = [0]
+
+    def Position(offset):
+        evaluations[0] += 1
+        _, r, _ = sat.model.sgp4(jd,fraction+offset/86400.0)
+        return eph.EarthFixedFromTEME(r,theta0+theta_dot*offset/86400.0)
+    return Position, evaluations
+
+def MaxAngularRate(sat):
+    '''Brief: maximum rate of the central angle between observer and satellite in degrees per second'''
+    n = np.degrees(sat.model.no_kozai)/60   #mean motion in degrees per second
+    e = sat.model.ecco
+    return n*(1+e)**2/(1-e**2)**1.5+EARTH_ROTATION
+
+def OrbitalPeriod(sat):
+    '''Brief: orbital period from the TLE mean motion in seconds'''
+    return 2*np.pi/sat.model.no_kozai*60
+
+def CandidateWindows(sat,my_lat,my_lon,t0,search_seconds,min_elevation):
+    '''Brief: finds the time windows where the satellite may be above min_elevation, jumping
+    over the rest of the orbit
+    Parameters:
+        -sat: satellite object
+        -my_lat: observer's latitude
+        -my_lon: observer's longitude
+        -t0: skyfield.timelib.Time object, start of the search
+        -search_seconds: windows have to start before t0+search_seconds
+        -min_elevation: minimun elevation in degrees
+    Returns:
+        -windows: list of (start, end) offsets from t0 in seconds, the satellite is below
+        min_elevation at both ends (except at t0)
+        -evaluations: amount of SGP4 evaluations used
+        (windows is None if the satellite never leaves the visibility region, e.g. high orbits)
+    '''
+    observer = eph.ObserverFrame(my_lat,my_lon)["position"]
+    observer = observer/np.linalg.norm(observer)
+    apogee_km = sat.model.alta*ps.EARTH_RADIUS_KM
+    max_angle = ps.MaxGroundAngle(apogee_km,min_elevation)+1  #1 degree margin for geodetic vs geocentric latitude
+    rate = MaxAngularRate(sat)
+    near = rate*MIN_STEP    #closer than this the search moves in MIN_STEP steps
+
+    Position, evaluations = _Propagator(sat,t0)
+
+    def Margin(offset):
+        position = Position(offset)
+        angle = np.degrees(np.arccos(np.clip(observer@position/np.linalg.norm(position),-1,1)))
+        return angle-max_angle
+
+    windows = []
+    offset, window_start = 0.0, None
+    while offset < search_seconds or window_start is not None:
+        margin = Margin(offset)
+        if margin < near:
+            if window_start is None:
+                window_start = offset
+            elif offset-window_start > OrbitalPeriod(sat)/2:
+                return None, evaluations[0]
+            offset += max(MIN_STEP,(near-margin)/rate)    #time needed to leave the region
+        else:
+            if window_start is not None:
+                windows.append((max(window_start-MIN_STEP,0.0),offset))
+                window_start = None
+            offset += margin/rate
+    return windows, evaluations[0]
+
+def RefinePass(sat,my_lat,my_lon,t0,start,end,min_elevation):
+    '''Brief: finds rise, culmination and set of a pass inside a candidate window
+    Parameters:
+        -sat: satellite object
+        -my_lat: observer's latitude
+        -my_lon: observer's longitude
+        -t0: skyfield.timelib.Time object, origin of the offsets
+        -start, end: window offsets in seconds
+        -min_elevation: minimun elevation in degrees
+    Returns:
+        -(rise, culmination, set, max elevation) with offsets in seconds, None if the
+        satellite doesn't surpass min_elevation in the window
+        -evaluations: amount of SGP4 evaluations used
+    '''
+    Position, evaluations = _Propagator(sat,t0)
+    frame = eph.ObserverFrame(my_lat,my_lon)
+
+    def Elevation(offset):
+        return eph.Elevation(Position(offset),frame)
+
+    #culmination: golden section search, elevation has a single maximum in the window
+    a, b = start, end
+    c, d = b-GOLDEN*(b-a), a+GOLDEN*(b-a)
+    fc, fd = Elevation(c), Elevation(d)
+    while b-a > PRECISION:
+        if fc > fd:
+            b, d, fd = d, c, fc
+            c = b-GOLDEN*(b-a)
+            fc = Elevation(c)
+        else:
+            a, c, fc = c, d, fd
+            d = a+GOLDEN*(b-a)
+            fd = Elevation(d)
+    culmination, max_elevation = (c, fc) if fc > fd else (d, fd)
+    if max_elevation < min_elevation:
+        return None, evaluations[0]
+
+    #rise and set: bisection of the min_elevation crossing on each side
+    def Crossing(below,above):
+        while abs(above-below) > PRECISION:
+            middle = (below+above)/2
+            if Elevation(middle) >= min_elevation:
+                above = middle
+            else:
+                below = middle
+        return above
+
+    rise = Crossing(start,culmination)
+    set_time = Crossing(end,culmination)
+    return (rise,culmination,set_time,max_elevation), evaluations[0]
+
+def NextPass(sat,my_lat,my_lon,t0,in_hours=48,min_elevation=30):
+    '''Brief: finds the next pass of a satellite that surpasses min_elevation, a pass that
+    is already above min_elevation at t0 is skipped
+    Parameters:
+        -sat: satellite object
+        -my_lat: observer's latitude
+        -my_lon: observer's longitude
+        -t0: skyfield.timelib.Time object, start of the search
+        -in_hours: amount of hours to look for a pass
+        -min_elevation: minimun elevation in degrees
+    Returns:
+        -(rise, culmination, set, max elevation) with offsets from t0 in seconds, None if there is no pass
+        -evaluations: amount of SGP4 evaluations used, None if the orbit can't be
+        searched this way (the satellite never leaves the visibility region)
+    '''
+    windows, evaluations = CandidateWindows(sat,my_lat,my_lon,t0,in_hours*3600,min_elevation)
+    if windows is None:
+        return None, None
+    for start, end in windows:
+        found, refine_evaluations = RefinePass(sat,my_lat,my_lon,t0,start,end,min_elevation)
+        evaluations += refine_evaluations
+        if found is not None and found[0]-start > PRECISION:
+            return found, evaluations
+        #a rise at the window start is a pass already in progress at t0
+    return None, evaluations
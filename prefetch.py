@@ -0,0 +1,78 @@
+from concurrent.futures import Future
+import threading
+
+#Background warm up of labosat_track_UI: this module only imports the standard library,
+#skyfield, pandas, tqdm and serial are imported by the worker thread while the menu is
+#already shown. The worker runs one step after the other (modules, catalog, next pass,
+#pass index) and every step has its own future, so a menu option only waits for the
+#steps it needs, and usually finds them already done. Options that compute a pass only
+#wait for the catalog, tle_catalog and pass_cache are safe to use while the worker
+#computes the next pass. Option 3 takes the next pass if it is ready and searches
+#otherwise. The worker is a daemon thread, exiting the UI doesn't wait for it.
+
+STEPS = ["modules","TLEs","next_pass","index"]   #prefetch steps, in execution order
+
+
+def _ImportModules():
+    '''Brief: imports the modules used by the UI, returns them in a dictionary'''
+    import orbit_prediction as op
+    import LabosaTrack as lst
+    import pass_archive as pa
+    import pass_index as pidx
+    import serial_async as sa
+    import serial
+    return {"op": op, "lst": lst, "pa": pa, "pidx": pidx, "sa": sa, "serial": serial}
+
+def _NextPass(modules,TLEs,my_lat,my_lon,time_delta,elevation_start,az_resolution,elev_resolution,min_elevation,t_start_offset):
+    '''Brief: finds the next pass of the catalog and computes it like option 3 of the UI, the
+    result stays in pass_cache so the UI gets it without computing it again
+    Returns:
+        -sat: satellite object
+        -values returned by LabosaTrack.TrackPass
+    '''
+    sat = modules["op"].NextSatPass(TLEs,my_lat,my_lon,t_start_offset,min_elevation)
+    return sat, modules["lst"].TrackPass(my_lat,my_lon,sat.name,time_delta,elevation_start,az_resolution,elev_resolution,sat)
+
+def _Worker(futures,steps):
+    '''Brief: runs the prefetch steps in order, a failing step only fails the steps that need it'''
+    for step in STEPS:
+        futures[step].set_running_or_notify_cancel()
+        try:
+            futures[step].set_result(steps[step]())
+        except Exception as e:
+            futures[step].set_exception(e)
+
+def StartPrefetch(my_lat,my_lon,time_delta,elevation_start,az_resolution,elev_resolution,min_elevation=70,t_start_offset=10):
+    '''Brief: starts the background warm up of the UI for one station
+    Parameters:
+        -my_lat: observer's latitude
+        -my_lon: observer's longitude
+        -time_delta: time between points
+        -elevation_start: elevation angle to start calculating orbit
+        -az_resolution: azimutal angle [°] per step
+        -elev_resolution: elevation angle [°] per step
+        -min_elevation: minimun elevation in degrees of the pass index and the next pass
+        -t_start_offset: minutes from now where the next pass search starts (see NextSatPass)
+    Returns:
+        -dictionary of concurrent.futures.Future objects, done in this order:
+            -modules: dictionary with the imported modules (op, lst, pa, pidx, sa, serial)
+            -TLEs: dictionary with the local TLE catalog, downloaded only if it is outdated
+            -next_pass: (satellite, TrackPass values) of the next pass above min_elevation
+            -index: pass index of the station returned by BuildPassIndex
+    '''
+    futures = {step: Future() for step in STEPS}
+    modules = lambda: futures["modules"].result()
+    steps = {"modules": _ImportModules,
+             "TLEs": lambda: modules()["op"].DownloadTLEs(),
+             "next_pass": lambda: _NextPass(modules(),futures["TLEs"].result(),my_lat,my_lon,time_delta,elevation_start,
+                                      az_resolution,elev_resolution,min_elevation,t_start_offset),
+             "index": lambda: modules()["pidx"].BuildPassIndex(futures["TLEs"].result(),my_lat,my_lon,min_elevation)}
+    threading.Thread(target=_Worker,args=(futures,steps),daemon=True).start()
+    return futures
+
+def Ready(futures,step):
+    '''Brief: returns the result of a prefetch step if it finished without errors, None otherwise'''
+    future = futures.get(step) if futures is not None else None
+    if future is None or not future.done() or future.exception() is not None:
+        return None
+    return future.result()
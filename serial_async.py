@@ -0,0 +1,76 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import serial_transfer as st
+import metrics as mt
+
+
+async def SendPassAsync(serial_device,points,start_data,ack_timeout=st.ACK_TIMEOUT,verbose=True,label=None):
+    '''Brief: asyncio version of serial_transfer.SendPass. It runs the same protocol state
+    machine (serial_transfer.Handshake) as a coroutine: every blocking serial operation runs
+    in a worker thread, so the event loop keeps running during the transfer and several
+    controllers can receive their passes concurrently
+    Parameters:
+        -serial_device: serial object (pyserial Serial, serial_for_url, a pty or any
+        object with write and read methods)
+        -points: packed points returned by CompressOrbitData
+        -start_data: list contaning values returned by Orbit2Steps
+        -ack_timeout: maximum time to wait for each acknowledge in seconds
+        -verbose: print transfer progress (see also metrics.SetQuiet)
+        -label: text printed before every progress line, to tell controllers apart
+    Returns:
+        -stats: same as serial_transfer.SendPass
+    '''
+    def Log(*args):
+        if verbose:
+            mt.Log(*args) if label is None else mt.Log(label+":",*args)
+
+    with mt.Stage("SerialSend",points=len(points),bytes=0,block_latency=[]) as stats:
+        steps = st.Handshake(points,start_data,stats,Log)
+        result = None
+        while True:
+            try:
+                action = steps.send(result)
+            except StopIteration:
+                break
+            if action[0] == "write":
+                result = await asyncio.to_thread(serial_device.write,action[1])
+            elif action[0] == "ack":
+                result = await asyncio.to_thread(st.WaitAck,serial_device,ack_timeout)
+            elif action[0] == "time":
+                result = await asyncio.to_thread(st.SendTime,serial_device)
+            else:
+                result = await asyncio.to_thread(serial_device.read,1)
+        if label is not None:
+            stats["label"] = label
+
+    st.ReportStatus(stats,Log)
+    return stats
+
+async def SendPassesAsync(transfers,ack_timeout=st.ACK_TIMEOUT,verbose=True):
+    '''Brief: sends passes to several controllers concurrently
+    Parameters:
+        -transfers: dictionary with controller names and (serial_device, points, start_data) tuples
+        -ack_timeout: maximum time to wait for each acknowledge in seconds
+        -verbose: print transfer progress
+    Returns:
+        -dictionary with controller names and their stats, or the exception raised by
+        their transfer (a failing controller doesn't stop the others)
+    '''
+    names = list(transfers)
+    results = await asyncio.gather(*[SendPassAsync(*transfers[name],ack_timeout=ack_timeout,verbose=verbose,label=str(name))
+                                     for name in names],return_exceptions=True)
+    return dict(zip(names,results))
+
+def SendPasses(transfers,ack_timeout=st.ACK_TIMEOUT,verbose=True):
+    '''Brief: blocking entry point of SendPassesAsync, for code without an event loop'''
+    return asyncio.run(SendPassesAsync(transfers,ack_timeout,verbose))
+
+def StartTransfer(serial_device,points,start_data,ack_timeout=st.ACK_TIMEOUT,verbose=True):
+    '''Brief: sends a pass in the background, the caller isn't blocked during the transfer
+    Returns:
+        -concurrent.futures.Future with the stats of the transfer (see SendPass)
+    '''
+    executor = ThreadPoolExecutor(max_workers=1)
+    future = executor.submit(asyncio.run,SendPassAsync(serial_device,points,start_data,ack_timeout,verbose))
+    executor.shutdown(wait=False)
+    return future
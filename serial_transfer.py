@@ -0,0 +1,188 @@
+import numpy as np
+import time, math, datetime
+import metrics as mt
+
+ACK = b'\x01'           #byte sent by the microcontroller to ask for the next data
+EEPROM_OK = b'\x01'     #points stored in EEPROM
+EEPROM_ERROR = b'\x02'  #points couldn't be stored in EEPROM
+BLOCK_POINTS = 1000     #the microcontroller acknowledges every BLOCK_POINTS points
+ACK_TIMEOUT = 20        #seconds to wait for an acknowledge before giving up
+SPIN_SECONDS = 0.002    #time before the second boundary spent busy waiting for precision
+
+
+def WaitAck(serial_device,timeout=ACK_TIMEOUT):
+    '''Brief: waits until the microcontroller sends an acknowledge, other bytes are discarded
+    Parameters:
+        -serial_device: serial object
+        -timeout: maximum time to wait in seconds
+    Returns:
+        -time waited in seconds
+    '''
+    start = time.perf_counter()
+    deadline = start+timeout
+    while serial_device.read(1) != ACK:
+        if time.perf_counter() > deadline:
+            raise TimeoutError("no acknowledge received from microcontroller in "+str(timeout)+" seconds")
+    return time.perf_counter()-start
+
+def WaitNextSecond():
+    '''Brief: sleeps until the next UNIX second boundary, only the last SPIN_SECONDS
+    are spent busy waiting
+    Returns:
+        -the UNIX second that just started
+    '''
+    target = math.trunc(time.time())+1
+    remaining = target-time.time()-SPIN_SECONDS
+    if remaining > 0:
+        time.sleep(remaining)
+    while time.time() < target:
+        pass
+    return target
+
+def PackInt(value):
+    '''Brief: converts a value to the 4 bytes big endian representation used by the protocol'''
+    return int(value).to_bytes(4,"big")
+
+def PackAtoi(value,data_size):
+    '''Brief: converts a value to a zero padded ascii string of data_size bytes,
+    used for values with a possible negative sign'''
+    tx = str(value).encode()
+    return tx+bytes(data_size-len(tx))
+
+def PointBlocks(points):
+    '''Brief: splits the packed points in the blocks sent between acknowledges.
+    The microcontroller acknowledges before the 1000th point and every 1000 points after that
+    Parameters:
+        -points: packed points returned by CompressOrbitData
+    Returns:
+        -list of memoryview slices of the points buffer, no data is copied
+    '''
+    buffer = memoryview(np.ascontiguousarray(points,dtype=">u4")).cast("B")
+    bounds = [0]+list(range(BLOCK_POINTS-1,len(points),BLOCK_POINTS))+[len(points)]
+    return [buffer[4*start:4*end] for start,end in zip(bounds[:-1],bounds[1:])]
+
+def SendTime(serial_device):
+    '''Brief: sends the current time exactly at the start of a second
+    Returns:
+        -the UNIX second sent
+    '''
+    t = WaitNextSecond()
+    serial_device.write(PackInt(t))
+    return t
+
+def Handshake(points,start_data,stats,Log):
+    '''Brief: protocol state machine shared by the blocking and the asyncio transports.
+    It is a generator that yields the serial operations to make and receives their results:
+        -("write", data): write data, receives None
+        -("ack",): wait for an acknowledge, receives the time waited in seconds
+        -("time",): send the current time at the start of a second (SendTime), receives the time sent
+        -("status",): read the EEPROM status byte, receives it
+    Parameters:
+        -points: packed points returned by CompressOrbitData
+        -start_data: list contaning values returned by Orbit2Steps
+        -stats: record of the transfer, bytes, block_latency and points_seconds are filled
+        -Log: function used to print progress
+    '''
+    def Write(data):
+        stats["bytes"] += len(data)
+        return ("write",data)
+
+    Log("Starting serial transfer:")
+    yield Write(ACK)
+    yield ("ack",)
+    # current time, sent exactly at the start of a second
+    Log("Sending data:")
+    t = yield ("time",)
+    stats["bytes"] += 4
+    Log("current time:",t, datetime.datetime.fromtimestamp(t,datetime.timezone.utc))
+
+    #Send alarm time
+    yield ("ack",)
+    yield Write(PackInt(start_data[0]))
+    Log("alarm time:",start_data[0], datetime.datetime.fromtimestamp(start_data[0],datetime.timezone.utc))
+
+    #Send amount of points, elevation start angle and elevation direction change
+    yield ("ack",)
+    Log("amount of points: ",start_data[1])
+    Log("elevation start angle: ",start_data[4])
+    Log("elevation direction change: ",start_data[5])
+    yield Write(PackInt(start_data[1])+PackInt(start_data[4])+PackInt(start_data[5]))
+
+    #Send azimuth direction and start angle, as chars because of their possible negative sign
+    yield ("ack",)
+    Log("azimut direction ",start_data[2])
+    Log("azimuth start angle: ",start_data[3])
+    yield Write(PackAtoi(start_data[2],4)+PackAtoi(start_data[3],7))
+
+    #send points, one write per block
+    yield ("ack",)
+    points_start = time.perf_counter()
+    blocks = PointBlocks(points)
+    sent = 0
+    for i, block in enumerate(blocks):
+        if i > 0:
+            stats["block_latency"].append((yield ("ack",)))
+        yield Write(block)
+        sent += len(block)//4
+        if i < len(blocks)-1:
+            Log("points send:", sent+1, "/",start_data[1])
+    points_seconds = time.perf_counter()-points_start
+    Log("points send:", start_data[1], "/",start_data[1])
+
+    stats["eeprom_status"] = yield ("status",)
+    stats["points_seconds"] = points_seconds
+    stats["bytes_per_second"] = 4*len(points)/points_seconds if points_seconds > 0 else float("inf")
+
+def ReportStatus(stats,Log):
+    '''Brief: prints the result of a transfer'''
+    if stats["eeprom_status"] == EEPROM_OK:
+        Log("Data stored in EEPROM succesfully")
+    elif stats["eeprom_status"] == EEPROM_ERROR:
+        Log("Data could not be stored in EEPROM, maybe EEPROM is disconnected or corrupted?")
+    else:
+        Log("unknown sequence reached, debug needed")
+    Log("points throughput:", round(stats["bytes_per_second"]), "bytes/s")
+
+def SendPass(serial_device,points,start_data,ack_timeout=ACK_TIMEOUT,verbose=True):
+    '''Brief: sends a pass to the microcontroller, one bulk write per acknowledged block
+    Parameters:
+        -serial_device: serial object (pyserial Serial, serial_for_url or any object
+        with write and read methods)
+        -points: packed points returned by CompressOrbitData
+        -start_data: list contaning values returned by Orbit2Steps
+        -ack_timeout: maximum time to wait for each acknowledge in seconds
+        -verbose: print transfer progress (see also metrics.SetQuiet)
+    Returns:
+        -stats: dictionary with the following keys, also sent to the metrics hooks
+        as the record of the "SerialSend" stage:
+            -points: amount of points sent
+            -bytes: amount of bytes sent
+            -seconds: total transfer time in seconds
+            -points_seconds: time spent sending points in seconds
+            -bytes_per_second: points throughput
+            -block_latency: list with the time waited for the acknowledge of each block
+            -eeprom_status: byte answered by the microcontroller after the transfer
+    '''
+    def Log(*args):
+        if verbose:
+            mt.Log(*args)
+
+    with mt.Stage("SerialSend",points=len(points),bytes=0,block_latency=[]) as stats:
+        steps = Handshake(points,start_data,stats,Log)
+        result = None
+        while True:
+            try:
+                action = steps.send(result)
+            except StopIteration:
+                break
+            if action[0] == "write":
+                result = serial_device.write(action[1])
+            elif action[0] == "ack":
+                result = WaitAck(serial_device,ack_timeout)
+            elif action[0] == "time":
+                result = SendTime(serial_device)
+            else:
+                result = serial_device.read(1)
+
+    ReportStatus(stats,Log)
+    return stats
@@ -0,0 +1,139 @@
+import numpy as np
+
+#Encoded step stream (optional alternative to the 32 bit points of CompressOrbitData):
+#points are grouped in runs of consecutive points with the same time delta and the
+#same (Az steps, Elev steps) tuple, and every run is written as
+#   varint(delta << 1 | repeated)   time since the previous point in milliseconds,
+#                                   the first point is relative to the orbit start
+#   byte(Az steps << 4 | Elev steps)
+#   varint(count - 2)               only if repeated is 1, amount of points of the run
+#varints are little endian base 128: 7 bits per byte, the high bit set on every byte but the last
+
+UART_BITS_PER_BYTE = 10     #start bit + 8 data bits + stop bit
+BAUDRATE = 115200           #SerialSend baudrate
+
+
+def VarintLengths(values):
+    '''Brief: returns the amount of bytes of the varint of each value'''
+    values = np.asarray(values,dtype=np.uint64)
+    lengths = np.ones(len(values),dtype=np.int64)
+    for shift in range(7,64,7):
+        lengths += values >= np.uint64(1) << np.uint64(shift)
+    return lengths
+
+def _PutVarints(out,positions,values,lengths):
+    '''Brief: writes the varint of each value in out starting at its position'''
+    values = np.asarray(values,dtype=np.uint64)
+    for byte in range(int(lengths.max()) if len(lengths) else 0):
+        write = lengths > byte
+        chunk = (values[write] >> np.uint64(7*byte)) & np.uint64(0x7F)
+        more = (lengths[write] > byte+1).astype(np.uint64) << np.uint64(7)
+        out[positions[write]+byte] = chunk | more
+
+def EncodeSteps(times,az_steps,elev_steps):
+    '''Brief: encodes point times and steps with time deltas and run lengths
+    Parameters:
+        -times: array of point times in milliseconds (increasing)
+        -az_steps: array of azimuth steps of each point (0 to 15)
+        -elev_steps: array of elevation steps of each point (0 to 15)
+    Returns:
+        -encoded stream as a uint8 array
+    '''
+    times = np.asarray(times,dtype=np.int64)
+    az_steps = np.asarray(az_steps,dtype=np.int64)
+    elev_steps = np.asarray(elev_steps,dtype=np.int64)
+    if len(times) == 0:
+        return np.zeros(0,dtype=np.uint8)
+    deltas = np.diff(times,prepend=0)
+    if (deltas < 0).any():
+        raise ValueError("point times must be increasing")
+    #each field is checked on its own, an elevation count above 15 would carry into the azimuth bits
+    if ((az_steps < 0) | (az_steps > 15)).any() or ((elev_steps < 0) | (elev_steps > 15)).any():
+        raise ValueError("point steps don't fit in 4 bits (0 to 15 steps)")
+    steps = az_steps << 4 | elev_steps
+
+    #runs of consecutive points with the same delta and steps
+    starts = np.flatnonzero(np.concatenate(([True],(deltas[1:] != deltas[:-1]) | (steps[1:] != steps[:-1]))))
+    counts = np.diff(np.append(starts,len(times)))
+    repeated = counts > 1
+
+    heads = (deltas[starts] << 1 | repeated).astype(np.uint64)
+    head_lengths = VarintLengths(heads)
+    count_lengths = np.where(repeated,VarintLengths(np.maximum(counts-2,0)),0)
+    positions = np.concatenate(([0],np.cumsum(head_lengths+1+count_lengths)))
+
+    out = np.zeros(positions[-1],dtype=np.uint8)
+    _PutVarints(out,positions[:-1],heads,head_lengths)
+    out[positions[:-1]+head_lengths] = steps[starts]
+    _PutVarints(out,(positions[:-1]+head_lengths+1)[repeated],counts[repeated]-2,count_lengths[repeated])
+    return out
+
+def EncodePoints(points):
+    '''Brief: encodes the packed points returned by CompressOrbitData'''
+    points = np.asarray(points,dtype=">u4").astype(np.int64)
+    return EncodeSteps(points >> 8,points >> 4 & 0xF,points & 0xF)
+
+def DecodeSteps(data):
+    '''Brief: reference decoder of the encoded step stream, written as a plain loop to
+    document the format for the microcontroller implementation
+    Parameters:
+        -data: encoded stream (bytes or uint8 array)
+    Returns:
+        -times, az_steps, elev_steps: arrays like the ones given to EncodeSteps
+    '''
+    data = bytes(data)
+    times, az_steps, elev_steps = [], [], []
+    i, t = 0, 0
+
+    def ReadVarint():
+        nonlocal i
+        value, shift = 0, 0
+        while True:
+            byte = data[i]
+            i += 1
+            value |= (byte & 0x7F) << shift
+            shift += 7
+            if byte < 0x80:
+                return value
+
+    while i < len(data):
+        head = ReadVarint()
+        steps = data[i]
+        i += 1
+        count = ReadVarint()+2 if head & 1 else 1
+        for _ in range(count):
+            t += head >> 1
+            times.append(t)
+            az_steps.append(steps >> 4)
+            elev_steps.append(steps & 0xF)
+    return np.array(times,dtype=np.int64), np.array(az_steps,dtype=np.int64), np.array(elev_steps,dtype=np.int64)
+
+def CompressionReport(points):
+    '''Brief: compares the encoded stream against the 32 bit points of CompressOrbitData,
+    checking that the stream decodes back to the same points
+    Parameters:
+        -points: packed points returned by CompressOrbitData
+    Returns:
+        -dictionary with the following keys:
+            -points: amount of points
+            -packed_bytes, encoded_bytes: size of each format
+            -ratio: packed_bytes/encoded_bytes
+            -bytes_saved: packed_bytes-encoded_bytes
+            -bytes_per_point: encoded bytes per point
+            -packed_seconds, encoded_seconds: upload time of the points at BAUDRATE
+            -round_trip: True if decoding gives back the same points
+    '''
+    points = np.asarray(points,dtype=">u4")
+    encoded = EncodePoints(points)
+    times, az_steps, elev_steps = DecodeSteps(encoded)
+    decoded = (times << 8 | az_steps << 4 | elev_steps).astype(">u4")
+    packed_bytes, encoded_bytes = 4*len(points), len(encoded)
+    return {"points": len(points),
+            "packed_bytes": packed_bytes,
+            "encoded_bytes": encoded_bytes,
+            "ratio": packed_bytes/encoded_bytes if encoded_bytes else 1.0,
+            "bytes_saved": packed_bytes-encoded_bytes,
+            "bytes_per_point": encoded_bytes/len(points) if len(points) else 0.0,
+            "packed_seconds": packed_bytes*UART_BITS_PER_BYTE/BAUDRATE,
+            "encoded_seconds": encoded_bytes*UART_BITS_PER_BYTE/BAUDRATE,
+            "round_trip": np.array_equal(decoded,points)}
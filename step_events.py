@@ -0,0 +1,181 @@
+from skyfield.api import wgs84
+import numpy as np
+import pass_data as pdt
+import math
+import orbit_prediction as op
+import metrics as mt
+import LabosaTrack as lst
+from ephemeris import HermiteEval
+
+NODE_STEP = 10          #initial spacing between SGP4 nodes in seconds
+MIN_NODE_STEP = 0.05    #nodes are never refined below this spacing in seconds
+CHUNK_MS = 10000        #milliseconds quantized at once, bounds memory usage
+
+
+def AngleNodes(sat,my_lat,my_lon,t0,offsets):
+    '''Brief: Gets satellite azimuth, elevation and their rates with a single SGP4 call
+    Parameters:
+        -sat: satellite object
+        -my_lat: observer's latitude
+        -my_lon: observer's longitude
+        -t0: skyfield.timelib.Time object of the first point
+        -offsets: array of offsets from t0 in seconds
+    Returns:
+        -az: azimuth in degrees (0,360)
+        -elev: elevation in degrees
+        -az_rate: azimuth rate in degrees per second
+        -elev_rate: elevation rate in degrees per second
+    '''
+    bluffton = wgs84.latlon(my_lat,my_lon)
+    t = op.GetTimeArray(t0,offsets)
+    elev, az, _, elev_rate, az_rate, _ = (sat-bluffton).at(t).frame_latlon_and_rates(bluffton)
+    return az.degrees, elev.degrees, az_rate.degrees.per_second, elev_rate.degrees.per_second
+
+def AdaptiveNodes(sat,my_lat,my_lon,t0,period_seconds,tolerance,node_step=NODE_STEP):
+    '''Brief: Places SGP4 nodes over a pass so that Hermite interpolation of azimuth and
+    elevation stays within tolerance. Starting from node_step spacing, the midpoint of
+    every interval is propagated and intervals whose interpolation error is larger
+    than tolerance are split, until no interval needs refining
+    Parameters:
+        -sat: satellite object
+        -my_lat: observer's latitude
+        -my_lon: observer's longitude
+        -t0: skyfield.timelib.Time object of the pass start
+        -period_seconds: pass duration in seconds
+        -tolerance: maximum interpolation error in degrees
+        -node_step: initial spacing between nodes in seconds
+    Returns:
+        -offsets, az (unwrapped), elev, az_rate, elev_rate: node arrays
+        -evaluations: amount of SGP4 evaluations used
+    '''
+    offsets = np.append(np.arange(0,period_seconds,node_step),period_seconds)
+    az, elev, az_rate, elev_rate = AngleNodes(sat,my_lat,my_lon,t0,offsets)
+    az = np.degrees(np.unwrap(np.radians(az)))
+    evaluations = len(offsets)
+    pending = np.diff(offsets) > MIN_NODE_STEP
+
+    while pending.any():
+        mids = (offsets[:-1][pending]+offsets[1:][pending])/2
+        mid_az, mid_elev, mid_az_rate, mid_elev_rate = AngleNodes(sat,my_lat,my_lon,t0,mids)
+        evaluations += len(mids)
+        predicted_az = HermiteEval(offsets,az,az_rate,mids)
+        mid_az = predicted_az+(mid_az-predicted_az+180)%360-180     #unwrap next to the prediction
+        error = np.maximum(abs(mid_az-predicted_az),abs(mid_elev-HermiteEval(offsets,elev,elev_rate,mids)))
+        bad = (error > tolerance) & ((mids-offsets[:-1][pending]) > MIN_NODE_STEP)
+
+        #merge midpoints with the nodes, intervals next to a bad midpoint are checked again
+        offsets = np.concatenate((offsets,mids))
+        order = np.argsort(offsets,kind="stable")
+        offsets = offsets[order]
+        az = np.concatenate((az,mid_az))[order]
+        elev = np.concatenate((elev,mid_elev))[order]
+        az_rate = np.concatenate((az_rate,mid_az_rate))[order]
+        elev_rate = np.concatenate((elev_rate,mid_elev_rate))[order]
+        node_bad = np.concatenate((np.zeros(len(offsets)-len(mids),bool),bad))[order]
+        pending = node_bad[:-1] | node_bad[1:]
+
+    return offsets, az, elev, az_rate, elev_rate, evaluations
+
+def StepEvents(sat,my_lat,my_lon,t0,period_seconds,az_resolution,elev_resolution,tolerance=None,merge_window_ms=lst.MERGE_WINDOW_MS):
+    '''Brief: Calculates the time of each step directly, instead of sampling the orbit every
+    time_delta seconds. Azimuth and elevation are interpolated between adaptive SGP4 nodes
+    and the times where the acumulated angles cross a multiple of the resolution are
+    found with the protocol time resolution (1 millisecond). The step events are then
+    combined in points of up to 15 steps per axis spanning at most merge_window_ms
+    (LabosaTrack.ScheduleSteps), each point timed at its last crossing, so the pointing is
+    exact at every point with less points than sampling the orbit finely and merging the same way
+    Parameters:
+        -sat: satellite object
+        -my_lat: observer's latitude
+        -my_lon: observer's longitude
+        -t0: skyfield.timelib.Time object of the pass start
+        -period_seconds: pass duration in seconds
+        -az_resolution: azimutal angle [°] per step
+        -elev_resolution: elevation angle [°] per step
+        -tolerance: maximum interpolation error in degrees, defaults to a tenth of the finest resolution
+        -merge_window_ms: maximum time span of the events combined in a point, 0 gives one
+        point per millisecond with steps
+    Returns:
+        -steps, start_data: same as LabosaTrack.ScheduleSteps, without the Index column (there
+        are no orbit points). The amount of SGP4 evaluations used is stored in steps.sgp4_evaluations
+    '''
+    with mt.Stage("StepEvents") as record:
+        if tolerance is None:
+            tolerance = min(az_resolution,elev_resolution)/10
+        offsets, az, elev, az_rate, elev_rate, evaluations = AdaptiveNodes(sat,my_lat,my_lon,t0,period_seconds,tolerance)
+        record["sgp4_evaluations"] = evaluations
+
+        #millisecond grid, relative to the pass start second like Orbit2steps
+        start_unix = t0.utc_datetime().timestamp()
+        orbit_start = math.trunc(start_unix)
+        first_ms = math.ceil((start_unix-orbit_start)*1000)
+        last_ms = math.floor((start_unix+period_seconds-orbit_start)*1000)
+
+        #get azimuth and elevation start angle, from (0,360) to (-180,180) for azimuth
+        azimuth_start = (az[0]+180)%360-180
+        start_az_steps = int(azimuth_start / az_resolution)
+        start_elev_steps = int(elev[0] / elev_resolution)
+        az_dir = int(np.sign(az_rate[0]))
+
+        prev_az, prev_elev = az[0], elev[0]
+        az_angle, elev_angle = 0.0, 0.0     #acumulated angles
+        az_done, elev_done = 0, 0           #steps made before the current chunk
+        elev_dir_change = None
+        times, az_steps, elev_steps = [], [], []
+        for chunk_start in range(first_ms,last_ms+1,CHUNK_MS):
+            ms = np.arange(chunk_start,min(chunk_start+CHUNK_MS,last_ms+1))
+            chunk_offsets = ms/1000-(start_unix-orbit_start)
+            chunk_az = HermiteEval(offsets,az,az_rate,chunk_offsets)
+            chunk_elev = HermiteEval(offsets,elev,elev_rate,chunk_offsets)
+            dAz = np.diff(chunk_az,prepend=prev_az)
+            dElev = np.diff(chunk_elev,prepend=prev_elev)
+            prev_az, prev_elev = chunk_az[-1], chunk_elev[-1]
+
+            #quantize the acumulated angles, carrying the state between chunks
+            az_total = np.floor((az_angle+np.cumsum(np.abs(dAz)))/az_resolution).astype(int)
+            elev_total = np.floor((elev_angle+np.cumsum(np.abs(dElev)))/elev_resolution).astype(int)
+            az_angle += np.abs(dAz).sum()
+            elev_angle += np.abs(dElev).sum()
+            chunk_az_steps = np.diff(az_total,prepend=az_done)
+            chunk_elev_steps = np.diff(elev_total,prepend=elev_done)
+            az_done, elev_done = az_total[-1], elev_total[-1]
+
+            descending = dElev < 0
+            if elev_dir_change is None and descending.any():
+                elev_dir_change = int(ms[np.argmax(descending)])
+
+            has_steps = (chunk_az_steps != 0) | (chunk_elev_steps != 0)
+            times.append(ms[has_steps])
+            az_steps.append(chunk_az_steps[has_steps])
+            elev_steps.append(chunk_elev_steps[has_steps])
+
+        if elev_dir_change is None:
+            elev_dir_change = last_ms
+        events = pdt.PassData("steps", {'Time': np.concatenate(times),
+                                        'Elev Steps': np.concatenate(elev_steps),
+                                        'Az Steps': np.concatenate(az_steps)},
+                              orbit_start, sat.name, my_lat, my_lon, evaluations)
+        start_data = (orbit_start, len(events), az_dir, start_az_steps, start_elev_steps, elev_dir_change)
+
+        #combine the events in points
+        steps, start_data, _ = lst.ScheduleSteps(events,start_data,merge_window_ms=merge_window_ms)
+        record["step_events"] = len(events)
+        record["step_points"] = len(steps)
+
+    return steps, start_data
+
+def NextPassStepEvents(sat,my_lat,my_lon,az_resolution,elev_resolution,in_hours=48,min_elevation=30):
+    '''Brief: finds the next pass above min_elevation and calculates its step events
+    Parameters:
+        -sat: satellite object
+        -my_lat: observer's latitude
+        -my_lon: observer's longitude
+        -az_resolution: azimutal angle [°] per step
+        -elev_resolution: elevation angle [°] per step
+        -in_hours: amount of hours to look for a valid orbit
+        -min_elevation: minimun orbit elevation in degrees
+    Returns:
+        -steps, start_data: same as StepEvents
+    '''
+    t_rise, period_seconds = op.NextPassBounds(sat,my_lat,my_lon,in_hours,min_elevation)
+    return StepEvents(sat,my_lat,my_lon,t_rise,period_seconds,az_resolution,elev_resolution)
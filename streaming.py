@@ -0,0 +1,208 @@
+import numpy as np
+import math
+import orbit_prediction as op
+import ephemeris as eph
+import pass_data as pdt
+import LabosaTrack as lst
+import serial_transfer as st
+import metrics as mt
+
+CHUNK_POINTS = 10000    #orbit points propagated and quantized at once, bounds memory usage
+
+
+def PropagateChunks(sat,my_lat,my_lon,t0,period_seconds,time_delta,chunk_points=CHUNK_POINTS,backend="vectorized"):
+    '''Brief: generator version of PredictOrbit, yields the pass in chunks of chunk_points
+    Parameters:
+        -sat: satellite object
+        -my_lat: observer's latitude
+        -my_lon: observer's longitude
+        -t0: skyfield.timelib.Time object of the pass start
+        -period_seconds: pass duration in seconds
+        -time_delta: time interval between each calculated point in seconds
+        -chunk_points: amount of points of each chunk
+        -backend: "vectorized" or "ephemeris", see PredictOrbit
+    Yields:
+        -pass_data.PassData of kind "orbit" with the Time, Elevation and Azimuth columns
+        of each chunk, Time relative to the same start second as PredictOrbit
+    '''
+    points_amount = int(period_seconds/time_delta)
+    start_unix = t0.utc_datetime().timestamp()
+    start = math.trunc(start_unix)
+    if backend == "ephemeris":
+        ephemeris = eph.BuildEphemeris(sat,t0,period_seconds)
+    for first in range(0,points_amount,chunk_points):
+        offsets = np.arange(first,min(first+chunk_points,points_amount))*time_delta
+        if backend == "ephemeris":
+            data = eph.EphemerisPass(ephemeris,my_lat,my_lon,offsets)
+        else:
+            data = op.PropagatePass(sat,my_lat,my_lon,t0,offsets)
+        times = np.round((start_unix-start+offsets)*1000).astype(np.int64)
+        yield pdt.PassData("orbit",{"Time": times,"Elevation": data["Elevation"],"Azimuth": data["Azimuth"]},
+                           start,sat.name,my_lat,my_lon)
+
+def QuantizeChunks(orbit_chunks,az_resolution,elev_resolution,start_data):
+    '''Brief: generator version of Orbit2steps. The acumulated angles, the last point of
+    the previous chunk and the elevation direction change detection are carried between
+    chunks, so the result is the same as running Orbit2steps on the whole pass
+    Parameters:
+        -orbit_chunks: iterable of chunks yielded by PropagateChunks
+        -az_resolution: azimutal angle [°] per step
+        -elev_resolution: elevation angle [°] per step
+        -start_data: empty dictionary, filled with the start values of Orbit2steps
+        (orbit_start, points_amount, az_dir, start_az_steps, start_elev_steps,
+        elev_dir_change) once the generator is exhausted. elev_dir_change is set as
+        soon as the chunk where elevation starts descending is yielded
+    Yields:
+        -(times, az_steps, elev_steps) arrays of the points with steps of each chunk
+    '''
+    state = None
+    for chunk in orbit_chunks:
+        azimuth, elevation = chunk["Azimuth"], chunk["Elevation"]
+        if state is None:
+            #first point of the pass: start values, like Orbit2steps
+            orbit_start = chunk.start+int(chunk["Time"][0])//1000
+            azimuth_start = azimuth[0]
+            if azimuth_start > 180:
+                azimuth_start -= 360
+            state = {"orbit_start": orbit_start, "prev_az": azimuth[0], "prev_elev": elevation[0],
+                     "az_angle": 0.0, "elev_angle": 0.0, "az_done": 0, "elev_done": 0,
+                     "az_dir": None, "elev_dir_change": None, "orbit_points": 0, "points": 0, "last_time": 0}
+            start_data.update(orbit_start=orbit_start,
+                              start_az_steps=int(azimuth_start/az_resolution),
+                              start_elev_steps=int(elevation[0]/elev_resolution))
+        times_ms = chunk["Time"]+(chunk.start-state["orbit_start"])*1000
+
+        dAz = np.diff(azimuth,prepend=state["prev_az"])
+        dElev = np.diff(elevation,prepend=state["prev_elev"])
+        state["prev_az"], state["prev_elev"] = azimuth[-1], elevation[-1]
+        dAz[dAz > 300] -= 360
+        dAz[dAz < -300] += 360
+        #azimuth direction is given by the second point of the pass
+        second = 1-state["orbit_points"]
+        if state["az_dir"] is None and second < len(dAz):
+            state["az_dir"] = int(np.sign(dAz[second]))
+        state["orbit_points"] += len(dAz)
+
+        #acumulated angles, summed in the same order as a single cumsum over the whole pass
+        az_cum = np.cumsum(np.concatenate(([state["az_angle"]],np.abs(dAz))))[1:]
+        elev_cum = np.cumsum(np.concatenate(([state["elev_angle"]],np.abs(dElev))))[1:]
+        state["az_angle"], state["elev_angle"] = az_cum[-1], elev_cum[-1]
+        az_total = np.floor(az_cum/az_resolution).astype(int)
+        elev_total = np.floor(elev_cum/elev_resolution).astype(int)
+        az_steps = np.diff(az_total,prepend=state["az_done"])
+        elev_steps = np.diff(elev_total,prepend=state["elev_done"])
+        state["az_done"], state["elev_done"] = az_total[-1], elev_total[-1]
+
+        descending = dElev < 0
+        if state["elev_dir_change"] is None and descending.any():
+            state["elev_dir_change"] = int(times_ms[np.argmax(descending)])
+            start_data["elev_dir_change"] = state["elev_dir_change"]   #known from here on, ScheduleChunks uses it
+        state["last_time"] = int(times_ms[-1])
+
+        has_steps = (az_steps != 0) | (elev_steps != 0)
+        state["points"] += int(has_steps.sum())
+        yield times_ms[has_steps], az_steps[has_steps], elev_steps[has_steps]
+
+    if state is None:
+        return
+    start_data.update(points_amount=state["points"], az_dir=state["az_dir"] or 0)
+    start_data.setdefault("elev_dir_change",state["last_time"])
+
+def ScheduleChunks(step_chunks,start_data,max_steps=15,merge_window_ms=lst.MERGE_WINDOW_MS):
+    '''Brief: generator version of ScheduleSteps, so every point of the chunks can be packed.
+    The time of the last point and the elevation direction change are carried between chunks,
+    and the points of the last group of each chunk are merged again with the next chunk, so
+    the result is the same as running ScheduleSteps on the whole pass
+    Parameters:
+        -step_chunks: iterable of chunks yielded by QuantizeChunks
+        -start_data: dictionary filled by QuantizeChunks, its points_amount and
+        elev_dir_change are updated for the scheduled points once the generator is exhausted
+        -max_steps: maximum steps per point and axis (4 bit fields: 15)
+        -merge_window_ms: maximum time span of merged points in milliseconds, 0 doesn't merge
+    Yields:
+        -(times, az_steps, elev_steps) arrays of each chunk, every point within max_steps
+    '''
+    previous_time, points, elev_dir_change = 0, 0, None
+    carry = [np.zeros(0,dtype=np.int64)]*3     #points of the last group, not merged yet
+    for times, az_steps, elev_steps in step_chunks:
+        if elev_dir_change is None:
+            elev_dir_change = start_data.get("elev_dir_change")
+        times, az_steps, elev_steps, _, elev_dir_change, _ = lst.SplitSteps(
+            times,az_steps.astype(np.int64),elev_steps.astype(np.int64),elev_dir_change,max_steps,previous_time)
+        if len(times):
+            previous_time = int(times[-1])
+        times, az_steps, elev_steps = (np.concatenate((carried,new)) for carried,new in zip(carry,(times,az_steps,elev_steps)))
+        keep, merged_az, merged_elev, last_group = lst.MergeSteps(times,az_steps,elev_steps,elev_dir_change,max_steps,merge_window_ms)
+        #the last group can still grow with the next chunk, and the elevation direction
+        #change may still be unknown (its default is the last point)
+        carry = [times[last_group:], az_steps[last_group:], elev_steps[last_group:]]
+        keep[last_group:] = False
+        points += int(keep.sum())
+        yield times[keep], merged_az[keep], merged_elev[keep]
+    if elev_dir_change is None:
+        elev_dir_change = start_data.get("elev_dir_change")
+    keep, merged_az, merged_elev, _ = lst.MergeSteps(*carry,elev_dir_change,max_steps,merge_window_ms)
+    points += int(keep.sum())
+    yield carry[0][keep], merged_az[keep], merged_elev[keep]
+    start_data["points_amount"] = points
+    if elev_dir_change is not None:
+        start_data["elev_dir_change"] = elev_dir_change
+
+def PackChunks(step_chunks):
+    '''Brief: generator version of CompressOrbitData
+    Parameters:
+        -step_chunks: iterable of chunks yielded by ScheduleChunks
+    Yields:
+        -packed points of each chunk, see LabosaTrack.PackPoints
+    '''
+    for times, az_steps, elev_steps in step_chunks:
+        yield lst.PackPoints(times,az_steps,elev_steps)
+
+def StartDataTuple(start_data):
+    '''Brief: converts the start_data dictionary filled by QuantizeChunks to the tuple used by SerialSend'''
+    return (start_data["orbit_start"], start_data["points_amount"], start_data["az_dir"],
+            start_data["start_az_steps"], start_data["start_elev_steps"], start_data["elev_dir_change"])
+
+def StreamPass(sat,my_lat,my_lon,t0,period_seconds,time_delta,az_resolution,elev_resolution,chunk_points=CHUNK_POINTS,backend="vectorized"):
+    '''Brief: runs propagation, step quantization, scheduling and packing chunk by chunk. Only one
+    chunk of orbit points is in memory at a time, the output is the packed upload buffer
+    (4 bytes per point with steps)
+    Parameters:
+        -sat: satellite object
+        -my_lat: observer's latitude
+        -my_lon: observer's longitude
+        -t0: skyfield.timelib.Time object of the pass start
+        -period_seconds: pass duration in seconds
+        -time_delta: time interval between each calculated point in seconds
+        -az_resolution: azimutal angle [°] per step
+        -elev_resolution: elevation angle [°] per step
+        -chunk_points: amount of orbit points processed at once
+        -backend: "vectorized" or "ephemeris", see PredictOrbit
+    Returns:
+        -points: packed points, like CompressOrbitData
+        -start_data: tuple of start values, like Orbit2steps after ScheduleSteps
+    '''
+    with mt.Stage("StreamPass",chunk_points=chunk_points) as record:
+        start_data = {}
+        orbit_chunks = PropagateChunks(sat,my_lat,my_lon,t0,period_seconds,time_delta,chunk_points,backend)
+        step_chunks = QuantizeChunks(orbit_chunks,az_resolution,elev_resolution,start_data)
+        packed = list(PackChunks(ScheduleChunks(step_chunks,start_data)))
+        points = np.concatenate(packed) if packed else np.zeros(0,dtype=">u4")
+        record["points"] = int(period_seconds/time_delta)
+        record["step_points"] = len(points)
+    return points, StartDataTuple(start_data)
+
+def StreamUpload(serial_device,sat,my_lat,my_lon,t0,period_seconds,time_delta,az_resolution,elev_resolution,chunk_points=CHUNK_POINTS,backend="vectorized"):
+    '''Brief: streams a pass from propagation to the microcontroller.
+    The protocol sends the amount of points and the elevation direction change before
+    the points, so the upload starts once the last chunk is quantized; until then only
+    the packed buffer is kept in memory
+    Parameters:
+        -serial_device: serial object
+        -remaining parameters: see StreamPass
+    Returns:
+        -stats: transfer statistics returned by serial_transfer.SendPass
+    '''
+    points, start_data = StreamPass(sat,my_lat,my_lon,t0,period_seconds,time_delta,
+                                    az_resolution,elev_resolution,chunk_points,backend)
+    return st.SendPass(serial_device,points,start_data)
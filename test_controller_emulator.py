@@ -0,0 +1,44 @@
+'''End to end tests of an upload of the fixture ISS pass to the emulated controller
+(controller_emulator.EmulatedUpload). Run with: python -m pytest test_controller_emulator.py'''
+import os
+import pytest
+from skyfield.api import load
+import orbit_prediction as op
+import LabosaTrack as lst
+import serial_transfer as st
+import controller_emulator as ce
+
+FIXTURE_CATALOG = os.path.join(os.path.dirname(os.path.abspath(__file__)),"benchmarks","fixtures","catalog.txt")
+REFERENCE_TIME = (2014,1,22,0,0,0)  #UTC, the fixture TLE epochs are 2014-01-20
+MY_LAT, MY_LON = -34.54, -58.5
+RESOLUTION = 0.05
+
+
+@pytest.fixture(scope="module")
+def fixture_pass():
+    '''Brief: orbit, points and start values of the fixture ISS pass, as TrackPass computes them'''
+    ts = load.timescale()
+    sat = {sat.name: sat for sat in load.tle_file(FIXTURE_CATALOG)}["ISS (ZARYA)"]
+    t_rise, period = op.NextPassBounds(sat,MY_LAT,MY_LON,24,10,ts.utc(*REFERENCE_TIME))
+    orbit = op.PredictOrbit(sat,MY_LAT,MY_LON,t_rise,period,1)
+    steps, start_data = lst.Orbit2steps(orbit,RESOLUTION,RESOLUTION)
+    steps, start_data, _ = lst.ScheduleSteps(steps,start_data)
+    return orbit, lst.CompressOrbitData(steps), start_data
+
+@pytest.mark.parametrize("use_pty", [False, pytest.param(True,marks=pytest.mark.skipif(os.name != "posix",reason="POSIX only"))])
+def test_upload(fixture_pass, use_pty):
+    orbit, points, start_data = fixture_pass
+    report = ce.EmulatedUpload(points,start_data,orbit,RESOLUTION,RESOLUTION,use_pty=use_pty)
+    assert report["start_data_ok"]
+    assert report["eeprom_status"] == st.EEPROM_OK
+    assert report["points"] == len(points)
+    #the commanded angles follow the orbit within a couple of steps
+    assert report["az_max"] <= 2*RESOLUTION and report["elev_max"] <= 2*RESOLUTION
+
+def test_eeprom_full(fixture_pass):
+    orbit, points, start_data = fixture_pass
+    report = ce.EmulatedUpload(points,start_data,orbit,RESOLUTION,RESOLUTION,eeprom_points=len(points))
+    assert report["eeprom_status"] == st.EEPROM_OK
+    report = ce.EmulatedUpload(points,start_data,orbit,RESOLUTION,RESOLUTION,eeprom_points=len(points)-1)
+    assert report["eeprom_status"] == st.EEPROM_ERROR
+    assert report["start_data_ok"]
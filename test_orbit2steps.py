@@ -0,0 +1,122 @@
+'''Regression tests of LabosaTrack.Orbit2steps against a plain loop port of the
+original per-row implementation. Run with: python -m pytest test_orbit2steps.py'''
+import os, math
+import numpy as np
+import pytest
+from skyfield.api import load
+import orbit_prediction as op
+import pass_data as pdt
+import LabosaTrack as lst
+
+FIXTURE_CATALOG = os.path.join(os.path.dirname(os.path.abspath(__file__)),"benchmarks","fixtures","catalog.txt")
+REFERENCE_TIME = (2014,1,22,0,0,0)  #UTC, the fixture TLE epochs are 2014-01-20
+SAT_NAME = "ISS (ZARYA)"
+MY_LAT, MY_LON = -34.54, -58.5
+RESOLUTION = 0.05
+
+
+def LoopOrbit2steps(times, elevation, azimuth, az_resolution, elev_resolution):
+    '''Brief: original Orbit2steps loop, on arrays instead of a dataframe. The only
+    change is the azimuth wrap correction, the original undid it for positive deltas
+    Parameters:
+        -times: point times in UNIX seconds
+        -elevation, azimuth: point angles in degrees
+        -az_resolution, elev_resolution: angle [°] per step
+    Returns:
+        -index, times_ms, elev_steps, az_steps: arrays of the points with steps
+        -start_data: tuple of start values
+    '''
+    orbit_start = math.trunc(times[0])
+    times_ms = ((times-orbit_start)*1000).astype(int)
+
+    azimuth_start = azimuth[0]
+    if azimuth_start > 180:
+        azimuth_start -= 360
+    if azimuth_start < -180:
+        azimuth_start += 360
+    start_az_steps = int(azimuth_start / az_resolution)
+    start_elev_steps = int(elevation[0] / elev_resolution)
+
+    dElev = np.concatenate(([0.0],np.diff(elevation)))
+    dAz = np.concatenate(([0.0],np.diff(azimuth)))
+    az_dir = int(np.sign(dAz[1]))
+
+    rows = []
+    dir_setted = False
+    elev_dir_change = int(times_ms[-1])
+    az_angle, elev_angle = 0, 0
+    for ind in range(len(times)):
+        d_az = dAz[ind]
+        if abs(d_az) > 300:
+            d_az = d_az-360 if d_az > 0 else d_az+360
+
+        az = 0
+        az_angle += abs(d_az)
+        while az_angle >= az_resolution:
+            az_angle = az_angle-az_resolution
+            az += 1
+
+        elev = 0
+        elev_angle += abs(dElev[ind])
+        while elev_angle >= elev_resolution:
+            elev_angle = elev_angle-elev_resolution
+            elev += 1
+
+        if dElev[ind] < 0 and not dir_setted:
+            elev_dir_change = int(times_ms[ind])
+            dir_setted = True
+
+        if az != 0 or elev != 0:
+            rows.append((ind,times_ms[ind],elev,az))
+
+    index, times_ms, elev_steps, az_steps = (np.array(column,dtype=np.int64) for column in zip(*rows))
+    start_data = (orbit_start, len(rows), az_dir, start_az_steps, start_elev_steps, elev_dir_change)
+    return index, times_ms, elev_steps, az_steps, start_data
+
+def AssertSameSteps(orbit, az_resolution=RESOLUTION, elev_resolution=RESOLUTION):
+    '''Brief: runs both implementations on an orbit and compares them. Times may differ in
+    1 ms, the loop truncates float seconds while PassData times are exact milliseconds'''
+    steps, start_data = lst.Orbit2steps(orbit,az_resolution,elev_resolution)
+    index, times_ms, elev_steps, az_steps, loop_start_data = LoopOrbit2steps(
+        orbit.Times(),orbit["Elevation"],orbit["Azimuth"],az_resolution,elev_resolution)
+
+    np.testing.assert_array_equal(steps["Index"],index)
+    np.testing.assert_array_equal(steps["Elev Steps"],elev_steps)
+    np.testing.assert_array_equal(steps["Az Steps"],az_steps)
+    assert np.abs(steps["Time"]-times_ms).max() <= 1
+    assert start_data[:5] == loop_start_data[:5]
+    assert abs(start_data[5]-loop_start_data[5]) <= 1
+
+def SyntheticOrbit(azimuth, elevation, time_delta=1.0, start=1390350837.25):
+    '''Brief: builds an orbit PassData from angle arrays'''
+    offsets = np.arange(len(azimuth))*time_delta
+    times = np.round((start-math.trunc(start)+offsets)*1000).astype(np.int64)
+    return pdt.PassData("orbit",{"Time": times,"Elevation": elevation,"Azimuth": azimuth},math.trunc(start))
+
+
+@pytest.fixture(scope="module")
+def fixture_pass():
+    '''Brief: ISS pass of the fixture catalog (same as the benchmark)'''
+    ts = load.timescale()
+    sat = {sat.name: sat for sat in load.tle_file(FIXTURE_CATALOG)}[SAT_NAME]
+    t_rise, period = op.NextPassBounds(sat,MY_LAT,MY_LON,24,10,ts.utc(*REFERENCE_TIME))
+    return sat, t_rise, period
+
+@pytest.mark.parametrize("time_delta", [1, 0.1])
+def test_fixture_pass(fixture_pass, time_delta):
+    sat, t_rise, period = fixture_pass
+    orbit = op.PredictOrbit(sat,MY_LAT,MY_LON,t_rise,period,time_delta)
+    AssertSameSteps(orbit)
+
+@pytest.mark.parametrize("azimuth_rate", [0.37, -0.37])
+def test_azimuth_wrap(azimuth_rate):
+    #azimuth crosses north in both directions (359 -> 0 and 0 -> 359)
+    points = 200
+    azimuth = np.mod((20 if azimuth_rate > 0 else 340)-azimuth_rate*np.arange(points)+0.013,360)
+    elevation = 10+40*np.sin(np.linspace(0,np.pi,points))
+    orbit = SyntheticOrbit(azimuth,elevation)
+    AssertSameSteps(orbit,0.9/16,0.9/16)
+    steps, start_data = lst.Orbit2steps(orbit,0.9/16,0.9/16)
+    assert start_data[2] == -int(np.sign(azimuth_rate))
+    #no point makes a full turn because of the wrap
+    assert steps["Az Steps"].max() < 300/(0.9/16)
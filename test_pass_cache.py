@@ -0,0 +1,108 @@
+'''Tests of the pass_cache eviction, invalidation and per key compute lock.
+Run with: python -m pytest test_pass_cache.py'''
+import threading, time
+from collections import OrderedDict
+from types import SimpleNamespace
+import pytest
+import pass_cache as pc
+
+MY_LAT, MY_LON = -34.54, -58.5
+
+
+def FakeSat(satnum, epoch=2456677.5):
+    '''Brief: object with the satellite fields PassKey reads'''
+    return SimpleNamespace(model=SimpleNamespace(satnum=satnum,jdsatepoch=epoch,jdsatepochF=0.0))
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    '''Brief: every test starts with an empty cache of its own'''
+    monkeypatch.setattr(pc,"_entries",OrderedDict())
+    monkeypatch.setattr(pc,"_epochs",{})
+    monkeypatch.setattr(pc,"_computing",{})
+    monkeypatch.setattr(pc,"_info",{"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0, "bytes": 0})
+
+def test_lru_eviction(monkeypatch):
+    monkeypatch.setattr(pc,"MAX_ENTRIES",2)
+    keys = [pc.PassKey(FakeSat(satnum),MY_LAT,MY_LON,1) for satnum in (1,2,3)]
+    pc.Put(keys[0],"first")
+    pc.Put(keys[1],"second")
+    assert pc.Get(keys[0]) == "first"   #the second one is now the least recently used
+    pc.Put(keys[2],"third")
+    assert pc.Get(keys[1]) is None
+    assert pc.Get(keys[0]) == "first" and pc.Get(keys[2]) == "third"
+    assert pc.CacheInfo()["evictions"] == 1
+
+def test_bytes_eviction(monkeypatch):
+    monkeypatch.setattr(pc,"MAX_BYTES",100)
+    keys = [pc.PassKey(FakeSat(satnum),MY_LAT,MY_LON) for satnum in (1,2,3)]
+    pc.Put(keys[0],"first",60)
+    pc.Put(keys[1],"second",30)
+    pc.Put(keys[2],"third",30)
+    assert pc.Get(keys[0]) is None
+    assert pc.CacheInfo()["bytes"] == 60
+    pc.Put(keys[0],"too big",101)
+    assert pc.Get(keys[0]) is None and pc.CacheInfo()["entries"] == 2
+
+def test_newer_epoch_invalidates():
+    old = pc.PassKey(FakeSat(25544,2456677.5),MY_LAT,MY_LON,1)
+    other = pc.PassKey(FakeSat(11111,2456677.5),MY_LAT,MY_LON,1)
+    new = pc.PassKey(FakeSat(25544,2456678.5),MY_LAT,MY_LON,1)
+    pc.Put(old,"old TLE",10)
+    pc.Put(other,"other satellite",10)
+    assert pc.Get(new) is None
+    assert pc.Get(old) is None          #dropped when the newer epoch was seen
+    assert pc.Get(other) == "other satellite"
+    pc.Put(old,"old TLE again")         #results of an older TLE aren't cached anymore
+    pc.Put(new,"new TLE")
+    assert pc.Get(old) is None and pc.Get(new) == "new TLE"
+    assert pc.CacheInfo()["invalidations"] == 1 and pc.CacheInfo()["bytes"] == 10
+
+def test_expires_at_pass_start():
+    key = pc.PassKey(FakeSat(25544),MY_LAT,MY_LON,1)
+    calls = []
+    def Compute():
+        calls.append(1)
+        return {"start": time.time()+0.2}
+    first = pc.Cached(key,Compute,expires=lambda result: result["start"])
+    assert pc.Cached(key,Compute,expires=lambda result: result["start"]) is first
+    time.sleep(0.3)                     #the pass started, it is computed again
+    assert pc.Cached(key,Compute,expires=lambda result: result["start"]) is not first
+    assert len(calls) == 2
+    assert pc.CacheInfo()["invalidations"] == 1
+
+def test_same_key_computed_once():
+    key = pc.PassKey(FakeSat(25544),MY_LAT,MY_LON,1)
+    calls, results = [], []
+    def Compute():
+        calls.append(1)
+        time.sleep(0.1)
+        return object()
+    threads = [threading.Thread(target=lambda: results.append(pc.Cached(key,Compute))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert pc._computing == {}
+
+def test_different_keys_computed_together():
+    #both computations must be running at the same time to pass the barrier
+    barrier = threading.Barrier(2,timeout=5)
+    def Compute():
+        barrier.wait()
+        return object()
+    keys = [pc.PassKey(FakeSat(satnum),MY_LAT,MY_LON,1) for satnum in (1,2)]
+    errors = []
+    def Run(key):
+        try:
+            pc.Cached(key,Compute)
+        except threading.BrokenBarrierError as e:
+            errors.append(e)
+    threads = [threading.Thread(target=Run,args=(key,)) for key in keys]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert pc.CacheInfo()["entries"] == 2
@@ -0,0 +1,84 @@
+'''Tests of LabosaTrack.ScheduleSteps (split and merge of points) and of its streaming
+version. Run with: python -m pytest test_schedule_steps.py'''
+import os
+import numpy as np
+import pytest
+from skyfield.api import load
+import orbit_prediction as op
+import pass_data as pdt
+import LabosaTrack as lst
+import streaming as sm
+
+FIXTURE_CATALOG = os.path.join(os.path.dirname(os.path.abspath(__file__)),"benchmarks","fixtures","catalog.txt")
+REFERENCE_TIME = (2014,1,22,0,0,0)  #UTC, the fixture TLE epochs are 2014-01-20
+MY_LAT, MY_LON = -34.54, -58.5
+
+
+@pytest.fixture(scope="module")
+def fixture_pass():
+    ts = load.timescale()
+    sat = {sat.name: sat for sat in load.tle_file(FIXTURE_CATALOG)}["ISS (ZARYA)"]
+    t_rise, period = op.NextPassBounds(sat,MY_LAT,MY_LON,24,10,ts.utc(*REFERENCE_TIME))
+    return sat, t_rise, period
+
+def Steps(times, az_steps, elev_steps):
+    '''Brief: steps pass from lists'''
+    return pdt.PassData("steps",{"Time": np.array(times,dtype=np.int64),"Elev Steps": np.array(elev_steps,dtype=np.int64),
+                                 "Az Steps": np.array(az_steps,dtype=np.int64)},1390350836)
+
+@pytest.mark.parametrize("time_delta, resolution", [(1,0.05),(1,0.01),(0.1,0.05)])
+@pytest.mark.parametrize("merge_window_ms", [0,lst.MERGE_WINDOW_MS])
+def test_points_fit(fixture_pass, time_delta, resolution, merge_window_ms):
+    sat, t_rise, period = fixture_pass
+    orbit = op.PredictOrbit(sat,MY_LAT,MY_LON,t_rise,period,time_delta)
+    steps, start_data = lst.Orbit2steps(orbit,resolution,resolution)
+    scheduled, scheduled_start, report = lst.ScheduleSteps(steps,start_data,merge_window_ms=merge_window_ms)
+    assert scheduled["Az Steps"].max() <= 15 and scheduled["Elev Steps"].max() <= 15
+    assert scheduled["Az Steps"].sum() == steps["Az Steps"].sum()
+    assert scheduled["Elev Steps"].sum() == steps["Elev Steps"].sum()
+    assert np.diff(scheduled["Time"]).min() > 0 and scheduled["Time"][-1] == steps["Time"][-1]
+    assert scheduled_start[1] == len(scheduled) == report["points_after"]
+    assert scheduled_start[:5] == start_data[:1]+(len(scheduled),)+start_data[2:5]
+    #the elevation moves the same way on both sides of the direction change
+    for before in (True,False):
+        side = (steps["Time"] < start_data[5]) == before
+        scheduled_side = (scheduled["Time"] < scheduled_start[5]) == before
+        assert scheduled["Elev Steps"][scheduled_side].sum() == steps["Elev Steps"][side].sum()
+    lst.CompressOrbitData(scheduled)    #every point can be packed
+
+def test_merge_window():
+    steps = Steps([100,200,300,1200,1300,5000],[1,1,1,1,1,1],[0,0,0,0,0,0])
+    scheduled, start_data, report = lst.ScheduleSteps(steps,(1390350836,6,1,0,0,5000),merge_window_ms=1000)
+    np.testing.assert_array_equal(scheduled["Time"],[300,1300,5000])
+    np.testing.assert_array_equal(scheduled["Az Steps"],[3,2,1])
+    assert report["merged"] == 3 and start_data[1] == 3
+    #groups are limited to max_steps per axis as well
+    steps = Steps([100,200,300],[10,10,10],[0,0,0])
+    scheduled, _, _ = lst.ScheduleSteps(steps,(1390350836,3,1,0,0,300))
+    np.testing.assert_array_equal(scheduled["Az Steps"],[10,10,10])
+
+def test_elev_dir_change_moves():
+    #the first descending point (2000) is split in 3, the direction change moves to its first part
+    steps = Steps([1000,2000,3000],[1,40,1],[1,3,1])
+    scheduled, start_data, report = lst.ScheduleSteps(steps,(1390350836,3,1,0,0,2000),merge_window_ms=0)
+    np.testing.assert_array_equal(scheduled["Time"],[1000,1334,1667,2000,3000])
+    np.testing.assert_array_equal(scheduled["Az Steps"],[1,13,13,14,1])
+    np.testing.assert_array_equal(scheduled["Elev Steps"],[1,1,1,1,1])
+    assert start_data[5] == 1334 and report["split"] == 1
+    #merging joins the descending points but not the ascending one before them
+    scheduled, start_data, _ = lst.ScheduleSteps(steps,(1390350836,3,1,0,0,2000))
+    np.testing.assert_array_equal(scheduled["Time"],[1000,1334,1667,3000])
+    np.testing.assert_array_equal(scheduled["Az Steps"],[1,13,13,15])
+    assert start_data[5] == 1334
+    assert scheduled["Elev Steps"][scheduled["Time"] >= start_data[5]].sum() == 4
+
+@pytest.mark.parametrize("time_delta", [1,0.1])
+@pytest.mark.parametrize("chunk_points", [7,100,10000])
+def test_stream_same_as_batch(fixture_pass, time_delta, chunk_points):
+    sat, t_rise, period = fixture_pass
+    orbit = op.PredictOrbit(sat,MY_LAT,MY_LON,t_rise,period,time_delta)
+    steps, start_data = lst.Orbit2steps(orbit,0.05,0.05)
+    steps, start_data, _ = lst.ScheduleSteps(steps,start_data)
+    points, stream_start = sm.StreamPass(sat,MY_LAT,MY_LON,t_rise,period,time_delta,0.05,0.05,chunk_points=chunk_points)
+    np.testing.assert_array_equal(points,lst.CompressOrbitData(steps))
+    assert stream_start == start_data
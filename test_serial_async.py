@@ -0,0 +1,60 @@
+'''Tests of serial_async.SendPasses against emulated controllers behind pseudo terminals
+(POSIX only). Run with: python -m pytest test_serial_async.py'''
+import os
+import numpy as np
+import pytest
+import serial
+import serial_transfer as st
+import serial_async as sa
+import controller_emulator as ce
+import LabosaTrack as lst
+
+pytestmark = pytest.mark.skipif(os.name != "posix",reason="pseudo terminals are POSIX only")
+
+CURRENT_TIME = 1390350800
+ACK_TIMEOUT = 0.5
+
+
+def Pass(points_amount):
+    '''Brief: random packed points and start values of a pass with points_amount points'''
+    rng = np.random.default_rng(points_amount)
+    times = np.cumsum(rng.integers(1,1000,points_amount))
+    points = lst.PackPoints(times,rng.integers(0,16,points_amount),rng.integers(0,16,points_amount))
+    return points, (1390350837,points_amount,1,1234,56,int(times[points_amount//2]))
+
+@pytest.fixture(autouse=True)
+def fixed_time(monkeypatch):
+    monkeypatch.setattr(st,"WaitNextSecond",lambda: CURRENT_TIME)
+
+@pytest.fixture
+def devices():
+    '''Brief: opened serial devices, closed after the test'''
+    opened = []
+    def Open(port):
+        opened.append(serial.Serial(port,115200,timeout=0.05))
+        return opened[-1]
+    yield Open
+    for device in opened:
+        device.close()
+
+def test_send_passes(devices):
+    transfers, emulators = {}, {}
+    for name, points_amount in (("az-el 1",500),("az-el 2",2500),("az-el 3",4000)):
+        port, emulators[name] = ce.AttachPty(ce.ControllerEmulator(ack_delay=0.01))
+        transfers[name] = (devices(port),)+Pass(points_amount)
+    #a controller that never answers, its transfer fails without stopping the others
+    silent_fds = os.openpty()
+    transfers["silent"] = (devices(os.ttyname(silent_fds[1])),)+Pass(100)
+
+    results = sa.SendPasses(transfers,ack_timeout=ACK_TIMEOUT,verbose=False)
+    for fd in silent_fds:
+        os.close(fd)
+
+    assert isinstance(results["silent"],TimeoutError)
+    for name, emulator in emulators.items():
+        _, points, start_data = transfers[name]
+        assert results[name]["eeprom_status"] == st.EEPROM_OK
+        assert results[name]["label"] == name
+        received = emulator.received
+        assert received["start_data"] == start_data
+        np.testing.assert_array_equal(lst.PackPoints(received["Time"],received["Az Steps"],received["Elev Steps"]),points)
@@ -0,0 +1,97 @@
+'''Wire protocol tests of serial_transfer.SendPass against the original per point
+SerialSend loop. Run with: python -m pytest test_serial_transfer.py'''
+import numpy as np
+import pytest
+import serial_transfer as st
+import controller_emulator as ce
+import LabosaTrack as lst
+
+CURRENT_TIME = 1390350800   #time sent as current time by both implementations
+
+
+class RecordingSerial:
+    '''Serial stand-in that acknowledges every read and records what is written and
+    the amount of bytes written before every read'''
+    def __init__(self):
+        self.written = bytearray()
+        self.reads = []
+    def write(self,data):
+        self.written += bytes(data)
+        return len(data)
+    def read(self,size=1):
+        self.reads.append(len(self.written))
+        return st.ACK*size
+
+def BaselineSerialSend(serial_device,points,start_data):
+    '''Brief: original LabosaTrack.SerialSend, without the prints and with a fixed current time'''
+    def TxSerial(Txdata):
+        serial_device.write(int(Txdata).to_bytes(4,"big"))
+
+    def TxSerial_atoi(Txdata,dataSize):
+        Tx=str(Txdata).encode()
+        Tx+=bytes(dataSize-len(Tx))
+        serial_device.write(Tx)
+
+    n, cont = 0, 0
+    serial_device.write(b'\x01')
+    while True:
+        while serial_device.read(1) != b'\x01':
+            True
+        if n==0:
+            TxSerial(CURRENT_TIME)
+        elif n==1:
+            TxSerial(start_data[0])
+        elif n==2:
+            TxSerial(start_data[1])
+            TxSerial(start_data[4])
+            TxSerial(start_data[5])
+        elif n==3:
+            TxSerial_atoi(start_data[2],4)
+            TxSerial_atoi(start_data[3],7)
+        elif n==4:
+            for i in points:
+                cont+=1
+                if(cont!=0 and cont % 1000 == 0):
+                    while serial_device.read(1) != b'\x01':
+                        True
+                TxSerial(i)
+            break
+        n+=1
+    return serial_device.read(1)
+
+def Pass(points_amount):
+    '''Brief: random packed points and start values of a pass with points_amount points'''
+    rng = np.random.default_rng(points_amount)
+    times = np.cumsum(rng.integers(1,1000,points_amount))
+    points = lst.PackPoints(times,rng.integers(0,16,points_amount),rng.integers(0,16,points_amount))
+    start_data = (1390350837,points_amount,-1,-1234,56,int(times[points_amount//2]) if points_amount else 0)
+    return points, start_data
+
+
+@pytest.fixture(autouse=True)
+def fixed_time(monkeypatch):
+    monkeypatch.setattr(st,"WaitNextSecond",lambda: CURRENT_TIME)
+
+@pytest.mark.parametrize("points_amount", [0,999,1000,2001])
+def test_same_bytes_as_baseline(points_amount):
+    points, start_data = Pass(points_amount)
+    baseline, engine = RecordingSerial(), RecordingSerial()
+    BaselineSerialSend(baseline,[int(point) for point in points],start_data)
+    stats = st.SendPass(engine,points,start_data,verbose=False)
+
+    assert bytes(engine.written) == bytes(baseline.written)
+    assert engine.reads == baseline.reads
+    assert stats["bytes"] == len(baseline.written)
+    assert stats["eeprom_status"] == st.EEPROM_OK
+    assert len(stats["block_latency"]) == max(len(st.PointBlocks(points))-1,0)
+
+@pytest.mark.parametrize("points_amount", [0,999,1000,2001])
+def test_emulated_controller(points_amount):
+    points, start_data = Pass(points_amount)
+    device = ce.EmulatedSerial()
+    stats = st.SendPass(device,points,start_data,verbose=False)
+    received = device.emulator.received
+    assert stats["eeprom_status"] == st.EEPROM_OK
+    assert received["start_data"] == start_data
+    assert received["current_time"] == CURRENT_TIME
+    np.testing.assert_array_equal(lst.PackPoints(received["Time"],received["Az Steps"],received["Elev Steps"]),points)
@@ -0,0 +1,79 @@
+'''Round trip tests of the encoded step stream (step_encoding.py).
+Run with: python -m pytest test_step_encoding.py'''
+import numpy as np
+import pytest
+import step_encoding as se
+import LabosaTrack as lst
+
+
+def AssertRoundTrip(times, az_steps, elev_steps):
+    '''Brief: encodes the points, decodes them back and compares'''
+    encoded = se.EncodeSteps(times,az_steps,elev_steps)
+    assert encoded.dtype == np.uint8
+    decoded = se.DecodeSteps(encoded)
+    for original, back in zip((times,az_steps,elev_steps),decoded):
+        np.testing.assert_array_equal(back,np.asarray(original,dtype=np.int64))
+    return encoded
+
+def test_empty():
+    encoded = AssertRoundTrip([],[],[])
+    assert len(encoded) == 0
+    assert len(se.EncodePoints(np.zeros(0,dtype=">u4"))) == 0
+
+def test_single_point():
+    encoded = AssertRoundTrip([1000],[3],[5])
+    #varint(1000 << 1) takes 2 bytes, plus the steps byte
+    assert list(encoded) == [0xD0,0x0F,0x35]
+
+def test_single_point_at_start():
+    encoded = AssertRoundTrip([0],[1],[0])
+    assert list(encoded) == [0x00,0x10]
+
+def test_long_run():
+    points = 100000
+    times = np.arange(1,points+1)*100
+    encoded = AssertRoundTrip(times,np.full(points,2),np.ones(points,dtype=int))
+    #a single run: head, steps byte and the varint of the count (3 bytes for 99998)
+    assert len(encoded) == 2+1+3
+
+def test_runs_split_by_delta_and_steps():
+    times = [100,200,300,450,600,700,800]
+    az_steps = [1,1,1,1,1,0,0]
+    elev_steps = [0,0,0,0,0,2,2]
+    AssertRoundTrip(times,az_steps,elev_steps)
+
+@pytest.mark.parametrize("delta", [127,128,16383,16384,2**21,2**35])
+def test_multibyte_deltas(delta):
+    #deltas are shifted one bit for the run flag, so these cross the varint byte lengths
+    times = np.array([delta,2*delta,2*delta+1])
+    encoded = AssertRoundTrip(times,[1,1,1],[0,0,0])
+    head_bytes = se.VarintLengths([delta << 1 | 1])[0]
+    assert encoded[head_bytes-1] < 0x80 and all(byte >= 0x80 for byte in encoded[:head_bytes-1])
+
+def test_varint_lengths():
+    values = [0,127,128,16383,16384,2**21-1,2**21,2**63]
+    np.testing.assert_array_equal(se.VarintLengths(values),[1,1,2,2,3,3,4,10])
+
+def test_fifteen_steps():
+    AssertRoundTrip([10,20,30],[15,0,15],[15,15,0])
+
+def test_encode_points():
+    times = np.array([5,6,7,1000,2000,2000+2**20])
+    az_steps = np.array([15,15,15,0,4,1])
+    elev_steps = np.array([1,1,1,15,0,9])
+    points = lst.PackPoints(times,az_steps,elev_steps)
+    decoded = se.DecodeSteps(se.EncodePoints(points))
+    for original, back in zip((times,az_steps,elev_steps),decoded):
+        np.testing.assert_array_equal(back,original)
+    assert se.CompressionReport(points)["round_trip"]
+
+def test_rejects_decreasing_times():
+    with pytest.raises(ValueError):
+        se.EncodeSteps([100,200,150],[1,1,1],[0,0,0])
+    with pytest.raises(ValueError):
+        se.EncodeSteps([-1],[1],[0])
+
+@pytest.mark.parametrize("az_steps, elev_steps", [([16],[0]),([0],[16]),([-1],[0]),([0],[-1]),([1],[255])])
+def test_rejects_out_of_range_steps(az_steps, elev_steps):
+    with pytest.raises(ValueError):
+        se.EncodeSteps([100],az_steps,elev_steps)
@@ -0,0 +1,47 @@
+'''Tests of step_events.StepEvents on the fixture ISS pass.
+Run with: python -m pytest test_step_events.py'''
+import os
+import numpy as np
+import pytest
+from skyfield.api import load
+import orbit_prediction as op
+import LabosaTrack as lst
+import step_events as se
+
+FIXTURE_CATALOG = os.path.join(os.path.dirname(os.path.abspath(__file__)),"benchmarks","fixtures","catalog.txt")
+REFERENCE_TIME = (2014,1,22,0,0,0)  #UTC, the fixture TLE epochs are 2014-01-20
+MY_LAT, MY_LON = -34.54, -58.5
+RESOLUTION = 0.05
+
+
+@pytest.fixture(scope="module")
+def fixture_pass():
+    ts = load.timescale()
+    sat = {sat.name: sat for sat in load.tle_file(FIXTURE_CATALOG)}["ISS (ZARYA)"]
+    t_rise, period = op.NextPassBounds(sat,MY_LAT,MY_LON,24,10,ts.utc(*REFERENCE_TIME))
+    return sat, t_rise, period
+
+def test_points_fewer_than_sampling(fixture_pass):
+    sat, t_rise, period = fixture_pass
+    steps, start_data = se.StepEvents(sat,MY_LAT,MY_LON,t_rise,period,RESOLUTION,RESOLUTION)
+    orbit = op.PredictOrbit(sat,MY_LAT,MY_LON,t_rise,period,0.1)    #sampled with a similar pointing
+    sampled, sampled_start = lst.Orbit2steps(orbit,RESOLUTION,RESOLUTION)
+    sampled, sampled_start, _ = lst.ScheduleSteps(sampled,sampled_start)
+    assert len(steps) == start_data[1]
+    assert len(steps) < len(sampled)
+    assert steps["Az Steps"].max() <= 15 and steps["Elev Steps"].max() <= 15
+    assert np.diff(steps["Time"]).min() > 0
+    lst.CompressOrbitData(steps)    #every point can be packed
+
+def test_merge_keeps_events(fixture_pass):
+    sat, t_rise, period = fixture_pass
+    events, events_start = se.StepEvents(sat,MY_LAT,MY_LON,t_rise,period,RESOLUTION,RESOLUTION,merge_window_ms=0)
+    steps, start_data = se.StepEvents(sat,MY_LAT,MY_LON,t_rise,period,RESOLUTION,RESOLUTION)
+    assert len(steps) < len(events)
+    assert steps["Az Steps"].sum() == events["Az Steps"].sum()
+    assert steps["Elev Steps"].sum() == events["Elev Steps"].sum()
+    assert start_data[5] == events_start[5]
+    #every point is the last event of its group, no point spans more than the merge window
+    assert np.isin(steps["Time"],events["Time"]).all()
+    group_start = events["Time"][np.searchsorted(events["Time"],np.concatenate(([0],steps["Time"][:-1])),side="right")]
+    assert (steps["Time"]-group_start).max() <= lst.MERGE_WINDOW_MS
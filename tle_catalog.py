@@ -0,0 +1,173 @@
+from skyfield.api import load, Loader, EarthSatellite
+from sgp4.api import Satrec, WGS72
+import numpy as np
+import json, os, time, threading
+import metrics as mt
+
+TLE_URL = 'https://celestrak.com/NORAD/elements/active.txt'
+CATALOG_DIR = "tle_cache"   #directory where the catalog is stored
+TTL_HOURS = 12              #age in hours after which the catalog is downloaded again
+
+#fields needed to rebuild a satrec with sgp4init, without parsing TLE text
+SATREC_FIELDS = ["satnum","epoch","bstar","ndot","nddot","ecco","argpo","inclo","mo","no_kozai","nodeo"]
+SATREC_DTYPE = np.dtype([("satnum",np.int64)]+[(field,np.float64) for field in SATREC_FIELDS[1:]])
+
+#the catalog files are replaced at once (written to a temporary file first), so a reader
+#never sees them half written, and the lock keeps threads from writing them at the same
+#time or reading the index of one catalog with the satrecs of another
+_lock = threading.RLock()
+
+
+def _CatalogPaths(catalog_dir):
+    '''Brief: returns the paths of the files that form the catalog store'''
+    return (os.path.join(catalog_dir,"active.txt"),
+            os.path.join(catalog_dir,"satrecs.npy"),
+            os.path.join(catalog_dir,"index.json"))
+
+def SatrecRecord(satrec):
+    '''Brief: converts a satrec into a tuple of SATREC_DTYPE values'''
+    epoch = (satrec.jdsatepoch-2433281.5)+satrec.jdsatepochF    #days since 1949 December 31 00:00 UT
+    return (satrec.satnum,epoch,satrec.bstar,satrec.ndot,satrec.nddot,satrec.ecco,
+            satrec.argpo,satrec.inclo,satrec.mo,satrec.no_kozai,satrec.nodeo)
+
+def SatFromRecord(record,name,ts):
+    '''Brief: rebuilds a satellite object from a stored record
+    Parameters:
+        -record: SATREC_DTYPE element
+        -name: satellite name (string)
+        -ts: skyfield timescale
+    Returns:
+        -satellite object
+    '''
+    satrec = Satrec()
+    satrec.sgp4init(WGS72,'i',int(record["satnum"]),*[float(record[field]) for field in SATREC_FIELDS[1:]])
+    sat = EarthSatellite.from_satrec(satrec,ts)
+    sat.name = name
+    return sat
+
+def _Replace(path,write):
+    '''Brief: writes a file to a temporary name with write(file) and then replaces path with it'''
+    with open(path+".tmp","wb") as f:
+        write(f)
+    os.replace(path+".tmp",path)
+
+def StoreCatalog(satellites,catalog_dir=CATALOG_DIR,updated=None):
+    '''Brief: saves parsed satellites as a binary satrec table plus name and NORAD ID indexes
+    Parameters:
+        -satellites: list of satellite objects
+        -catalog_dir: catalog directory
+        -updated: UNIX time the TLEs were obtained, defaults to current time
+    Returns:
+        -catalog index (dictionary)
+    '''
+    os.makedirs(catalog_dir,exist_ok=True)
+    _, satrecs_path, index_path = _CatalogPaths(catalog_dir)
+    records = np.array([SatrecRecord(sat.model) for sat in satellites],dtype=SATREC_DTYPE)
+    index = {
+        "updated": time.time() if updated is None else updated,
+        "names": [sat.name for sat in satellites],
+        "by_name": {sat.name: row for row,sat in enumerate(satellites)},
+        "by_norad": {str(sat.model.satnum): row for row,sat in enumerate(satellites)},
+        }
+    with _lock:
+        _Replace(satrecs_path,lambda f: np.save(f,records))
+        _Replace(index_path,lambda f: f.write(json.dumps(index).encode()))
+    return index
+
+def SeedCatalog(tle_file,catalog_dir=CATALOG_DIR):
+    '''Brief: fills the catalog from a local TLE file, for stations without internet access
+    Parameters:
+        -tle_file: path of a TLE file (3 line format)
+        -catalog_dir: catalog directory
+    '''
+    satellites = load.tle_file(tle_file)
+    StoreCatalog(satellites,catalog_dir,updated=os.path.getmtime(tle_file))
+
+def _ReadIndex(catalog_dir):
+    '''Brief: loads the catalog index, None if there is no catalog stored'''
+    _, _, index_path = _CatalogPaths(catalog_dir)
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path) as f:
+        return json.load(f)
+
+def _Age(index):
+    '''Brief: returns the age in hours of a catalog index'''
+    return (time.time()-index["updated"])/3600
+
+def CatalogAge(catalog_dir=CATALOG_DIR):
+    '''Brief: returns the catalog age in hours, or None if there is no catalog stored'''
+    index = _ReadIndex(catalog_dir)
+    return None if index is None else _Age(index)
+
+def UpdateCatalog(url=TLE_URL,catalog_dir=CATALOG_DIR,ttl_hours=TTL_HOURS):
+    '''Brief: downloads the TLEs again if the stored catalog is older than ttl_hours.
+    If the download fails, a stale catalog is kept and used anyway. Only one thread
+    downloads at a time, the others wait for it and use its catalog
+    Parameters:
+        -url: TLE file url
+        -catalog_dir: catalog directory
+        -ttl_hours: maximum catalog age in hours
+    Returns:
+        -catalog index (dictionary)
+    '''
+    with _lock:
+        index = _ReadIndex(catalog_dir)
+        if index is not None and _Age(index) < ttl_hours:
+            return index
+        mt.Log("Downloading all active TLEs:")
+        tle_path, _, _ = _CatalogPaths(catalog_dir)
+        with mt.Stage("UpdateCatalog") as record:
+            try:
+                satellites = Loader(catalog_dir,verbose=not mt.IsQuiet()).tle_file(url,reload=True,filename=os.path.basename(tle_path))
+            except Exception as e:
+                if index is None:
+                    raise
+                mt.Log("WARNING: couldn't download TLEs (",e,"), using catalog from",round(_Age(index),1),"hours ago")
+                record["satellites"] = 0
+                return index
+            record["satellites"] = len(satellites)
+            return StoreCatalog(satellites,catalog_dir)
+
+def _OpenCatalog(url,catalog_dir,ttl_hours,mmap_mode=None):
+    '''Brief: refreshes the catalog if it is outdated and loads the satrec table and the
+    catalog indexes, the index file is read once'''
+    _, satrecs_path, _ = _CatalogPaths(catalog_dir)
+    with _lock:
+        index = UpdateCatalog(url,catalog_dir,ttl_hours)
+        return np.load(satrecs_path,mmap_mode=mmap_mode), index
+
+def LoadCatalog(catalog_dir=CATALOG_DIR,ttl_hours=TTL_HOURS,url=TLE_URL):
+    '''Brief: gets every satellite of the catalog, refreshing it when older than ttl_hours
+    Parameters:
+        -catalog_dir: catalog directory
+        -ttl_hours: maximum catalog age in hours
+        -url: TLE file url
+    Returns:
+        -dictionary with names and satellite objects
+    '''
+    records, index = _OpenCatalog(url,catalog_dir,ttl_hours)
+    ts = load.timescale()
+    return {name: SatFromRecord(record,name,ts) for name,record in zip(index["names"],records)}
+
+def SelectFromCatalog(key,catalog_dir=CATALOG_DIR,ttl_hours=TTL_HOURS,url=TLE_URL):
+    '''Brief: gets one satellite of the catalog by name or NORAD ID without loading the rest
+    Parameters:
+        -key: satellite name (string) or NORAD ID (int)
+        -catalog_dir: catalog directory
+        -ttl_hours: maximum catalog age in hours
+        -url: TLE file url
+    Returns:
+        -satellite object
+    '''
+    with _lock:    #the mapping is released before another thread can replace the file
+        records, index = _OpenCatalog(url,catalog_dir,ttl_hours,mmap_mode="r")
+        if isinstance(key,str) and key in index["by_name"]:
+            row = index["by_name"][key]
+        elif str(key) in index["by_norad"]:
+            row = index["by_norad"][str(key)]
+        else:
+            raise KeyError("satellite not found in catalog: "+str(key))
+        record = records[row].copy()
+        del records
+    return SatFromRecord(record,index["names"][row],load.timescale())